@@ -0,0 +1,209 @@
+"""
+Admission Control Module
+Keeps one heavy client from using up the shared Spotify/Reddit/OpenAI quotas:
+- Per-client token buckets (request rate and burst)
+- Bounded global admission queue: a fixed number of requests run at once,
+  the rest wait in a weighted fair queue between clients
+- Rejections carry a Retry-After estimate, so callers can fail fast (429)
+"""
+
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Deque, Dict, Optional, Tuple
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is not admitted, retry_after is in seconds"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        """Retry-After value (whole seconds, at least 1)"""
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class TokenBucket:
+    """`rate` tokens per second, holding at most `burst`"""
+
+    def __init__(
+        self, rate: float, burst: float, clock: Callable[[], float] = time.monotonic
+    ):
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._tokens = float(burst)
+        self._updated = clock()
+
+    def take(self) -> float:
+        """Take a token: 0.0 if one was available, else seconds until one is"""
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+
+class ClientRateLimiter:
+    """
+    One token bucket per client, the least recently seen clients are
+    forgotten beyond max_clients (they start again with a full bucket)
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float,
+        max_clients: int = 10000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._clock = clock
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def check(self, client: str, rate: Optional[float] = None) -> None:
+        """
+        Count one request of a client
+
+        Args:
+            client: Client identity (API key tenant or IP address)
+            rate: The client's own rate (requests/second), None = default
+
+        Raises:
+            AdmissionRejected: If the client is over its rate
+        """
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = TokenBucket(rate or self.rate, self.burst, self._clock)
+            self._buckets[client] = bucket
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        self._buckets.move_to_end(client)
+        wait = bucket.take()
+        if wait:
+            raise AdmissionRejected("rate limit exceeded", wait)
+
+
+class FairAdmissionQueue:
+    """
+    At most max_concurrency requests run at once. Others wait, at most
+    max_queued of them, and are admitted in weighted fair order: each
+    client's waiters get virtual finish tags spaced 1/weight apart, and
+    the smallest tag goes next. A client with weight 2 gets twice the
+    slots of a weight-1 client while both are waiting, and a burst from
+    one client can't starve the others.
+
+    Used from the event loop only, so no locking is needed.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_queued: int,
+        max_wait: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queued = max_queued
+        self.max_wait = max_wait
+        self._clock = clock
+        self.running = 0
+        self.queued = 0
+        self._virtual_time = 0.0
+        # Client -> finish tag of its last queued request
+        self._last_tag: Dict[str, float] = {}
+        # Client -> its waiters in arrival order: (tag, future)
+        self._waiters: Dict[str, Deque[Tuple[float, asyncio.Future]]] = {}
+        # Moving average of the time a request holds its slot
+        self.service_seconds = 5.0
+
+    def retry_after(self) -> float:
+        """Seconds until a slot is likely free for a new request"""
+        return self.service_seconds * (self.queued + 1) / self.max_concurrency
+
+    def _grant_next(self) -> None:
+        while self.running < self.max_concurrency and self.queued:
+            client = min(self._waiters, key=lambda c: self._waiters[c][0][0])
+            tag, future = self._waiters[client].popleft()
+            if not self._waiters[client]:
+                del self._waiters[client]
+                if self._last_tag.get(client) == tag:
+                    del self._last_tag[client]
+            self.queued -= 1
+            self._virtual_time = max(self._virtual_time, tag)
+            if not future.done():
+                self.running += 1
+                future.set_result(None)
+
+    def _enqueue(self, client: str, weight: float) -> asyncio.Future:
+        start = max(self._virtual_time, self._last_tag.get(client, 0.0))
+        tag = start + 1.0 / weight
+        self._last_tag[client] = tag
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(client, deque()).append((tag, future))
+        self.queued += 1
+        return future
+
+    def _forget(self, client: str, future: asyncio.Future) -> bool:
+        # Drop a waiter that gave up, False if it was already admitted
+        waiters = self._waiters.get(client)
+        for item in waiters or ():
+            if item[1] is future:
+                waiters.remove(item)
+                if not waiters:
+                    del self._waiters[client]
+                self.queued -= 1
+                return True
+        return False
+
+    @asynccontextmanager
+    async def admit(self, client: str, weight: float = 1.0) -> AsyncIterator[None]:
+        """
+        Hold a slot for the block, waiting in the fair queue if needed
+
+        Raises:
+            AdmissionRejected: Queue full, or no slot within max_wait seconds
+        """
+        if self.running < self.max_concurrency and not self.queued:
+            self.running += 1
+        else:
+            if self.queued >= self.max_queued:
+                raise AdmissionRejected("server busy", self.retry_after())
+            future = self._enqueue(client, weight)
+            try:
+                async with asyncio.timeout(self.max_wait):
+                    await asyncio.shield(future)
+            except BaseException as e:
+                if not self._forget(client, future):
+                    # Admitted right as we gave up: pass the slot on
+                    self.running -= 1
+                    self._grant_next()
+                if isinstance(e, TimeoutError):
+                    raise AdmissionRejected("server busy", self.retry_after())
+                raise
+
+        start = self._clock()
+        try:
+            yield
+        finally:
+            elapsed = self._clock() - start
+            self.service_seconds = 0.8 * self.service_seconds + 0.2 * elapsed
+            self.running -= 1
+            self._grant_next()
+
+    def status(self) -> Dict[str, float]:
+        return {
+            "running": self.running,
+            "queued": self.queued,
+            "service_seconds": round(self.service_seconds, 2),
+        }
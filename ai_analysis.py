@@ -6,11 +6,33 @@ Handles OpenAI operations:
 """
 
 import json
-from openai import OpenAI
-from typing import Dict, List, Any
+import re
+from typing import TYPE_CHECKING, Dict, List, Any, Iterator, Optional
+from entity_extraction import normalize_key
+from pipeline_settings import PipelineSettings
 
+if TYPE_CHECKING:
+    # The SDK takes ~1s to import, so it is only loaded when a client is built
+    from openai import OpenAI
 
-def initialize_openai(api_key: str) -> OpenAI:
+# Number of Reddit posts that fit in the prompt (more would overflow tokens)
+MAX_PROMPT_POSTS: int = 15
+
+# Number of candidate songs kept in the shortened retry prompt
+MAX_RETRY_CANDIDATES: int = 10
+
+# Answer tokens per requested song ({"song": ..., "artist": ...} with long
+# titles) and for the JSON wrapper, see response_max_tokens
+TOKENS_PER_SONG: int = 40
+RESPONSE_OVERHEAD_TOKENS: int = 50
+
+# JSON mode: the API only returns syntactically valid JSON objects
+RESPONSE_FORMAT: Dict[str, str] = {"type": "json_object"}
+
+_CODE_FENCE_RE = re.compile(r"```(?:json)?", re.IGNORECASE)
+
+
+def initialize_openai(api_key: str) -> "OpenAI":
     """
     Initialize OpenAI client
 
@@ -20,17 +42,57 @@ def initialize_openai(api_key: str) -> OpenAI:
     Returns:
         OpenAI client object
     """
+    from openai import OpenAI
+
     client = OpenAI(api_key=api_key)
     print("OpenAI API initialized")
     return client
 
 
+def format_reddit_excerpts(reddit_data: List[Dict[str, Any]]) -> str:
+    """Reddit summary made of post/comment text excerpts"""
+    reddit_summary = "\nReddit Community Recommendations:\n\n"
+    # Limit to avoid token overflow
+    for idx, post in enumerate(reddit_data[:MAX_PROMPT_POSTS], 1):
+        source = f" (r/{post['subreddit']})" if post.get("subreddit") else ""
+        reddit_summary += f"Post {idx}{source}: {post['title']}\n"
+        if post["body"]:
+            reddit_summary += f"Content: {post['body'][:300]}...\n"
+
+        # Add top comments
+        if post["comments"]:
+            reddit_summary += "Top Comments:\n"
+            for comment in post["comments"][:3]:
+                reddit_summary += f"  - {comment['body'][:200]}...\n"
+        reddit_summary += "\n"
+    return reddit_summary
+
+
+def format_candidate_table(
+    reddit_data: List[Dict[str, Any]], candidates: List[Dict[str, Any]]
+) -> str:
+    """Compact Reddit summary: post titles plus a scored candidate song table"""
+    reddit_summary = "\nReddit Thread Titles:\n"
+    for post in reddit_data[:MAX_PROMPT_POSTS]:
+        reddit_summary += f"- {post['title']}\n"
+
+    reddit_summary += (
+        "\nSongs Recommended in These Threads "
+        "(score = upvotes of the posts/comments mentioning them, "
+        "weighted by subreddit):\n"
+    )
+    for idx, candidate in enumerate(candidates, 1):
+        reddit_summary += f"{idx}. {candidate['song']} - {candidate['artist']} (score {candidate['score']:g}, {candidate['mentions']} mentions)\n"
+    return reddit_summary
+
+
 def format_data_for_chatgpt(
     playlist_data: Dict[str, Any],
     reddit_data: List[Dict[str, Any]],
     top_tracks: List[Dict[str, Any]],
     subreddit_name: str,
     num_recommendations: int,
+    candidates: Optional[List[Dict[str, Any]]] = None,
 ) -> str:
     """
     Step 4: Format Data for ChatGPT
@@ -39,8 +101,12 @@ def format_data_for_chatgpt(
         playlist_data: Dictionary with playlist information
         reddit_data: List of Reddit posts and comments
         top_tracks: List of top tracks
-        subreddit_name: Name of subreddit
+        subreddit_name: Name of the main subreddit (posts without a
+                        "subreddit" key come from it)
         num_recommendations: Number of recommendations to request
+        candidates: Scored song candidates extracted from the Reddit data, when
+                    given the prompt carries a compact candidate table (plus post
+                    titles) instead of post/comment excerpts
 
     Returns:
         str: Formatted prompt for ChatGPT
@@ -56,27 +122,24 @@ def format_data_for_chatgpt(
     for i, track in enumerate(top_tracks[:10], 1):
         playlist_summary += f"{i}. {track['name']} - {track['artist_names']}\n"
 
-    # Build Reddit recommendations summary
-    reddit_summary = "\nReddit Community Recommendations:\n\n"
-    for idx, post in enumerate(reddit_data[:15], 1):  # Limit to avoid token overflow
-        reddit_summary += f"Post {idx}: {post['title']}\n"
-        if post["body"]:
-            reddit_summary += f"Content: {post['body'][:300]}...\n"
+    # Posts can come from several subreddits (see subreddit_sources.py)
+    subreddits = dict.fromkeys(
+        post.get("subreddit", subreddit_name) for post in reddit_data
+    ) or {subreddit_name: None}
+    sources = ", ".join(f"r/{name}" for name in subreddits)
 
-        # Add top comments
-        if post["comments"]:
-            reddit_summary += "Top Comments:\n"
-            for comment in post["comments"][:3]:
-                reddit_summary += f"  - {comment['body'][:200]}...\n"
-        reddit_summary += "\n"
+    if candidates:
+        reddit_summary = format_candidate_table(reddit_data, candidates)
+    else:
+        reddit_summary = format_reddit_excerpts(reddit_data)
 
     # Create the prompt
-    chatgpt_prompt = f"""You are a music recommendation expert. Based on a user's Spotify playlist and Reddit community recommendations, suggest 5 songs they will likely enjoy.
+    chatgpt_prompt = f"""You are a music recommendation expert. Based on a user's Spotify playlist and Reddit community recommendations, suggest {num_recommendations} songs they will likely enjoy.
 
 USER'S PLAYLIST:
 {playlist_summary}
 
-REDDIT RECOMMENDATIONS FROM r/{subreddit_name}:
+REDDIT RECOMMENDATIONS FROM {sources}:
 {reddit_summary}
 
 TASK:
@@ -87,24 +150,157 @@ IMPORTANT CONSTRAINTS:
 2. CRITICAL: Do NOT recommend more than 2 songs from the same artist. Each artist can appear AT MOST 2 times in your recommendations.
 3. Song popularity should NOT influence your recommendations. Focus on matching the user's taste regardless of whether songs are mainstream or obscure.
 4. ALWAYS return exactly {num_recommendations} songs, even if you're unsure about the later ones. Since rankings go from best to worst, less perfect matches at the end (like #{num_recommendations}) are acceptable.
-5. Return ONLY a JSON array with exactly {num_recommendations} songs in RANKED ORDER in this format:
-[
+5. Return ONLY a JSON object whose "recommendations" key holds a JSON array with exactly {num_recommendations} songs in RANKED ORDER in this format:
+{{"recommendations": [
   {{"song": "Song Name", "artist": "Artist Name"}},
   {{"song": "Song Name", "artist": "Artist Name"}},
   ...
-]
+]}}
 
-Do NOT include any explanation, just the JSON array. Make sure songs are real and can be found on Spotify."""
+Do NOT include any explanation, just the JSON object. Make sure songs are real and can be found on Spotify."""
 
     return chatgpt_prompt
 
 
+def format_retry_prompt(
+    playlist_data: Dict[str, Any],
+    top_tracks: List[Dict[str, Any]],
+    num_recommendations: int,
+    candidates: Optional[List[Dict[str, Any]]] = None,
+    exclude: Optional[List[Dict[str, str]]] = None,
+) -> str:
+    """
+    Shortened prompt for the single retry after an unusable ChatGPT answer,
+    or for replacement picks (playlist tracks and candidate names only,
+    no Reddit text)
+
+    Args:
+        playlist_data: Dictionary with playlist information
+        top_tracks: List of top tracks
+        num_recommendations: Number of recommendations to request
+        candidates: Scored song candidates extracted from the Reddit data
+        exclude: Songs already suggested that must not be repeated
+
+    Returns:
+        str: Formatted prompt for ChatGPT
+    """
+    prompt = f"Playlist: {playlist_data['name']}\nTracks:\n"
+    for track in top_tracks[:10]:
+        prompt += f"- {track['name']} - {track['artist_names']}\n"
+    if candidates:
+        prompt += "Songs recommended on Reddit:\n"
+        for candidate in candidates[:MAX_RETRY_CANDIDATES]:
+            prompt += f"- {candidate['song']} - {candidate['artist']}\n"
+    if exclude:
+        prompt += "Already suggested (do NOT repeat these):\n"
+        for rec in exclude:
+            prompt += f"- {rec['song']} - {rec['artist']}\n"
+
+    prompt += f"""
+Recommend {num_recommendations} songs NOT in the playlist, best match first, at most 2 per artist.
+Reply with ONLY this JSON object and nothing else:
+{{"recommendations": [{{"song": "Song Name", "artist": "Artist Name"}}]}}"""
+    return prompt
+
+
+def _iter_json_values(text: str) -> Iterator[Any]:
+    """Yield the whole text as JSON, then every JSON array/object embedded in it"""
+    try:
+        yield json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    decoder = json.JSONDecoder()
+    for match in re.finditer(r"[\[{]", text):
+        try:
+            yield decoder.raw_decode(text, match.start())[0]
+        except json.JSONDecodeError:
+            continue
+
+
+def _valid_recommendations(data: Any) -> List[Dict[str, str]]:
+    """Song/artist entries of a decoded array or {"recommendations": [...]}"""
+    if isinstance(data, dict):
+        data = data.get("recommendations")
+    if not isinstance(data, list):
+        return []
+
+    recommendations = []
+    for item in data:
+        if not isinstance(item, dict):
+            continue
+        song, artist = item.get("song"), item.get("artist")
+        if isinstance(song, str) and isinstance(artist, str):
+            if song.strip() and artist.strip():
+                recommendations.append({"song": song.strip(), "artist": artist.strip()})
+    return recommendations
+
+
+def parse_recommendations(gpt_response: Optional[str]) -> List[Dict[str, str]]:
+    """
+    Tolerantly extract song recommendations from a ChatGPT answer
+
+    Accepts a bare JSON array or a {"recommendations": [...]} object, wrapped
+    in markdown fences or surrounded by other text, and salvages the complete
+    entries of a truncated array. Entries without a non-empty song and artist
+    are dropped.
+
+    Args:
+        gpt_response: Raw message content
+
+    Returns:
+        list: Dicts with 'song' and 'artist' keys
+
+    Raises:
+        ValueError: If no valid recommendation can be found
+    """
+    text = _CODE_FENCE_RE.sub("", gpt_response or "").strip()
+    values = []
+    for data in _iter_json_values(text):
+        recommendations = _valid_recommendations(data)
+        if recommendations:
+            return recommendations
+        values.append(data)
+
+    # Truncated answer (max_tokens hit): keep the complete song objects
+    recommendations = _valid_recommendations(
+        [data for data in values if isinstance(data, dict)]
+    )
+    if recommendations:
+        return recommendations
+    raise ValueError("no recommendations with song and artist keys found")
+
+
+def request_chatgpt_completion(
+    openai_client: "OpenAI",
+    chatgpt_prompt: str,
+    model: str = "gpt-4",
+    temperature: float = 0.7,
+    max_tokens: int = 500,
+) -> str:
+    """Send one prompt in JSON mode and return the raw message content"""
+    response = openai_client.chat.completions.create(
+        model=model,
+        messages=[
+            {
+                "role": "system",
+                "content": "You are a music recommendation expert. Always return valid JSON.",
+            },
+            {"role": "user", "content": chatgpt_prompt},
+        ],
+        temperature=temperature,
+        max_tokens=max_tokens,
+        response_format=RESPONSE_FORMAT,
+    )
+    return response.choices[0].message.content
+
+
 def get_chatgpt_recommendations(
-    openai_client: OpenAI,
+    openai_client: "OpenAI",
     chatgpt_prompt: str,
     model: str = "gpt-4",
     temperature: float = 0.7,
     max_tokens: int = 500,
+    retry_prompt: Optional[str] = None,
 ) -> List[Dict[str, str]]:
     """
     Step 5: Get Recommendations from ChatGPT
@@ -115,59 +311,67 @@ def get_chatgpt_recommendations(
         model: GPT model to use
         temperature: Temperature parameter for generation
         max_tokens: Maximum tokens for response
+        retry_prompt: Shortened prompt sent once if the answer can't be parsed
 
     Returns:
-        list: List of song recommendations from ChatGPT
+        list: List of song recommendations from ChatGPT (empty if no answer
+              could be parsed, API errors are raised)
     """
     print("=" * 80)
     print("CALLING CHATGPT API")
     print("=" * 80)
 
-    try:
-        response = openai_client.chat.completions.create(
-            model=model,
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a music recommendation expert. Always return valid JSON.",
-                },
-                {"role": "user", "content": chatgpt_prompt},
-            ],
-            temperature=temperature,
-            max_tokens=max_tokens,
-        )
+    prompts = [chatgpt_prompt] + ([retry_prompt] if retry_prompt else [])
+    for attempt, prompt in enumerate(prompts, 1):
+        try:
+            gpt_response = request_chatgpt_completion(
+                openai_client, prompt, model, temperature, max_tokens
+            )
+            print(f"ChatGPT Response received")
+            print(f"\nRaw response:")
+            print("-" * 80)
+            print(gpt_response)
+            print("-" * 80)
 
-        gpt_response = response.choices[0].message.content
-        print(f"ChatGPT Response received")
-        print(f"\nRaw response:")
-        print("-" * 80)
-        print(gpt_response)
-        print("-" * 80)
+            gpt_recommendations = parse_recommendations(gpt_response)
 
-        # Parse JSON response
-        gpt_recommendations = json.loads(gpt_response)
+            print(f"\nParsed {len(gpt_recommendations)} recommendations:")
+            for idx, rec in enumerate(gpt_recommendations, 1):
+                print(f"   {idx}. {rec['song']} - {rec['artist']}")
 
-        print(f"\nParsed {len(gpt_recommendations)} recommendations:")
-        for idx, rec in enumerate(gpt_recommendations, 1):
-            print(f"   {idx}. {rec['song']} - {rec['artist']}")
+            return gpt_recommendations
 
-        return gpt_recommendations
+        except ValueError as e:
+            # Unusable answer, worth one retry with the shorter prompt
+            print(f"Could not parse ChatGPT response (attempt {attempt}): {e}")
+        except Exception as e:
+            # API errors propagate so the caller's circuit breaker sees them
+            print(f"Error calling ChatGPT: {e}")
+            raise
 
-    except Exception as e:
-        print(f"Error calling ChatGPT: {e}")
-        return []
+    return []
+
+
+def response_max_tokens(num_songs: int, settings: PipelineSettings) -> int:
+    """
+    max_tokens for an answer of num_songs songs: settings.gpt_max_tokens,
+    raised when the requested pool (over-generated for re-ranking, plus
+    spares) would not fit in it
+    """
+    return max(
+        settings.gpt_max_tokens,
+        num_songs * TOKENS_PER_SONG + RESPONSE_OVERHEAD_TOKENS,
+    )
 
 
 def analyze_and_recommend(
-    openai_client: OpenAI,
+    openai_client: "OpenAI",
     playlist_data: Dict[str, Any],
     reddit_data: List[Dict[str, Any]],
     top_tracks: List[Dict[str, Any]],
-    subreddit_name: str,
     num_recommendations: int = 5,
-    model: str = "gpt-4",
-    temperature: float = 0.7,
-    max_tokens: int = 500,
+    settings: Optional[PipelineSettings] = None,
+    candidates: Optional[List[Dict[str, Any]]] = None,
 ) -> List[Dict[str, str]]:
     """
     Combined Steps 4 & 5: Format data and get ChatGPT recommendations
@@ -177,23 +381,79 @@ def analyze_and_recommend(
         playlist_data: Dictionary with playlist information
         reddit_data: List of Reddit posts and comments
         top_tracks: List of top tracks
-        subreddit_name: Name of subreddit
         num_recommendations: Number of recommendations to request
-        model: GPT model to use
-        temperature: Temperature parameter
-        max_tokens: Maximum tokens for response
+        settings: Subreddit and GPT model/temperature/max tokens
+                  (defaults to PipelineSettings())
+        candidates: Scored song candidates for a compact prompt (optional)
 
     Returns:
         list: List of song recommendations
     """
+    settings = settings or PipelineSettings()
+
     # Step 4: Format data
     chatgpt_prompt = format_data_for_chatgpt(
-        playlist_data, reddit_data, top_tracks, subreddit_name, num_recommendations
+        playlist_data,
+        reddit_data,
+        top_tracks,
+        settings.subreddit_name,
+        num_recommendations,
+        candidates,
     )
 
     # Step 5: Get recommendations
+    retry_prompt = format_retry_prompt(
+        playlist_data, top_tracks, num_recommendations, candidates
+    )
     gpt_recommendations = get_chatgpt_recommendations(
-        openai_client, chatgpt_prompt, model, temperature, max_tokens
+        openai_client,
+        chatgpt_prompt,
+        settings.gpt_model,
+        settings.gpt_temperature,
+        response_max_tokens(num_recommendations, settings),
+        retry_prompt,
     )
 
     return gpt_recommendations
+
+
+def get_replacement_recommendations(
+    openai_client: "OpenAI",
+    playlist_data: Dict[str, Any],
+    top_tracks: List[Dict[str, Any]],
+    num_recommendations: int,
+    tried: List[Dict[str, str]],
+    settings: Optional[PipelineSettings] = None,
+    candidates: Optional[List[Dict[str, Any]]] = None,
+) -> List[Dict[str, str]]:
+    """
+    Cheap follow-up request for songs to replace picks Spotify couldn't find
+
+    Args:
+        openai_client: OpenAI client object
+        playlist_data: Dictionary with playlist information
+        top_tracks: List of top tracks
+        num_recommendations: Number of replacement songs to request
+        tried: Songs already suggested (never returned again)
+        settings: GPT model/temperature/max tokens (defaults to PipelineSettings())
+        candidates: Scored song candidates extracted from the Reddit data
+
+    Returns:
+        list: New song recommendations
+    """
+    settings = settings or PipelineSettings()
+    prompt = format_retry_prompt(
+        playlist_data, top_tracks, num_recommendations, candidates, tried
+    )
+    tried_keys = {normalize_key(rec["song"], rec["artist"]) for rec in tried}
+    return [
+        rec
+        for rec in get_chatgpt_recommendations(
+            openai_client,
+            prompt,
+            settings.gpt_model,
+            settings.gpt_temperature,
+            response_max_tokens(num_recommendations, settings),
+        )
+        if normalize_key(rec["song"], rec["artist"]) not in tried_keys
+    ]
@@ -0,0 +1,266 @@
+"""
+Cache Warmer
+Background job filling the caches ahead of demand:
+- Demand counters of requested playlists and queried artists (decaying,
+  so what's trending now ranks first)
+- Pre-runs get_playlist_data, the Reddit artist queries (local index) and
+  the Spotify searches of the songs Reddit mentions for those artists
+- Low-priority rate budget: a few calls per second, and only while the
+  upstream isn't busy with live requests
+"""
+
+import asyncio
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from resilience import Upstream
+
+
+class DemandCounter:
+    """
+    Request counts per key (playlist ID, artist) that halve every
+    half_life seconds
+
+    Used from the event loop only, so no locking is needed.
+    """
+
+    def __init__(
+        self,
+        half_life: float = 3600.0,
+        max_keys: int = 1000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.half_life = half_life
+        self.max_keys = max_keys
+        self._clock = clock
+        # Key -> (count, time of the count)
+        self._counts: Dict[str, Tuple[float, float]] = {}
+
+    def _decayed(self, count: float, at: float, now: float) -> float:
+        return count * 0.5 ** ((now - at) / self.half_life)
+
+    def add(self, key: str, weight: float = 1.0) -> None:
+        now = self._clock()
+        count, at = self._counts.get(key, (0.0, now))
+        self._counts[key] = (self._decayed(count, at, now) + weight, now)
+        if len(self._counts) > self.max_keys:
+            # Forget the coldest half
+            for cold, _ in self.top(len(self._counts))[self.max_keys // 2 :]:
+                del self._counts[cold]
+
+    def top(self, n: int) -> List[Tuple[str, float]]:
+        """The n most requested keys with their decayed counts, highest first"""
+        now = self._clock()
+        counts = [
+            (key, self._decayed(count, at, now))
+            for key, (count, at) in self._counts.items()
+        ]
+        counts.sort(key=lambda item: item[1], reverse=True)
+        return counts[:n]
+
+
+class RateBudget:
+    """
+    Token bucket for low-priority calls: `rate` calls per second (bursts
+    up to `burst`), handed out only while the upstream has fewer than
+    busy_share of its bulkhead slots in use and a closed circuit
+    """
+
+    def __init__(
+        self,
+        rate: float = 1.0,
+        burst: int = 1,
+        busy_share: float = 0.25,
+        poll_seconds: float = 0.5,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.busy_share = busy_share
+        self.poll_seconds = poll_seconds
+        self._clock = clock
+        self._tokens = float(burst)
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, upstream: Optional[Upstream] = None) -> bool:
+        """
+        Wait for a token and a quiet upstream
+
+        Returns:
+            bool: False if the upstream's circuit isn't closed (skip the
+                  call, live requests get the recovery probe)
+        """
+        while True:
+            if upstream is not None and upstream.breaker.state != "closed":
+                return False
+            self._refill()
+            busy = (
+                upstream is not None
+                and upstream.in_flight >= upstream.max_concurrency * self.busy_share
+            )
+            if self._tokens >= 1 and not busy:
+                self._tokens -= 1
+                return True
+            if busy:
+                wait = self.poll_seconds
+            else:
+                wait = (1 - self._tokens) / self.rate
+            await asyncio.sleep(wait)
+
+
+async def warm_caches(
+    budget: RateBudget,
+    num_playlists: int = 10,
+    num_artists: int = 20,
+    songs_per_artist: int = 5,
+) -> Dict[str, int]:
+    """
+    One warming round over the current demand, using main's shared caches,
+    clients and upstreams
+
+    - Top playlists are re-fetched when missing or past half their TTL;
+      their top/bottom artists join the artists to warm
+    - Artist queries missing from the local index (or past half their max
+      age) are searched and stored; skipped without REDDIT_INDEX_PATH
+    - The best songs Reddit mentions for each artist are searched on
+      Spotify unless the catalog cache has them
+
+    Args:
+        budget: Low-priority rate budget shared by all calls of the round
+        num_playlists: Most requested playlists to warm
+        num_artists: Most queried artists to warm (before playlist artists)
+        songs_per_artist: Spotify searches per artist
+
+    Returns:
+        dict: Calls made per kind ("playlists", "reddit_queries",
+              "spotify_searches") and "skipped" (upstream unavailable)
+    """
+    import main
+    from entity_extraction import extract_candidates
+    from reddit_api import fetch_limits, search_reddit_for_recommendations
+    from reddit_index import artist_seed_query
+    from spotify_api import get_playlist_data
+    from track_selection import select_artists
+
+    settings = main.DEFAULT_SETTINGS
+    stats = dict.fromkeys(
+        ("playlists", "reddit_queries", "spotify_searches", "skipped"), 0
+    )
+    sp = main.get_spotify_client()
+
+    artists = dict(main.artist_demand.top(num_artists))
+    for playlist_id, demand in main.playlist_demand.top(num_playlists):
+        cache = main.playlist_cache
+        age = cache.age(playlist_id)
+        playlist_result = cache.get(playlist_id)
+        if age is None or age > cache.ttl / 2:
+            if not await budget.acquire(main.spotify_upstream):
+                stats["skipped"] += 1
+                continue
+            try:
+                playlist_result = await main.spotify_upstream.call(
+                    get_playlist_data,
+                    sp,
+                    f"https://open.spotify.com/playlist/{playlist_id}",
+                )
+            except Exception as e:
+                print(f"   Warmer: playlist {playlist_id} failed: {e!r}")
+                continue
+            cache.put(playlist_id, playlist_result)
+            stats["playlists"] += 1
+        for artist in select_artists(
+            playlist_result["tracks_data"],
+            settings.num_top_artists,
+            settings.num_bottom_artists,
+            0,
+        ):
+            artists[artist] = artists.get(artist, 0.0) + demand
+
+    index = main.get_reddit_index()
+    if index is None:
+        return stats
+    subreddit = settings.subreddit_name
+    max_age = settings.reddit_index_max_age_seconds
+    reddit = None
+    try:
+        for artist, _ in sorted(artists.items(), key=lambda item: -item[1]):
+            seed, query = artist_seed_query(artist)
+            limits = fetch_limits(settings, settings.max_reddit_posts_per_query)
+            cached = await asyncio.to_thread(
+                index.lookup, query, subreddit, max_age and max_age / 2, limits
+            )
+            if cached is None:
+                if not await budget.acquire(main.reddit_upstream):
+                    stats["skipped"] += 1
+                    continue
+                if reddit is None:
+                    import asyncpraw
+
+                    reddit = asyncpraw.Reddit(
+                        client_id=main.REDDIT_CLIENT_ID,
+                        client_secret=main.REDDIT_CLIENT_SECRET,
+                        username=main.REDDIT_USERNAME,
+                        password=main.REDDIT_PASSWORD,
+                        user_agent=main.REDDIT_USER_AGENT,
+                    )
+                try:
+                    async with main.reddit_upstream.guard():
+                        posts = await search_reddit_for_recommendations(
+                            reddit,
+                            query,
+                            subreddit,
+                            settings.max_reddit_posts_per_query,
+                            settings.max_comments_per_post,
+                            settings.reddit_max_body_bytes,
+                            settings.reddit_max_comment_bytes,
+                        )
+                except Exception as e:
+                    print(f"   Warmer: Reddit query '{query}' failed: {e!r}")
+                    continue
+                await asyncio.to_thread(
+                    index.store_query_results, query, subreddit, posts, seed, limits
+                )
+                stats["reddit_queries"] += 1
+
+            posts = await asyncio.to_thread(index.lookup, query, subreddit)
+            songs = extract_candidates(posts or [], [artist])
+            for song in songs["songs"][:songs_per_artist]:
+                if main.spotify_catalog.get(song["song"], song["artist"])[0]:
+                    continue
+                if not await budget.acquire(main.spotify_upstream):
+                    stats["skipped"] += 1
+                    break
+                await main.spotify_catalog.lookup(
+                    sp, song["song"], song["artist"], main.spotify_upstream
+                )
+                stats["spotify_searches"] += 1
+    finally:
+        if reddit is not None:
+            await reddit.close()
+    return stats
+
+
+async def run_cache_warmer(interval: float, budget: RateBudget, **kwargs: Any) -> None:
+    """
+    Warm the caches every interval seconds until cancelled (errors are
+    printed and the next round runs as usual)
+
+    Args:
+        interval: Seconds between the starts of two rounds
+        budget: Low-priority rate budget
+        **kwargs: warm_caches options
+    """
+    while True:
+        start = time.monotonic()
+        try:
+            stats = await warm_caches(budget, **kwargs)
+            print(
+                f"Cache warmer round done in {time.monotonic() - start:.1f}s: {stats}"
+            )
+        except Exception as e:
+            print(f"Cache warmer round failed: {e!r}")
+        await asyncio.sleep(max(0.0, interval - (time.monotonic() - start)))
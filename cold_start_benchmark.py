@@ -0,0 +1,135 @@
+"""
+Cold Start Benchmark
+Measures what a fresh (serverless) process pays before it can answer:
+- Import time of fastapi_endpoint
+- Time to the first response (default /api/health)
+- Which heavy SDKs were loaded by then (should be none)
+- Import time of main, paid by the first recommendation request
+Each run is a new interpreter, run this file to print the medians.
+"""
+
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, Any, List
+
+# SDKs that only the recommendation pipeline needs
+HEAVY_MODULES = ("spotipy", "asyncpraw", "openai", "dotenv")
+
+
+async def _asgi_get(app, path: str) -> int:
+    # One GET through the ASGI app itself (no HTTP server or client needed)
+    messages: List[Dict[str, Any]] = []
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [],
+        "client": ("127.0.0.1", 0),
+        "server": ("127.0.0.1", 80),
+    }
+
+    async def receive() -> Dict[str, Any]:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message: Dict[str, Any]) -> None:
+        messages.append(message)
+
+    await app(scope, receive, send)
+    return messages[0]["status"]
+
+
+def _probe(path: str) -> None:
+    """Run inside a fresh interpreter, prints the timings as JSON"""
+    start = time.perf_counter()
+    import fastapi_endpoint
+
+    imported = time.perf_counter()
+    status = asyncio.run(_asgi_get(fastapi_endpoint.app, path))
+    responded = time.perf_counter()
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    import main
+
+    pipeline_ready = time.perf_counter()
+    print(
+        json.dumps(
+            {
+                "status": status,
+                "import_seconds": imported - start,
+                "first_response_seconds": responded - start,
+                "main_import_seconds": pipeline_ready - responded,
+                "heavy_modules_loaded": loaded,
+            }
+        )
+    )
+
+
+def measure_cold_start(path: str = "/api/health", runs: int = 5) -> Dict[str, Any]:
+    """
+    Cold start timings over several fresh interpreters
+
+    Args:
+        path: Endpoint to send the first request to
+        runs: Number of fresh processes to measure
+
+    Returns:
+        dict: Median import_seconds, first_response_seconds and
+              main_import_seconds, plus the status codes and every heavy
+              SDK loaded before the first response in any run
+    """
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                f"import cold_start_benchmark; cold_start_benchmark._probe({path!r})",
+            ],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+
+    result: Dict[str, Any] = {
+        key: statistics.median(sample[key] for sample in samples)
+        for key in ("import_seconds", "first_response_seconds", "main_import_seconds")
+    }
+    result["statuses"] = sorted({sample["status"] for sample in samples})
+    result["heavy_modules_loaded"] = sorted(
+        {name for sample in samples for name in sample["heavy_modules_loaded"]}
+    )
+    return result
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Measure cold start time")
+    parser.add_argument("--path", default="/api/health", help="first request path")
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes")
+    args = parser.parse_args()
+
+    result = measure_cold_start(args.path, args.runs)
+    print(f"Cold start over {args.runs} runs (median):")
+    print(f"   import fastapi_endpoint: {result['import_seconds'] * 1000:.0f} ms")
+    print(
+        f"   first {args.path} response: {result['first_response_seconds'] * 1000:.0f} ms"
+    )
+    print(
+        f"   import main (first recommendation): {result['main_import_seconds'] * 1000:.0f} ms"
+    )
+    print(f"   status codes: {result['statuses']}")
+    print(f"   heavy SDKs loaded: {result['heavy_modules_loaded'] or 'none'}")
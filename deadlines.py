@@ -0,0 +1,75 @@
+"""
+Deadlines Module
+Request-level deadline split into per-stage time budgets:
+- Each stage gets its share of the time left (unused time rolls over)
+- Stages that run out of time are recorded as degraded for the metadata
+"""
+
+import time
+from typing import Callable, Dict, Optional
+
+# Share of the remaining request time each stage gets, in pipeline order
+DEFAULT_STAGE_SHARES: Dict[str, float] = {
+    "playlist": 0.15,
+    "reddit": 0.35,
+    "gpt": 0.35,
+    "spotify": 0.15,
+}
+
+
+class RequestDeadline:
+    """
+    Time budget of one request
+
+    A stage's budget is the time left, split over the stages that haven't
+    run yet in proportion to their shares. A stage that finishes early
+    leaves its unused time to the later ones, and the last stage gets
+    whatever is left.
+    """
+
+    def __init__(
+        self,
+        total_seconds: Optional[float],
+        shares: Optional[Dict[str, float]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.total_seconds = total_seconds
+        self.shares = dict(shares or DEFAULT_STAGE_SHARES)
+        self._clock = clock
+        self._start = clock()
+        # Stage -> why it returned partial/fallback results
+        self.degraded: Dict[str, str] = {}
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left for the whole request (None = no deadline)"""
+        if self.total_seconds is None:
+            return None
+        return max(self.total_seconds - (self._clock() - self._start), 0.0)
+
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def budget(self, stage: str, cap: Optional[float] = None) -> Optional[float]:
+        """
+        Seconds a stage may use, computed when the stage starts
+
+        Args:
+            stage: Stage name (a key of shares)
+            cap: Stage-specific upper limit in seconds (e.g. a configured timeout)
+
+        Returns:
+            float: Budget in seconds, or cap (possibly None) without a deadline
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return cap
+        stages = list(self.shares)
+        pending = stages[stages.index(stage) :]
+        budget = remaining * self.shares[stage] / sum(self.shares[s] for s in pending)
+        return budget if cap is None else min(budget, cap)
+
+    def degrade(self, stage: str, reason: str) -> None:
+        """Record that a stage returned partial or fallback results"""
+        self.degraded[stage] = reason
+        print(f"   Stage '{stage}' degraded: {reason}")
@@ -0,0 +1,179 @@
+"""
+Entity Extraction Module
+Local, CPU-only extraction of song/artist mentions from Reddit data:
+- Spots "Song - Artist", "Song" by Artist and "check out Artist" mentions
+- Aggregates them into a candidate list weighted by post/comment score
+"""
+
+import re
+from typing import Dict, List, Any, Iterable, Iterator, Optional, Tuple
+
+# Lowercase joining words a name can contain but never end with
+_CONNECTORS = ("of", "the", "and", "in", "on", "a", "de", "la", "le", "du", "y")
+
+# A capitalized name of up to 6 words ("The Beatles", "Florence and the Machine")
+_NAME = (
+    rf"[A-Z0-9][\w'&.!]*(?:\s+(?:[A-Z0-9&(][\w'&.!)]*|{'|'.join(_CONNECTORS)})){{0,5}}"
+)
+
+# "Song - Artist"
+SONG_DASH_ARTIST_RE = re.compile(rf"(?<![\w'])({_NAME})\s+[-–—]\s+({_NAME})")
+# "Song" by Artist
+SONG_BY_ARTIST_RE = re.compile(rf"[\"“]([^\"”\n]{{2,60}})[\"”]\s+by\s+({_NAME})")
+# check out / try / listen to Artist
+ARTIST_HINT_RE = re.compile(
+    rf"(?:check out|try|listen to|you might like|fans of|similar to)\s+({_NAME})",
+    re.IGNORECASE,
+)
+
+# Capitalized words that start sentences but are never part of a name
+_LEADING_FILLER = {
+    "also",
+    "and",
+    "but",
+    "check",
+    "definitely",
+    "i",
+    "listen",
+    "maybe",
+    "or",
+    "so",
+    "try",
+    "yes",
+}
+
+
+def _clean_name(name: str) -> str:
+    """Trim quotes, markdown, filler and dangling joining words from a name"""
+    words = name.strip(" \"'*_“”.!").split()
+    while words and words[0].lower() in _LEADING_FILLER:
+        words = words[1:]
+    while words and words[-1] in _CONNECTORS:
+        words = words[:-1]
+    return " ".join(words).strip(" \"'*_“”.!")
+
+
+def normalize_key(song: str, artist: str) -> Tuple[str, str]:
+    """Case/space-insensitive key for a song/artist pair"""
+    return " ".join(song.lower().split()), " ".join(artist.lower().split())
+
+
+def extract_mentions(text: str) -> List[Tuple[str, str]]:
+    """
+    Find "Song - Artist" / "Song" by Artist mentions in Reddit text
+
+    Args:
+        text: Post or comment text
+
+    Returns:
+        list: (song, artist) pairs in the order they appear
+    """
+    mentions = []
+    for pattern in (SONG_DASH_ARTIST_RE, SONG_BY_ARTIST_RE):
+        for match in pattern.finditer(text):
+            song = _clean_name(match.group(1))
+            artist = _clean_name(match.group(2))
+            if song and artist:
+                mentions.append((song, artist))
+    return mentions
+
+
+def extract_artist_mentions(
+    text: str, known_artists: Optional[Iterable[str]] = None
+) -> List[str]:
+    """
+    Find artist-only mentions ("check out Artist", or any known artist name)
+
+    Args:
+        text: Post or comment text
+        known_artists: Artist names to spot anywhere in the text
+
+    Returns:
+        list: Artist names in the order they are found
+    """
+    artists = [_clean_name(match.group(1)) for match in ARTIST_HINT_RE.finditer(text)]
+    if known_artists:
+        lowered = text.lower()
+        artists += [artist for artist in known_artists if artist.lower() in lowered]
+    return [artist for artist in artists if artist]
+
+
+def iter_weighted_texts(post_data: Dict[str, Any]) -> Iterator[Tuple[str, float]]:
+    """
+    Yield (text, weight) for a post and its comments,
+    weight = max(score, 1) times the post's subreddit source_weight (if any)
+    """
+    source_weight = post_data.get("source_weight", 1)
+    yield (
+        f"{post_data['title']}\n{post_data['body']}",
+        max(post_data["score"], 1) * source_weight,
+    )
+    for comment in post_data["comments"]:
+        yield comment["body"], max(comment["score"], 1) * source_weight
+
+
+def extract_candidates(
+    reddit_data: List[Dict[str, Any]],
+    known_artists: Optional[Iterable[str]] = None,
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Aggregate song and artist mentions across Reddit posts into scored lists
+
+    Args:
+        reddit_data: List of Reddit posts and comments
+        known_artists: Artist names to spot anywhere in the text
+
+    Returns:
+        dict: "songs" (song, artist, score, mentions) and "artists"
+              (artist, score, mentions), best score first
+    """
+    songs: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    artists: Dict[str, Dict[str, Any]] = {}
+    known_artists = list(known_artists or [])
+
+    for post_data in reddit_data:
+        for text, weight in iter_weighted_texts(post_data):
+            for song, artist in extract_mentions(text):
+                entry = songs.setdefault(
+                    normalize_key(song, artist),
+                    {"song": song, "artist": artist, "score": 0, "mentions": 0},
+                )
+                entry["score"] += weight
+                entry["mentions"] += 1
+                _add_artist(artists, artist, weight)
+            for artist in extract_artist_mentions(text, known_artists):
+                _add_artist(artists, artist, weight)
+
+    return {
+        "songs": sorted(songs.values(), key=lambda c: c["score"], reverse=True),
+        "artists": sorted(artists.values(), key=lambda c: c["score"], reverse=True),
+    }
+
+
+def _add_artist(artists: Dict[str, Dict[str, Any]], artist: str, weight: int) -> None:
+    entry = artists.setdefault(
+        artist.lower(), {"artist": artist, "score": 0, "mentions": 0}
+    )
+    entry["score"] += weight
+    entry["mentions"] += 1
+
+
+def merge_candidates(
+    candidates: List[Dict[str, Any]], extra: Iterable[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """
+    Add extra scored songs (e.g. the local index's co-mentions) to a
+    candidate list, summing score and mentions of songs in both
+
+    Returns:
+        list: New candidate list, best score first
+    """
+    merged = {normalize_key(c["song"], c["artist"]): dict(c) for c in candidates}
+    for song in extra:
+        entry = merged.get(normalize_key(song["song"], song["artist"]))
+        if entry is None:
+            merged[normalize_key(song["song"], song["artist"])] = dict(song)
+        else:
+            entry["score"] += song["score"]
+            entry["mentions"] += song["mentions"]
+    return sorted(merged.values(), key=lambda c: c["score"], reverse=True)
@@ -0,0 +1,115 @@
+"""
+Fast Path Module
+GPT-free recommendations from the Reddit evidence (mode="fast"):
+- Vectorized co-mention scoring (seed -> candidate mention matrix in NumPy)
+- Recommendation rules enforced in code (max songs per artist, not in playlist)
+"""
+
+import numpy as np
+from typing import Dict, List, Any, Sequence, Tuple
+from entity_extraction import extract_mentions, iter_weighted_texts, normalize_key
+
+
+def score_comentions(reddit_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Rank song mentions by how strongly the playlist seeds' threads recommend them
+
+    Builds a (seed x candidate) matrix of mention weights (post/comment score)
+    and scores each candidate by its total weight, boosted when several
+    different seeds led to it.
+
+    Args:
+        reddit_data: Reddit posts (with "seeds", see get_reddit_recommendations)
+
+    Returns:
+        list: Candidates (song, artist, score, mentions, seed_support), best first
+    """
+    seed_ids: Dict[str, int] = {}
+    candidate_ids: Dict[Tuple[str, str], int] = {}
+    candidates: List[Dict[str, Any]] = []
+    rows: List[int] = []
+    cols: List[int] = []
+    weights: List[float] = []
+    mentions: List[int] = []
+
+    for post_data in reddit_data:
+        post_seeds = [
+            seed_ids.setdefault(seed, len(seed_ids))
+            for seed in post_data.get("seeds") or [""]
+        ]
+        for text, weight in iter_weighted_texts(post_data):
+            for song, artist in extract_mentions(text):
+                key = normalize_key(song, artist)
+                col = candidate_ids.get(key)
+                if col is None:
+                    col = candidate_ids[key] = len(candidates)
+                    candidates.append({"song": song, "artist": artist})
+                    mentions.append(0)
+                mentions[col] += 1
+                for row in post_seeds:
+                    rows.append(row)
+                    cols.append(col)
+                    weights.append(weight)
+
+    if not candidates:
+        return []
+
+    matrix = np.zeros((len(seed_ids), len(candidates)), dtype=np.float64)
+    np.add.at(matrix, (rows, cols), weights)
+
+    seed_support = np.count_nonzero(matrix, axis=0)
+    scores = matrix.sum(axis=0) * np.sqrt(seed_support)
+    # Stable sort keeps first-mentioned candidates first on ties
+    order = np.argsort(-scores, kind="stable")
+
+    return [
+        dict(
+            candidates[col],
+            score=float(scores[col]),
+            mentions=mentions[col],
+            seed_support=int(seed_support[col]),
+        )
+        for col in order
+    ]
+
+
+def primary_artist(artist_names: str) -> str:
+    """First artist of a "A, B" artist string, normalized"""
+    return " ".join(artist_names.split(",")[0].lower().split())
+
+
+def apply_recommendation_rules(
+    candidates: List[Dict[str, Any]],
+    tracks_data: Sequence[Dict[str, Any]],
+    num_recommendations: int,
+    max_per_artist: int = 2,
+) -> List[Dict[str, Any]]:
+    """
+    Pick the final songs in rank order, enforcing the prompt's rules in code
+
+    Args:
+        candidates: Ranked candidates with song and artist keys
+        tracks_data: Playlist tracks (their songs are never recommended)
+        num_recommendations: Number of songs to pick
+        max_per_artist: Maximum songs from the same (primary) artist
+
+    Returns:
+        list: Up to num_recommendations candidates
+    """
+    in_playlist = {
+        (" ".join(track["name"].lower().split()), primary_artist(track["artist_names"]))
+        for track in tracks_data
+    }
+
+    picks = []
+    per_artist: Dict[str, int] = {}
+    for candidate in candidates:
+        artist = primary_artist(candidate["artist"])
+        song = " ".join(candidate["song"].lower().split())
+        if (song, artist) in in_playlist or per_artist.get(artist, 0) >= max_per_artist:
+            continue
+        per_artist[artist] = per_artist.get(artist, 0) + 1
+        picks.append(candidate)
+        if len(picks) == num_recommendations:
+            break
+    return picks
@@ -3,38 +3,230 @@ FastAPI for Song Recommendation System
 Receives playlist url from website and returns song recommendations as JSON
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, Response
 from pydantic import BaseModel
-from typing import Optional
-from main import get_recommendations
-from spotipy.exceptions import SpotifyException
+from typing import Any, Dict, List, Literal, Optional
+import asyncio
+import contextlib
+import hmac
+import json
+import os
+import random
+import tempfile
+from resilience import CircuitOpenError
+from profiling import PROFILE_FORMATS, profile_request
+from admission import AdmissionRejected, ClientRateLimiter, FairAdmissionQueue
+
+# Opt-in profiling (see profiling.py), off unless configured:
+# a request sending "X-Profile: <PROFILE_TOKEN>" is profiled, and so is a
+# PROFILE_SAMPLE_RATE share of recommendation requests
+PROFILE_TOKEN: Optional[str] = os.getenv("PROFILE_TOKEN")
+PROFILE_SAMPLE_RATE: float = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR: str = os.getenv(
+    "PROFILE_DIR", os.path.join(tempfile.gettempdir(), "redditjams-profiles")
+)
+PROFILE_FORMAT: str = os.getenv("PROFILE_FORMAT", "speedscope")  # or "collapsed"
+# profiles kept in PROFILE_DIR, the oldest are deleted
+PROFILE_MAX_FILES: int = int(os.getenv("PROFILE_MAX_FILES", "100"))
+PROFILE_BLOCK_THRESHOLD_SECONDS: float = 0.1  # loop stalls reported with their stack
+PROFILE_SAMPLED_PATHS = ("/api/recommendations",)
+
+# Admission control (see admission.py) for recommendation requests
+RATE_LIMIT_PER_MINUTE: float = float(
+    os.getenv("RATE_LIMIT_PER_MINUTE", "10")
+)  # per client, a client is an API key tenant or an IP address
+RATE_LIMIT_BURST: int = 5  # requests a client can send at once before the rate applies
+MAX_CONCURRENT_REQUESTS: int = (
+    16  # recommendation requests running at once (matches the upstream bulkheads)
+)
+MAX_QUEUED_REQUESTS: int = 64  # waiting beyond this gets an immediate 429
+MAX_QUEUE_WAIT_SECONDS: float = 20.0  # waiting longer than this gets a 429
+# API key -> {"name", "weight" (fair share, default 1), "rate_per_minute"}
+API_TENANTS: Dict[str, Dict[str, Any]] = json.loads(os.getenv("API_TENANTS", "{}"))
+# Take the client IP from X-Forwarded-For (only behind a proxy that sets it, e.g. Vercel)
+TRUST_FORWARDED_FOR: bool = (
+    os.getenv("TRUST_FORWARDED_FOR", os.getenv("VERCEL", "0")) == "1"
+)
+ADMISSION_PATHS = ("/api/recommendations",)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Runs the cache warmer in the background when it is configured"""
+    warmer = None
+    # Checked before importing main, so serverless cold starts stay light
+    if os.getenv("CACHE_WARMER_INTERVAL_SECONDS"):
+        import main
+        from cache_warmer import RateBudget, run_cache_warmer
+
+        if main.CACHE_WARMER_INTERVAL_SECONDS > 0:
+            warmer = asyncio.create_task(
+                run_cache_warmer(
+                    main.CACHE_WARMER_INTERVAL_SECONDS,
+                    RateBudget(main.CACHE_WARMER_CALLS_PER_SECOND),
+                    num_playlists=main.CACHE_WARMER_PLAYLISTS,
+                    num_artists=main.CACHE_WARMER_ARTISTS,
+                )
+            )
+    yield
+    if warmer is not None:
+        warmer.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await warmer
+
 
 app = FastAPI(
     title="RedditJams API",
     description="Song Recommendation API based on Spotify playlists and Reddit recommendations",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
+)
+
+rate_limiter = ClientRateLimiter(RATE_LIMIT_PER_MINUTE / 60, RATE_LIMIT_BURST)
+admission_queue = FairAdmissionQueue(
+    MAX_CONCURRENT_REQUESTS, MAX_QUEUED_REQUESTS, MAX_QUEUE_WAIT_SECONDS
 )
 
-# Enable CORS
+
+def _client_identity(request: Request) -> tuple:
+    """(client, fair share weight, rate per second or None for the default)"""
+    tenant = API_TENANTS.get(request.headers.get("x-api-key", ""))
+    if tenant is not None:
+        rate = tenant.get("rate_per_minute")
+        return (
+            f"tenant:{tenant['name']}",
+            float(tenant.get("weight", 1.0)),
+            None if rate is None else rate / 60,
+        )
+    forwarded = request.headers.get("x-forwarded-for")
+    if TRUST_FORWARDED_FOR and forwarded:
+        return f"ip:{forwarded.split(',')[0].strip()}", 1.0, None
+    return f"ip:{request.client.host if request.client else 'unknown'}", 1.0, None
+
+
+def _should_profile(request: Request) -> bool:
+    token = request.headers.get("x-profile")
+    if token is not None and PROFILE_TOKEN:
+        return hmac.compare_digest(token, PROFILE_TOKEN)
+    return (
+        request.url.path in PROFILE_SAMPLED_PATHS
+        and random.random() < PROFILE_SAMPLE_RATE
+    )
+
+
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    """Profile opted-in requests end to end (validation to JSON encoding)"""
+    if not _should_profile(request):
+        return await call_next(request)
+
+    output_format = request.headers.get("x-profile-format", PROFILE_FORMAT)
+    if output_format not in PROFILE_FORMATS:
+        output_format = PROFILE_FORMAT
+    name = f"{request.method} {request.url.path}"
+    async with profile_request(
+        name,
+        PROFILE_DIR,
+        output_format,
+        block_threshold=PROFILE_BLOCK_THRESHOLD_SECONDS,
+        max_profiles=PROFILE_MAX_FILES,
+    ) as profile:
+        response = await call_next(request)
+        # Read the body inside the profile, it's where JSON encoding happens
+        body = b"".join([chunk async for chunk in response.body_iterator])
+    headers = dict(response.headers)
+    headers.pop("content-length", None)
+    headers["X-Profile-File"] = os.path.basename(profile["files"][0])
+    return Response(
+        content=body,
+        status_code=response.status_code,
+        headers=headers,
+        media_type=response.media_type,
+    )
+
+
+@app.middleware("http")
+async def admit_requests(request: Request, call_next):
+    """Per-client rate limits and fair queueing, 429 + Retry-After when full"""
+    if request.method != "POST" or request.url.path not in ADMISSION_PATHS:
+        return await call_next(request)
+
+    client, weight, rate = _client_identity(request)
+    try:
+        rate_limiter.check(client, rate)
+        async with admission_queue.admit(client, weight):
+            return await call_next(request)
+    except AdmissionRejected as e:
+        message = (
+            "Too many requests, please slow down."
+            if e.reason == "rate limit exceeded"
+            else "The server is busy, please try again shortly."
+        )
+        return ORJSONResponse(
+            status_code=429,
+            content={"success": False, "error": message},
+            headers={"Retry-After": e.retry_after_header},
+        )
+
+
+# Enable CORS (added last so it wraps the middleware above, 429s included)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # Configure appropriately for production
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After"],
 )
 
 
 class RecommendationRequest(BaseModel):
     playlist_url: str
+    # Latency/quality tier, "fast" skips GPT (free tier/overload)
+    preset: Literal["fast", "balanced", "thorough"] = "balanced"
+    mode: Optional[Literal["full", "fast"]] = None  # overrides the preset's mode
+
+
+class PlaylistDetails(BaseModel):
+    name: str
+    owner: Optional[str] = None
+    total_tracks: int
+    album_art: Optional[str] = None
+
+
+class TrackRecommendation(BaseModel):
+    name: str
+    artist: str
+    album: str
+    release_date: Optional[str] = None
+    popularity: int
+    duration_ms: int
+    duration_readable: str
+    preview_url: Optional[str] = None
+    external_url: Optional[str] = None
+    uri: str
+    album_art: Optional[str] = None
+    id: str
+
+
+class RecommendationMetadata(BaseModel):
+    total_tracks_analyzed: int
+    reddit_posts_found: int
+    recommendations_requested: int
+    recommendations_found: int
+    reddit_search_complete: bool = True
+    mode: str = "full"
+    degraded_stages: Dict[str, str] = {}  # stage -> why it returned partial results
 
 
 class RecommendationResponse(BaseModel):
     success: bool
-    playlist_details: Optional[dict] = None
-    recommendations: Optional[list] = None
-    metadata: Optional[dict] = None
+    playlist_details: Optional[PlaylistDetails] = None
+    recommendations: Optional[List[TrackRecommendation]] = None
+    metadata: Optional[RecommendationMetadata] = None
     error: Optional[str] = None
 
 
@@ -44,7 +236,17 @@ async def get_song_recommendations(request: RecommendationRequest):
     Get song recommendations based on Spotify playlist
 
     - **playlist_url**: Spotify playlist URL (required)
+    - **preset**: "balanced" (default), "fast" (no GPT, songs ranked from the
+      Reddit evidence directly, sub-second and free) or "thorough" (more
+      Reddit evidence and a bigger GPT pool, slower)
+    - **mode**: "full" (GPT picks the songs) or "fast" (no GPT), overrides
+      the preset's mode
     """
+    # Imported on first use: main loads the Spotify/Reddit/OpenAI SDKs, which
+    # cold starts (and /api/health) shouldn't pay for
+    from main import get_recommendations, get_settings
+    from spotipy.exceptions import SpotifyException
+
     # Validate that the URL starts with the correct Spotify playlist URL format
     if not request.playlist_url.startswith("https://open.spotify.com/playlist/"):
         return RecommendationResponse(
@@ -54,24 +256,31 @@ async def get_song_recommendations(request: RecommendationRequest):
 
     try:
         # Call main recommendation function (async)
-        result = await get_recommendations(playlist_url=request.playlist_url)
+        result = await get_recommendations(
+            playlist_url=request.playlist_url,
+            mode=request.mode,
+            settings=get_settings(request.preset),
+        )
 
         # Prepare response
         return RecommendationResponse(
             success=True,
-            playlist_details={
-                "name": result["playlist_data"]["name"],
-                "owner": result["playlist_data"]["owner"],
-                "total_tracks": result["playlist_data"]["total_tracks"],
-                "album_art": result["playlist_data"]["album_art"],
-            },
+            playlist_details=PlaylistDetails(
+                name=result["playlist_data"]["name"],
+                owner=result["playlist_data"]["owner"],
+                total_tracks=result["playlist_data"]["total_tracks"],
+                album_art=result["playlist_data"]["album_art"],
+            ),
             recommendations=result["final_recommendations"],
-            metadata={
-                "total_tracks_analyzed": len(result["tracks_data"]),
-                "reddit_posts_found": len(result["reddit_data"]),
-                "recommendations_requested": result["metadata"]["num_requested"],
-                "recommendations_found": result["metadata"]["num_found"],
-            },
+            metadata=RecommendationMetadata(
+                total_tracks_analyzed=result["metadata"]["num_tracks"],
+                reddit_posts_found=result["metadata"]["num_reddit_posts"],
+                recommendations_requested=result["metadata"]["num_requested"],
+                recommendations_found=result["metadata"]["num_found"],
+                reddit_search_complete=result["metadata"]["reddit_complete"],
+                mode=result["metadata"]["mode"],
+                degraded_stages=result["metadata"]["degraded_stages"],
+            ),
         )
 
     except SpotifyException as e:
@@ -98,6 +307,20 @@ async def get_song_recommendations(request: RecommendationRequest):
                 success=False, error="Internal error. Please try again later."
             )
 
+    except CircuitOpenError:
+        # Spotify failed for recent requests, fail fast until it recovers
+        return RecommendationResponse(
+            success=False,
+            error="Spotify is currently unavailable. Please try again in a minute.",
+        )
+
+    except TimeoutError:
+        # The playlist couldn't be loaded within its share of the request deadline
+        return RecommendationResponse(
+            success=False,
+            error="Spotify took too long to respond. Please try again later.",
+        )
+
     except Exception as e:
         # Generic error handler - internal error
         return RecommendationResponse(
@@ -5,14 +5,40 @@ Coordinates all steps of the recommendation system and displays results (Step 7)
 
 import os
 import asyncio
+from collections import Counter
+from typing import Any, NamedTuple
 from dotenv import load_dotenv
 from spotify_api import (
     initialize_spotify,
     get_playlist_data,
-    search_spotify_recommendations,
+    search_spotify_until,
+    SpotifyCatalogCache,
+    SpotifyPrefetcher,
+    validate_candidates,
+    is_spotify_outage,
+    get_playlist_id,
+    PlaylistCache,
 )
 from reddit_api import get_reddit_recommendations
-from ai_analysis import initialize_openai, analyze_and_recommend
+from reddit_index import RedditIndex, track_seed_query
+from entity_extraction import extract_candidates, merge_candidates
+from fast_path import score_comentions, apply_recommendation_rules
+from similarity_ranker import EmbeddingMatrix, rerank_by_similarity
+from deadlines import RequestDeadline, DEFAULT_STAGE_SHARES
+from resilience import Upstream
+from subreddit_sources import DEFAULT_SUBREDDIT_SOURCES
+from cache_warmer import DemandCounter
+from pipeline_settings import (
+    PipelineSettings,
+    PRESETS,
+    resolve_settings,
+)
+from ai_analysis import (
+    initialize_openai,
+    analyze_and_recommend,
+    get_replacement_recommendations,
+    MAX_PROMPT_POSTS,
+)
 
 # Load environment variables
 load_dotenv()
@@ -30,12 +56,88 @@ OPENAI_API_KEY: str | None = os.getenv("OPENAI_API_KEY")
 # GPT Model Configuration
 GPT_MODEL: str = "gpt-4o-mini"  # model
 GPT_TEMPERATURE: float = 0.7  # creativity level (thi is complicated curr 0.7 is working well but too high and you're not utilizing reddit data enough too low and you're trusting gpt too much)
-GPT_MAX_TOKENS: int = 500  # max tokens for response (500 should be sufficient for recommendations this is output length not input length)
+GPT_MAX_TOKENS: int = 500  # max tokens for response (output length not input length), raised for larger song pools (ai_analysis.response_max_tokens)
 
 # Reddit Configuration
 SUBREDDIT_NAME: str = "music"  # subreddit to search for recommendations (this is the obvious default beacuse its far popular than any other music related subreddit)
 MAX_REDDIT_POSTS_PER_QUERY: int = 20  # max posts to fetch per track/artist query (too high and your getting too much data especially since some songs might have more reddit posts about them than others which would vanash low popularity songs)
 MAX_COMMENTS_PER_POST: int = 30  # max comments to fetch per reddit post (too high and you're getting a lot of irrelevant data noise, these are mostly empty beacuse this subreddit has alot of low engagement posts, not a bad thing)
+REDDIT_EVIDENCE_TARGET: int | None = 20  # stop searching once this many posts/comments scored REDDIT_MIN_EVIDENCE_SCORE+ (None = wait for every search, the slowest query then sets step 3 latency)
+REDDIT_MIN_EVIDENCE_SCORE: int = 10  # reddit score a post/comment needs to count
+REDDIT_DEADLINE_SECONDS: float | None = 10.0  # give up on remaining reddit searches after this long and use what arrived (None = no deadline)
+# local sqlite reddit index (see reddit_index.py) checked before live reddit, None = always search live
+REDDIT_INDEX_PATH: str | None = os.getenv("REDDIT_INDEX_PATH")
+REDDIT_INDEX_MAX_AGE_SECONDS: float = 7 * 24 * 3600  # older entries are searched live
+# extra subreddits (weight, post cap, genre artists) picked per request from the playlist's artists, see subreddit_sources.py
+SUBREDDIT_SOURCES: tuple = DEFAULT_SUBREDDIT_SOURCES
+MAX_EXTRA_SUBREDDITS: int = (
+    2  # searched with the artist queries in the same round (0 = r/SUBREDDIT_NAME only)
+)
+# query planner (see query_planner.py): weak artist queries share one OR-query, 1 = one search per query
+REDDIT_OR_GROUP_SIZE: int = 3
+REDDIT_SOLO_MIN_YIELD: float = (
+    5.0  # artist queries expected to return this many posts keep their own search
+)
+# reddit text budgets in UTF-8 bytes, text is cut at ingestion (see text_budget.py)
+REDDIT_MAX_BODY_BYTES: int = 2000  # kept per post body (the prompt shows 300 characters, the rest feeds song extraction)
+REDDIT_MAX_COMMENT_BYTES: int = 1000  # kept per comment
+REDDIT_MAX_REQUEST_BYTES: int | None = 1_000_000  # stop collecting reddit posts once their text reaches this (None = no limit)
+# Stop reddit searches once this many posts are kept; the best MAX_PROMPT_POSTS go in the prompt (None = no cap)
+REDDIT_MAX_TOTAL_POSTS: int | None = 4 * MAX_PROMPT_POSTS
+
+# Candidate Extraction Configuration
+USE_CANDIDATE_TABLE: bool = True  # send gpt a compact table of reddit-mentioned songs (verified on spotify) instead of long post/comment excerpts, fewer input tokens
+MAX_PROMPT_CANDIDATES: int = 20  # top reddit candidates verified and sent to gpt
+SPOTIFY_PREFETCH_BUDGET: int = 10  # spotify lookups of the most-mentioned reddit songs started while gpt runs (0 = no prefetch)
+
+# Fast Mode Configuration (mode="fast" skips gpt entirely)
+FAST_MODE_CANDIDATE_POOL: int = 20  # best-scored reddit candidates verified on spotify
+
+# Re-ranking Configuration
+# ask gpt for extra songs and keep the ones closest to the playlist (local artist/album/co-mention embeddings, no extra gpt call)
+RERANK_RECOMMENDATIONS: bool = True
+RERANK_OVERGENERATE: int = 2  # re-rank pool is this many times NUM_RECOMMENDATIONS
+# Fill-to-N Configuration (keep results complete when spotify misses some gpt picks)
+GPT_SPARE_PICKS: int = (
+    3  # extra gpt songs beyond the pool, used when spotify can't find a pick
+)
+FILL_MAX_FOLLOWUPS: int = (
+    1  # short follow-up gpt requests for replacements if the picks still run out
+)
+SPOTIFY_SEARCH_CONCURRENCY: int = 5  # step 6 spotify searches running at once
+
+# memory-mapped embedding cache (see similarity_ranker.py), None = in-memory only
+EMBEDDING_MATRIX_PATH: str | None = os.getenv("EMBEDDING_MATRIX_PATH")
+EMBEDDING_CACHE_MAX_TRACKS: int = 20_000  # in-memory embedding cache size (4 KB per track), least recently used tracks are evicted
+
+# Deadline Configuration (bounded latency matters more than complete evidence)
+REQUEST_DEADLINE_SECONDS: float | None = (
+    30.0  # whole request, split into per-stage budgets (None = no deadline)
+)
+STAGE_BUDGET_SHARES: dict = DEFAULT_STAGE_SHARES  # playlist/reddit/gpt/spotify share of the time left, unused time rolls over
+
+# Resilience Configuration (per-upstream circuit breakers and concurrency pools)
+CIRCUIT_FAILURE_THRESHOLD: int = 5  # failures in a row that open a circuit
+CIRCUIT_RESET_SECONDS: float = 30.0  # an open circuit skips its upstream this long, then lets one probe call through
+SPOTIFY_MAX_CONCURRENCY: int = 16  # spotify calls in flight across all requests
+REDDIT_MAX_CONCURRENCY: int = 16  # live reddit searches in flight across all requests
+OPENAI_MAX_CONCURRENCY: int = 8  # gpt calls in flight across all requests
+
+# Cache Warming Configuration (see cache_warmer.py)
+PLAYLIST_CACHE_TTL_SECONDS: float = 300.0  # playlist data reused this long, edits show up after at most this (0 = no cache)
+DEMAND_HALF_LIFE_SECONDS: float = 3600.0  # playlist/artist request counts halve this often, so trending content ranks first
+CACHE_WARMER_INTERVAL_SECONDS: float = float(
+    os.getenv("CACHE_WARMER_INTERVAL_SECONDS", "0")
+)  # seconds between warming rounds in a long-running server (0 = warmer off)
+CACHE_WARMER_CALLS_PER_SECOND: float = 1.0  # low-priority budget, only spent while live traffic leaves the upstream mostly idle
+CACHE_WARMER_PLAYLISTS: int = 10  # most requested playlists kept warm
+CACHE_WARMER_ARTISTS: int = (
+    20  # most queried artists kept warm (plus the hot playlists' artists)
+)
+
+# Debug Configuration
+# keep heavy intermediate data (all tracks, every reddit post) in the result, off in production to save memory
+DEBUG_PIPELINE_DATA: bool = os.getenv("REDDITJAMS_DEBUG") == "1"
 
 # Analysis Configuration
 NUM_TOP_TRACKS: int = 3  # number of most popular tracks to analyze
@@ -45,47 +147,271 @@ NUM_TOP_ARTISTS: int = 2  # number of top artists to analyze
 NUM_BOTTOM_ARTISTS: int = 2  # number of bottom artists to analyze
 NUM_RANDOM_ARTISTS: int = 2  # number of random artists to analyze
 NUM_RECOMMENDATIONS: int = 5  # number of recommendations to generate
+SELECTION_SEED: int | None = None  # seed for the random track/artist picks (set it to make runs reproducible, None = new picks every run)
+
+# Base settings of every request (the constants above), presets and
+# per-request overrides are applied on top, see pipeline_settings.py
+DEFAULT_SETTINGS = PipelineSettings(
+    mode="full",
+    num_recommendations=NUM_RECOMMENDATIONS,
+    subreddit_name=SUBREDDIT_NAME,
+    max_reddit_posts_per_query=MAX_REDDIT_POSTS_PER_QUERY,
+    max_comments_per_post=MAX_COMMENTS_PER_POST,
+    num_top_tracks=NUM_TOP_TRACKS,
+    num_bottom_tracks=NUM_BOTTOM_TRACKS,
+    num_random_tracks=NUM_RANDOM_TRACKS,
+    num_top_artists=NUM_TOP_ARTISTS,
+    num_bottom_artists=NUM_BOTTOM_ARTISTS,
+    num_random_artists=NUM_RANDOM_ARTISTS,
+    selection_seed=SELECTION_SEED,
+    reddit_evidence_target=REDDIT_EVIDENCE_TARGET,
+    reddit_min_evidence_score=REDDIT_MIN_EVIDENCE_SCORE,
+    reddit_deadline_seconds=REDDIT_DEADLINE_SECONDS,
+    reddit_index_max_age_seconds=REDDIT_INDEX_MAX_AGE_SECONDS,
+    subreddit_sources=SUBREDDIT_SOURCES,
+    max_extra_subreddits=MAX_EXTRA_SUBREDDITS,
+    reddit_or_group_size=REDDIT_OR_GROUP_SIZE,
+    reddit_solo_min_yield=REDDIT_SOLO_MIN_YIELD,
+    reddit_max_body_bytes=REDDIT_MAX_BODY_BYTES,
+    reddit_max_comment_bytes=REDDIT_MAX_COMMENT_BYTES,
+    reddit_max_request_bytes=REDDIT_MAX_REQUEST_BYTES,
+    reddit_max_total_posts=REDDIT_MAX_TOTAL_POSTS,
+    gpt_model=GPT_MODEL,
+    gpt_temperature=GPT_TEMPERATURE,
+    gpt_max_tokens=GPT_MAX_TOKENS,
+    use_candidate_table=USE_CANDIDATE_TABLE,
+    max_prompt_candidates=MAX_PROMPT_CANDIDATES,
+    spotify_prefetch_budget=SPOTIFY_PREFETCH_BUDGET,
+    fast_mode_candidate_pool=FAST_MODE_CANDIDATE_POOL,
+    rerank_recommendations=RERANK_RECOMMENDATIONS,
+    rerank_overgenerate=RERANK_OVERGENERATE,
+    gpt_spare_picks=GPT_SPARE_PICKS,
+    fill_max_followups=FILL_MAX_FOLLOWUPS,
+    spotify_search_concurrency=SPOTIFY_SEARCH_CONCURRENCY,
+    request_deadline_seconds=REQUEST_DEADLINE_SECONDS,
+    stage_budget_shares=STAGE_BUDGET_SHARES,
+)
+SETTINGS_PRESETS: dict = (
+    PRESETS  # "fast"/"balanced"/"thorough" overrides of DEFAULT_SETTINGS
+)
+
+_spotify_client = None
+_openai_client = None
+_reddit_index: RedditIndex | None = None
+_embedding_matrix: EmbeddingMatrix | None = None
+spotify_catalog = SpotifyCatalogCache()  # shared across requests
+prefetch_totals: Counter = Counter()  # prefetch stats summed over requests, for tuning
+playlist_cache = PlaylistCache(PLAYLIST_CACHE_TTL_SECONDS)
+# What the cache warmer pre-runs (see cache_warmer.py)
+playlist_demand = DemandCounter(DEMAND_HALF_LIFE_SECONDS)
+artist_demand = DemandCounter(DEMAND_HALF_LIFE_SECONDS)
+
+
+class Upstreams(NamedTuple):
+    """Circuit breaker and bulkhead of each external service"""
+
+    spotify: Upstream
+    reddit: Upstream
+    openai: Upstream
+
+
+def new_upstreams() -> Upstreams:
+    """Fresh (closed, idle) upstreams for the three services"""
+    return Upstreams(
+        Upstream(
+            "spotify",
+            SPOTIFY_MAX_CONCURRENCY,
+            CIRCUIT_FAILURE_THRESHOLD,
+            CIRCUIT_RESET_SECONDS,
+            is_spotify_outage,
+        ),
+        Upstream(
+            "reddit",
+            REDDIT_MAX_CONCURRENCY,
+            CIRCUIT_FAILURE_THRESHOLD,
+            CIRCUIT_RESET_SECONDS,
+        ),
+        Upstream(
+            "openai",
+            OPENAI_MAX_CONCURRENCY,
+            CIRCUIT_FAILURE_THRESHOLD,
+            CIRCUIT_RESET_SECONDS,
+        ),
+    )
+
+
+# Shared across requests: an outage seen by one request is skipped by the next
+spotify_upstream, reddit_upstream, openai_upstream = new_upstreams()
+
+
+class PipelineClients(NamedTuple):
+    """
+    API clients a request runs with instead of the shared ones (snapshot
+    replay, tests). Such a request also gets its own upstreams (circuit
+    breakers), Spotify catalog and embedding caches, and no local Reddit
+    index, so its results depend on these clients only and its failures
+    never open the shared circuits.
+    """
+
+    spotify: Any
+    openai: Any = None  # not needed in fast mode
+    reddit: Any = None  # open asyncpraw-like client, None = log in per request
+
 
+def get_spotify_client():
+    """Build the Spotify client on first use (kept across requests)"""
+    global _spotify_client
+    if _spotify_client is None:
+        _spotify_client = initialize_spotify(SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET)
+    return _spotify_client
 
-async def get_recommendations(playlist_url: str) -> dict:
+
+def get_openai_client():
+    """Build the OpenAI client on first use (fast mode never loads the SDK)"""
+    global _openai_client
+    if _openai_client is None:
+        _openai_client = initialize_openai(OPENAI_API_KEY)
+    return _openai_client
+
+
+def get_settings(preset: str | None = None, **overrides) -> PipelineSettings:
+    """
+    Settings of one request: DEFAULT_SETTINGS, then a preset, then overrides
+
+    Raises:
+        ValueError: On an unknown preset or setting name
+    """
+    return resolve_settings(DEFAULT_SETTINGS, preset, SETTINGS_PRESETS, **overrides)
+
+
+def get_reddit_index() -> RedditIndex | None:
+    """Open the local Reddit index on first use (None if not configured)"""
+    global _reddit_index
+    if _reddit_index is None and REDDIT_INDEX_PATH:
+        _reddit_index = RedditIndex(REDDIT_INDEX_PATH)
+    return _reddit_index
+
+
+def get_embedding_matrix() -> EmbeddingMatrix:
+    """Open the track embedding cache on first use (kept across requests)"""
+    global _embedding_matrix
+    if _embedding_matrix is None:
+        _embedding_matrix = EmbeddingMatrix(
+            EMBEDDING_MATRIX_PATH, max_rows=EMBEDDING_CACHE_MAX_TRACKS
+        )
+    return _embedding_matrix
+
+
+def with_timeout(openai_client, seconds: float | None):
+    """OpenAI client whose HTTP calls give up after seconds (unchanged if None)"""
+    if seconds is None:
+        return openai_client
+    return openai_client.with_options(timeout=seconds)
+
+
+async def get_recommendations(
+    playlist_url: str,
+    debug: bool | None = None,
+    mode: str | None = None,
+    settings: PipelineSettings | None = None,
+    clients: PipelineClients | None = None,
+) -> dict:
     """
     Main function to get song recommendations (Async)
 
     Args:
         playlist_url: Spotify playlist URL (REQUIRED)
+        debug: Keep heavy intermediate data (tracks_data, reddit_data and the
+               playlist track list) in the result, defaults to DEBUG_PIPELINE_DATA
+        mode: "full" (GPT picks the songs) or "fast" (no GPT call, songs are
+              ranked by co-mention scoring of the Reddit evidence), overrides
+              settings.mode
+        settings: Pipeline settings of this request (see get_settings),
+                  defaults to DEFAULT_SETTINGS
+        clients: Clients to use instead of the shared ones (see PipelineClients)
 
     Returns:
         dict: Contains final recommendations and metadata
+              (tracks_data and reddit_data are None unless debug is on)
     """
+    if debug is None:
+        debug = DEBUG_PIPELINE_DATA
+    settings = settings or DEFAULT_SETTINGS
+    if mode is not None:
+        settings = settings.override(mode=mode)
+    mode = settings.mode
 
     print("=" * 80)
     print("SONG RECOMMENDATION SYSTEM")
     print("=" * 80)
     print(f"\nConfiguration:")
     print(f"  Playlist URL: {playlist_url}")
-    print(f"  Subreddit: r/{SUBREDDIT_NAME}")
-    print(f"  Max Reddit posts per query: {MAX_REDDIT_POSTS_PER_QUERY}")
-    print(f"  Max comments per post: {MAX_COMMENTS_PER_POST}")
+    print(f"  Mode: {mode}")
+    print(f"  Settings: {settings.fingerprint}")
+    print(f"  Subreddit: r/{settings.subreddit_name}")
+    print(f"  Max Reddit posts per query: {settings.max_reddit_posts_per_query}")
+    print(f"  Max comments per post: {settings.max_comments_per_post}")
+    print(
+        f"  Reddit evidence target: {settings.reddit_evidence_target} (score {settings.reddit_min_evidence_score}+), deadline: {settings.reddit_deadline_seconds}s"
+    )
     print(
-        f"  Top tracks: {NUM_TOP_TRACKS}, Bottom tracks: {NUM_BOTTOM_TRACKS}, Random tracks: {NUM_RANDOM_TRACKS}"
+        f"  Top tracks: {settings.num_top_tracks}, Bottom tracks: {settings.num_bottom_tracks}, Random tracks: {settings.num_random_tracks}"
     )
     print(
-        f"  Top artists: {NUM_TOP_ARTISTS}, Bottom artists: {NUM_BOTTOM_ARTISTS}, Random artists: {NUM_RANDOM_ARTISTS}"
+        f"  Top artists: {settings.num_top_artists}, Bottom artists: {settings.num_bottom_artists}, Random artists: {settings.num_random_artists}"
     )
-    print(f"  GPT Model: {GPT_MODEL}")
-    print(f"  GPT Temperature: {GPT_TEMPERATURE}")
-    print(f"  GPT Max Tokens: {GPT_MAX_TOKENS}")
-    print(f"  Recommendations to generate: {NUM_RECOMMENDATIONS}")
+    print(f"  GPT Model: {settings.gpt_model}")
+    print(f"  GPT Temperature: {settings.gpt_temperature}")
+    print(f"  GPT Max Tokens: {settings.gpt_max_tokens}")
+    print(f"  Recommendations to generate: {settings.num_recommendations}")
+    print(f"  Request deadline: {settings.request_deadline_seconds}s")
+    if settings.rerank_recommendations:
+        print(
+            f"  Re-ranking: best of {settings.num_recommendations * settings.rerank_overgenerate} tracks"
+        )
     print("=" * 80)
 
     # Initialize APIs
     print("\nInitializing APIs...")
-    sp = initialize_spotify(SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET)
-    openai_client = initialize_openai(OPENAI_API_KEY)
+    if clients is None:
+        sp = get_spotify_client()
+        openai_client = get_openai_client() if mode == "full" else None
+        reddit_client = None
+        reddit_index = get_reddit_index()
+        catalog = spotify_catalog
+        embeddings = get_embedding_matrix()
+        upstreams = Upstreams(spotify_upstream, reddit_upstream, openai_upstream)
+    else:
+        sp, openai_client, reddit_client = clients
+        reddit_index = None
+        catalog = SpotifyCatalogCache()
+        embeddings = EmbeddingMatrix()
+        upstreams = new_upstreams()
     print()
 
-    # Step 2: Extract Playlist Data
-    playlist_result = get_playlist_data(sp, playlist_url)
+    # Split the request deadline into stage budgets (fast mode has no GPT stage)
+    deadline = RequestDeadline(
+        settings.request_deadline_seconds,
+        {
+            stage: share
+            for stage, share in settings.stage_budget_shares
+            if mode == "full" or stage != "gpt"
+        },
+    )
+
+    # Step 2: Extract Playlist Data (popular playlists are usually cached)
+    # Nothing can run without the playlist, so running out of time fails the request
+    playlist_id = get_playlist_id(playlist_url)
+    playlist_result = playlist_cache.get(playlist_id) if clients is None else None
+    if playlist_result is None:
+        async with asyncio.timeout(deadline.budget("playlist")):
+            playlist_result = await upstreams.spotify.call(
+                get_playlist_data, sp, playlist_url
+            )
+        if clients is None:
+            playlist_cache.put(playlist_id, playlist_result)
+    else:
+        print(f"Playlist {playlist_id} served from cache")
     playlist_data = playlist_result["playlist_info"]
     tracks_data = playlist_result["tracks_data"]
     print()
@@ -98,38 +424,242 @@ async def get_recommendations(playlist_url: str) -> dict:
         REDDIT_PASSWORD,
         REDDIT_USER_AGENT,
         tracks_data,
-        SUBREDDIT_NAME,
-        MAX_REDDIT_POSTS_PER_QUERY,
-        MAX_COMMENTS_PER_POST,
-        NUM_TOP_TRACKS,
-        NUM_BOTTOM_TRACKS,
-        NUM_RANDOM_TRACKS,
-        NUM_TOP_ARTISTS,
-        NUM_BOTTOM_ARTISTS,
-        NUM_RANDOM_ARTISTS,
+        settings,
+        # Posts are ranked and the prompt takes the best MAX_PROMPT_POSTS,
+        # so searches collect a multiple of that before stopping
+        settings.reddit_max_total_posts,
+        deadline.budget("reddit", settings.reddit_deadline_seconds),
+        reddit_index,
+        upstreams.reddit,
+        reddit_client,
     )
     all_reddit_data = reddit_result["all_reddit_data"]
     top_tracks = reddit_result["top_tracks"]
     all_artists = reddit_result["all_artists"]
+    if clients is None:
+        playlist_demand.add(playlist_id)
+        for artist in all_artists:
+            artist_demand.add(artist)
+    reddit_problems = []
+    if reddit_result["stop_reason"] == "deadline":
+        reddit_problems.append(
+            f"{reddit_result['completed_queries']}/{reddit_result['total_queries']} searches finished"
+        )
+    if reddit_result["failed_queries"]:
+        reddit_problems.append(
+            f"{reddit_result['failed_queries']} searches failed or skipped"
+        )
+    if reddit_problems:
+        deadline.degrade("reddit", ", ".join(reddit_problems))
+    # Songs the index saw co-mentioned with these seeds in threads this
+    # request didn't fetch (its own posts are counted from the Reddit data)
+    indexed_songs = []
+    if reddit_index is not None:
+        indexed_songs = await asyncio.to_thread(
+            reddit_index.related_songs,
+            [track_seed_query(track)[0] for track in top_tracks] + all_artists,
+            [post_data["url"] for post_data in all_reddit_data],
+        )
+        print(f"Local index: {len(indexed_songs)} co-mentioned songs")
     print()
-
-    # Steps 4 & 5: Format Data and Get ChatGPT Recommendations
-    gpt_recommendations = analyze_and_recommend(
-        openai_client,
-        playlist_data,
-        all_reddit_data,
-        top_tracks,
-        SUBREDDIT_NAME,
-        NUM_RECOMMENDATIONS,
-        GPT_MODEL,
-        GPT_TEMPERATURE,
-        GPT_MAX_TOKENS,
+    # Local mention ranking, computed once in a worker thread: fast mode's
+    # candidates, and the full mode's fallback if GPT has no answer (there
+    # it runs while GPT does)
+    comentions = asyncio.create_task(
+        asyncio.to_thread(score_comentions, all_reddit_data)
     )
-    print()
 
-    # Step 6: Search Spotify for Recommended Songs
-    final_recommendations = search_spotify_recommendations(sp, gpt_recommendations)
-    print()
+    prefetch_stats = None
+    if mode == "fast":
+        # Steps 4-6 (fast): Rank Reddit Candidates Locally, No GPT
+        print("=" * 80)
+        print("RANKING REDDIT CANDIDATES (FAST MODE, NO GPT)")
+        print("=" * 80)
+        ranked = merge_candidates(await comentions, indexed_songs)
+        print(f"Scored {len(ranked)} song mentions")
+        validated = await validate_candidates(
+            sp,
+            ranked,
+            catalog,
+            settings.fast_mode_candidate_pool,
+            exclude_ids=tracks_data.ids,
+            deadline=deadline.budget("spotify"),
+            upstream=upstreams.spotify,
+        )
+        if deadline.expired():
+            deadline.degrade("spotify", "some candidates were not checked in time")
+        picks = apply_recommendation_rules(
+            validated, tracks_data, settings.num_recommendations
+        )
+        gpt_recommendations = [
+            {"song": pick["song"], "artist": pick["artist"]} for pick in picks
+        ]
+        final_recommendations = [pick["track"] for pick in picks]
+        print()
+    else:
+        # Step 3b: Extract Candidate Songs from the Reddit Data (local, no GPT)
+        candidates = None
+        extracted = None
+        if settings.use_candidate_table or settings.spotify_prefetch_budget:
+            print("=" * 80)
+            print("EXTRACTING CANDIDATE SONGS FROM REDDIT")
+            print("=" * 80)
+            extracted = await asyncio.to_thread(
+                extract_candidates, all_reddit_data, all_artists
+            )
+            extracted["songs"] = merge_candidates(extracted["songs"], indexed_songs)
+            print(f"Found {len(extracted['songs'])} song mentions")
+        if settings.use_candidate_table:
+            # Part of the GPT stage, at most half its budget
+            gpt_budget = deadline.budget("gpt")
+            candidates = await validate_candidates(
+                sp,
+                extracted["songs"],
+                catalog,
+                settings.max_prompt_candidates,
+                exclude_ids=tracks_data.ids,
+                deadline=None if gpt_budget is None else gpt_budget / 2,
+                upstream=upstreams.spotify,
+            )
+
+        # Step 3c: Prefetch Likely Picks from Spotify While GPT Runs
+        prefetcher = None
+        if settings.spotify_prefetch_budget:
+            prefetcher = SpotifyPrefetcher(
+                sp, catalog, settings.spotify_prefetch_budget, upstreams.spotify
+            )
+            prefetcher.start(extracted["songs"])
+        print()
+
+        # Steps 4 & 5: Format Data and Get ChatGPT Recommendations
+        # GPT over-generates: the re-rank pool plus spares for Spotify misses
+        pool_size = settings.num_recommendations
+        if settings.rerank_recommendations:
+            pool_size *= settings.rerank_overgenerate
+        gpt_budget = deadline.budget("gpt")
+        try:
+            # In a worker thread so the prefetch lookups run during the call
+            gpt_recommendations = await upstreams.openai.call(
+                analyze_and_recommend,
+                with_timeout(openai_client, gpt_budget),
+                playlist_data,
+                all_reddit_data,
+                top_tracks,
+                pool_size + settings.gpt_spare_picks,
+                settings,
+                candidates,
+                timeout=gpt_budget,
+            )
+        except TimeoutError:
+            gpt_recommendations = []
+            deadline.degrade(
+                "gpt",
+                (
+                    "no answer in time"
+                    if gpt_budget is None
+                    else f"no answer within {gpt_budget:.1f}s"
+                ),
+            )
+        except Exception as e:
+            # OpenAI failing or its circuit open: take the GPT-free path below
+            gpt_recommendations = []
+            deadline.degrade("gpt", f"OpenAI error: {e}")
+        if not gpt_recommendations:
+            # Best effort: the top Reddit candidates stand in for GPT's picks
+            fallback = candidates or await comentions
+            gpt_recommendations = [
+                {"song": c["song"], "artist": c["artist"]}
+                for c in fallback[: pool_size + settings.gpt_spare_picks]
+            ]
+            deadline.degraded.setdefault(
+                "gpt", "no usable answer, Reddit candidates used instead"
+            )
+        print()
+
+        # Step 6: Search Spotify for Recommended Songs
+        if prefetcher is not None:
+            prefetch_stats = await prefetcher.resolve(
+                gpt_recommendations, deadline.budget("spotify")
+            )
+            if clients is None:
+                for key in ("prefetched", "picks", "prefetch_hits"):
+                    prefetch_totals[key] += prefetch_stats[key]
+            print(
+                f"Prefetch hit rate so far: {prefetch_totals['prefetch_hits']}/{prefetch_totals['picks']} picks"
+            )
+        print("=" * 80)
+        print("SEARCHING SPOTIFY FOR RECOMMENDATIONS")
+        print("=" * 80)
+        final_recommendations = await search_spotify_until(
+            sp,
+            gpt_recommendations,
+            pool_size,
+            catalog,
+            tracks_data.ids,
+            settings.spotify_search_concurrency,
+            deadline.budget("spotify"),
+            upstreams.spotify,
+        )
+
+        # Step 6a: Ask GPT for Replacements if Spotify Missed Too Many Picks
+        for _ in range(settings.fill_max_followups):
+            missing = settings.num_recommendations - len(final_recommendations)
+            if missing <= 0 or deadline.expired():
+                break
+            print(
+                f"\nOnly {len(final_recommendations)} tracks found, asking for replacements"
+            )
+            followup_budget = deadline.budget("spotify")
+            try:
+                replacements = await upstreams.openai.call(
+                    get_replacement_recommendations,
+                    with_timeout(openai_client, followup_budget),
+                    playlist_data,
+                    top_tracks,
+                    missing + settings.gpt_spare_picks,
+                    gpt_recommendations,
+                    settings,
+                    candidates,
+                    timeout=followup_budget,
+                )
+            except Exception as e:
+                print(f"   No replacements: {e!r}")
+                replacements = []
+            if not replacements:
+                break
+            gpt_recommendations = gpt_recommendations + replacements
+            final_recommendations += await search_spotify_until(
+                sp,
+                replacements,
+                pool_size - len(final_recommendations),
+                catalog,
+                [*tracks_data.ids, *(track["id"] for track in final_recommendations)],
+                settings.spotify_search_concurrency,
+                deadline.budget("spotify"),
+                upstreams.spotify,
+            )
+        if deadline.expired():
+            deadline.degrade(
+                "spotify",
+                f"{len(final_recommendations)} tracks found before the deadline",
+            )
+        print()
+
+        # Step 6b: Keep the Songs Closest to the Playlist (local, no GPT)
+        if settings.rerank_recommendations:
+            print("=" * 80)
+            print("RE-RANKING RECOMMENDATIONS BY PLAYLIST SIMILARITY")
+            print("=" * 80)
+            # Embeds every playlist track, in a worker thread
+            final_recommendations = await asyncio.to_thread(
+                rerank_by_similarity,
+                final_recommendations,
+                tracks_data,
+                all_reddit_data,
+                settings.num_recommendations,
+                embeddings,
+            )
+            print()
 
     print("\n" + "=" * 80)
     print("FINAL SONG RECOMMENDATIONS")
@@ -154,6 +684,28 @@ async def get_recommendations(playlist_url: str) -> dict:
 
     print("\n" + "=" * 80)
 
+    metadata = {
+        "subreddit": settings.subreddit_name,
+        "num_requested": settings.num_recommendations,
+        "num_found": len(final_recommendations),
+        "num_tracks": len(tracks_data),
+        "num_reddit_posts": len(all_reddit_data),
+        "reddit_complete": reddit_result["complete"],
+        "reddit_subreddits": reddit_result["subreddits"],
+        "mode": mode,
+        "spotify_prefetch": prefetch_stats,
+        "settings": settings.fingerprint,
+        "degraded_stages": deadline.degraded,
+    }
+
+    if not debug:
+        # Drop the heavy intermediate data so it can be freed with the request
+        playlist_data = {
+            key: value for key, value in playlist_data.items() if key != "tracks"
+        }
+        tracks_data = None
+        all_reddit_data = None
+
     # Return structured data
     return {
         "playlist_data": playlist_data,
@@ -163,9 +715,5 @@ async def get_recommendations(playlist_url: str) -> dict:
         "top_artists": all_artists,
         "gpt_recommendations": gpt_recommendations,
         "final_recommendations": final_recommendations,
-        "metadata": {
-            "subreddit": SUBREDDIT_NAME,
-            "num_requested": NUM_RECOMMENDATIONS,
-            "num_found": len(final_recommendations),
-        },
+        "metadata": metadata,
     }
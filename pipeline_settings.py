@@ -0,0 +1,179 @@
+"""
+Pipeline Settings Module
+Per-request configuration of the recommendation pipeline:
+- Immutable, hashable PipelineSettings (the Reddit index keys runs on
+  the fetch limits they imply, see reddit_api.fetch_limits)
+- Latency/quality presets ("fast", "balanced", "thorough")
+- Per-request overrides, checked against the known settings
+"""
+
+import dataclasses
+import hashlib
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+from deadlines import DEFAULT_STAGE_SHARES
+from subreddit_sources import SubredditSource, DEFAULT_SUBREDDIT_SOURCES
+
+PIPELINE_MODES: Tuple[str, ...] = ("full", "fast")
+
+# Stage shares of the request deadline (see deadlines.py), hashable form
+StageShares = Tuple[Tuple[str, float], ...]
+
+
+@dataclass(frozen=True)
+class PipelineSettings:
+    """
+    Knobs of one recommendation request (defaults = the "balanced" preset)
+
+    Frozen, so a settings object can be shared between requests. Derive
+    variants with override().
+    """
+
+    mode: str = "full"  # "full" (GPT picks) or "fast" (no GPT)
+    num_recommendations: int = 5
+
+    # Reddit search (Step 3)
+    subreddit_name: str = "music"
+    max_reddit_posts_per_query: int = 20
+    max_comments_per_post: int = 30
+    num_top_tracks: int = 3
+    num_bottom_tracks: int = 3
+    num_random_tracks: int = 3
+    num_top_artists: int = 2
+    num_bottom_artists: int = 2
+    num_random_artists: int = 2
+    selection_seed: Optional[int] = None
+    reddit_evidence_target: Optional[int] = 20
+    reddit_min_evidence_score: int = 10
+    reddit_deadline_seconds: Optional[float] = 10.0
+    reddit_index_max_age_seconds: Optional[float] = 7 * 24 * 3600
+    # Extra subreddits searched with the artist queries, in the same round
+    subreddit_sources: Tuple[SubredditSource, ...] = DEFAULT_SUBREDDIT_SOURCES
+    max_extra_subreddits: int = 2
+    # Query planner: artists per OR-query (1 = never combine) and the
+    # expected posts that earn an artist query a search of its own
+    reddit_or_group_size: int = 3
+    reddit_solo_min_yield: float = 5.0
+    # Text budgets (UTF-8 bytes): kept per post body and comment at
+    # ingestion, and kept per request (None = no limit)
+    reddit_max_body_bytes: Optional[int] = 2000
+    reddit_max_comment_bytes: Optional[int] = 1000
+    reddit_max_request_bytes: Optional[int] = 1_000_000
+    # Stop all searches once this many posts are kept (None = no cap). A
+    # multiple of the prompt's MAX_PROMPT_POSTS, so ranking has headroom.
+    reddit_max_total_posts: Optional[int] = 60
+
+    # GPT (Steps 3b-5)
+    gpt_model: str = "gpt-4o-mini"
+    gpt_temperature: float = 0.7
+    gpt_max_tokens: int = 500
+    use_candidate_table: bool = True
+    max_prompt_candidates: int = 20
+    spotify_prefetch_budget: int = 10
+
+    # Fast mode
+    fast_mode_candidate_pool: int = 20
+
+    # Spotify search and re-ranking (Step 6)
+    rerank_recommendations: bool = True
+    rerank_overgenerate: int = 2
+    gpt_spare_picks: int = 3
+    fill_max_followups: int = 1
+    spotify_search_concurrency: int = 5
+
+    # Deadlines
+    request_deadline_seconds: Optional[float] = 30.0
+    stage_budget_shares: StageShares = tuple(DEFAULT_STAGE_SHARES.items())
+
+    def __post_init__(self):
+        if self.mode not in PIPELINE_MODES:
+            raise ValueError(
+                f"Unknown mode '{self.mode}', expected one of {PIPELINE_MODES}"
+            )
+        # Accept a list/dict for convenience, store them hashable
+        if isinstance(self.subreddit_sources, list):
+            object.__setattr__(self, "subreddit_sources", tuple(self.subreddit_sources))
+        if isinstance(self.stage_budget_shares, dict):
+            object.__setattr__(
+                self, "stage_budget_shares", tuple(self.stage_budget_shares.items())
+            )
+
+    def override(self, **changes: Any) -> "PipelineSettings":
+        """
+        Copy with some settings changed
+
+        Raises:
+            ValueError: If a name is not a pipeline setting
+        """
+        unknown = set(changes) - {field.name for field in dataclasses.fields(self)}
+        if unknown:
+            raise ValueError(f"Unknown pipeline settings: {', '.join(sorted(unknown))}")
+        return dataclasses.replace(self, **changes)
+
+    @property
+    def fingerprint(self) -> str:
+        """Short digest of every setting, stable across processes (unlike hash())"""
+        return hashlib.sha1(repr(self).encode("utf-8")).hexdigest()[:12]
+
+
+# Presets are overrides of the base settings, picked per request
+PRESETS: Dict[str, Dict[str, Any]] = {
+    # Lowest latency: no GPT, fewer and shorter searches
+    "fast": {
+        "mode": "fast",
+        "num_random_tracks": 1,
+        "num_random_artists": 1,
+        "max_extra_subreddits": 1,
+        "reddit_or_group_size": 4,
+        "reddit_max_total_posts": 30,
+        "reddit_deadline_seconds": 4.0,
+        "request_deadline_seconds": 10.0,
+    },
+    "balanced": {},
+    # Slower, more evidence: every search finishes, bigger GPT pool
+    "thorough": {
+        "max_reddit_posts_per_query": 30,
+        "max_comments_per_post": 50,
+        "reddit_evidence_target": None,
+        "max_extra_subreddits": 3,
+        "reddit_or_group_size": 1,
+        "reddit_max_request_bytes": 2_000_000,
+        "reddit_max_total_posts": 120,
+        "reddit_deadline_seconds": 20.0,
+        "max_prompt_candidates": 30,
+        "rerank_overgenerate": 3,
+        "request_deadline_seconds": 60.0,
+    },
+}
+
+
+def resolve_settings(
+    base: PipelineSettings,
+    preset: Optional[str] = None,
+    presets: Optional[Dict[str, Dict[str, Any]]] = None,
+    **overrides: Any,
+) -> PipelineSettings:
+    """
+    Settings of one request: base, then the preset, then the overrides
+
+    Args:
+        base: Deployment defaults
+        preset: Preset name (None = base unchanged)
+        presets: Preset name -> overrides (defaults to PRESETS)
+        **overrides: Per-request setting changes
+
+    Returns:
+        PipelineSettings: The request's settings
+
+    Raises:
+        ValueError: On an unknown preset or setting name
+    """
+    presets = PRESETS if presets is None else presets
+    settings = base
+    if preset is not None:
+        if preset not in presets:
+            raise ValueError(
+                f"Unknown preset '{preset}', expected one of {tuple(presets)}"
+            )
+        settings = settings.override(**presets[preset])
+    return settings.override(**overrides) if overrides else settings
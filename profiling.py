@@ -0,0 +1,345 @@
+"""
+Profiling Module
+Opt-in, per-request profiling of the event loop thread:
+- Sampling profiler (a background thread samples the loop thread's stack,
+  so time in blocking calls, prompt building or JSON encoding shows up
+  where it is spent, and idle waits show up as the selector)
+- Loop-blocking watchdog: a heartbeat on the loop, the stack of whatever
+  keeps it from running longer than a threshold is captured
+- Output as collapsed stacks (flamegraph.pl, speedscope) or a speedscope file,
+  the oldest profiles deleted beyond a maximum count
+"""
+
+import asyncio
+import json
+import os
+import re
+import sys
+import threading
+import time
+import traceback
+import uuid
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+PROFILE_FORMATS: Tuple[str, ...] = ("collapsed", "speedscope")
+
+# File endings of one profile's files (see profile_request)
+PROFILE_SUFFIXES: Tuple[str, ...] = (".speedscope.json", ".folded", ".blocking.txt")
+
+# One stack frame: (function, file, first line)
+Frame = Tuple[str, str, int]
+
+
+def _stack(frame) -> Tuple[Frame, ...]:
+    # Root first, like collapsed stacks and speedscope expect
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append((code.co_name, code.co_filename, code.co_firstlineno))
+        frame = frame.f_back
+    return tuple(reversed(frames))
+
+
+def _frame_label(frame: Frame) -> str:
+    name, filename, line = frame
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+class SamplingProfiler:
+    """
+    Samples one thread's stack every `interval` seconds from a background
+    thread. Each sample is weighted with the time since the previous one,
+    so a sampler delayed by the GIL doesn't under-count long calls.
+    """
+
+    def __init__(self, thread_id: Optional[int] = None, interval: float = 0.005):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        # Stack -> sampled seconds
+        self.stacks: Counter = Counter()
+        self.num_samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(
+            target=self._run, name="sampling-profiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is not None:
+                self.stacks[_stack(frame)] += now - last
+                self.num_samples += 1
+            last = now
+
+    def hot_spots(self, top: int = 5) -> List[Tuple[str, float]]:
+        """Functions with the most self time (innermost frame), in seconds"""
+        self_time: Counter = Counter()
+        for stack, seconds in self.stacks.items():
+            if stack:
+                self_time[_frame_label(stack[-1])] += seconds
+        return self_time.most_common(top)
+
+    def collapsed(self) -> str:
+        """Collapsed stacks, one 'root;...;leaf microseconds' line per stack"""
+        lines = [
+            ";".join(_frame_label(frame) for frame in stack)
+            + f" {round(seconds * 1e6)}"
+            for stack, seconds in self.stacks.most_common()
+        ]
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self, name: str) -> Dict[str, Any]:
+        """Speedscope "sampled" profile (https://www.speedscope.app)"""
+        frame_ids: Dict[Frame, int] = {}
+        samples, weights = [], []
+        for stack, seconds in self.stacks.items():
+            samples.append(
+                [frame_ids.setdefault(frame, len(frame_ids)) for frame in stack]
+            )
+            weights.append(seconds * 1000)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {
+                "frames": [
+                    {"name": frame[0], "file": frame[1], "line": frame[2]}
+                    for frame in frame_ids
+                ]
+            },
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": name,
+                    "unit": "milliseconds",
+                    "startValue": 0,
+                    "endValue": sum(weights),
+                    "samples": samples,
+                    "weights": weights,
+                }
+            ],
+            "name": name,
+            "exporter": "redditjams",
+        }
+
+
+class LoopBlockingWatchdog:
+    """
+    Detects the event loop being blocked (a sync Spotify/OpenAI call, a
+    long CPU-bound step) and captures the stack that is blocking it
+
+    A heartbeat task on the loop ticks every `threshold / 4` seconds. A
+    watchdog thread that sees no tick for `threshold` seconds records the
+    loop thread's current stack, once per stall; the stall's full duration
+    is filled in when the heartbeat comes back.
+    """
+
+    def __init__(self, threshold: float = 0.1):
+        self.threshold = threshold
+        # {"seconds", "stack"} per stall, in order
+        self.events: List[Dict[str, Any]] = []
+        self._last_beat = time.perf_counter()
+        self._stalled: Optional[Dict[str, Any]] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._loop_thread_id = threading.get_ident()
+        # The heartbeat (loop thread) and the watchdog thread share the
+        # stall state and events
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Start watching the running loop (call from the loop)"""
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.perf_counter()
+        self._heartbeat = asyncio.get_running_loop().create_task(self._beat())
+        self._thread = threading.Thread(
+            target=self._watch, name="loop-watchdog", daemon=True
+        )
+        self._thread.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            try:
+                await self._heartbeat
+            except asyncio.CancelledError:
+                pass
+        if self._thread is not None:
+            self._thread.join()
+        self._tick()
+
+    def _tick(self) -> None:
+        with self._lock:
+            now = time.perf_counter()
+            stalled = self._stalled
+            if stalled is not None:
+                stalled["seconds"] = now - self._last_beat
+                self._stalled = None
+                if stalled["seconds"] < self.threshold:
+                    # The beat came right after the check, not a real stall
+                    self.events.remove(stalled)
+                    stalled = None
+            self._last_beat = now
+        if stalled is not None:
+            print(
+                f"   Event loop blocked for {stalled['seconds'] * 1000:.0f} ms in:\n"
+                + "".join(stalled["stack"][-5:])
+            )
+
+    async def _beat(self) -> None:
+        while True:
+            self._tick()
+            await asyncio.sleep(self.threshold / 4)
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.threshold / 4):
+            with self._lock:
+                if self._stalled is not None:
+                    continue
+                if time.perf_counter() - self._last_beat < self.threshold:
+                    continue
+                frame = sys._current_frames().get(self._loop_thread_id)
+                if frame is None:
+                    continue
+                event = {
+                    "seconds": time.perf_counter() - self._last_beat,
+                    "stack": traceback.format_stack(frame),
+                }
+                self.events.append(event)
+                self._stalled = event
+
+    def report(self) -> str:
+        """Readable list of the stalls, longest first"""
+        blocks = []
+        with self._lock:
+            events = list(self.events)
+        for event in sorted(events, key=lambda e: e["seconds"], reverse=True):
+            blocks.append(
+                f"Blocked for {event['seconds'] * 1000:.0f} ms:\n"
+                + "".join(event["stack"])
+            )
+        return "\n".join(blocks)
+
+
+def _safe_name(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", name).strip("_") or "request"
+
+
+def rotate_profiles(output_dir: str, max_profiles: int) -> int:
+    """
+    Delete the oldest profiles in output_dir beyond max_profiles (all
+    files of a profile go together)
+
+    Returns:
+        int: Number of profiles deleted
+    """
+    profiles: Dict[str, float] = {}
+    for entry in os.scandir(output_dir):
+        for suffix in PROFILE_SUFFIXES:
+            if entry.name.endswith(suffix):
+                base = entry.name[: -len(suffix)]
+                try:
+                    mtime = entry.stat().st_mtime
+                except FileNotFoundError:
+                    # Rotated away by another worker meanwhile
+                    continue
+                profiles[base] = max(profiles.get(base, 0.0), mtime)
+    excess = max(len(profiles) - max_profiles, 0)
+    for base in sorted(profiles, key=lambda b: (profiles[b], b))[:excess]:
+        for suffix in PROFILE_SUFFIXES:
+            try:
+                os.remove(os.path.join(output_dir, base + suffix))
+            except FileNotFoundError:
+                pass
+    return excess
+
+
+@asynccontextmanager
+async def profile_request(
+    name: str,
+    output_dir: str,
+    output_format: str = "speedscope",
+    interval: float = 0.005,
+    block_threshold: float = 0.1,
+    max_profiles: Optional[int] = 100,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Profile everything the event loop runs inside the block
+
+    Other requests served by the same loop at the same time show up in the
+    samples too, the profile is of the loop thread, not one coroutine.
+
+    Args:
+        name: Profile name, used in the file names
+        output_dir: Directory for the profile files (created if missing)
+        output_format: "speedscope" (.speedscope.json) or "collapsed" (.folded)
+        interval: Seconds between stack samples
+        block_threshold: Loop stalls at least this long are reported
+        max_profiles: Profiles kept in output_dir, the oldest are deleted
+                      (None = keep all)
+
+    Yields:
+        dict: Filled in when the block exits: "files", "seconds",
+              "samples", "blocking_events" and "hot_spots"
+    """
+    if output_format not in PROFILE_FORMATS:
+        raise ValueError(
+            f"Unknown profile format '{output_format}', expected one of {PROFILE_FORMATS}"
+        )
+    summary: Dict[str, Any] = {}
+    profiler = SamplingProfiler(interval=interval)
+    watchdog = LoopBlockingWatchdog(block_threshold)
+    start = time.perf_counter()
+    profiler.start()
+    watchdog.start()
+    try:
+        yield summary
+    finally:
+        await watchdog.stop()
+        profiler.stop()
+
+        os.makedirs(output_dir, exist_ok=True)
+        base = os.path.join(
+            output_dir,
+            f"{_safe_name(name)}-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}",
+        )
+        files = []
+        if output_format == "speedscope":
+            files.append(base + ".speedscope.json")
+            with open(files[-1], "w", encoding="utf-8") as f:
+                json.dump(profiler.speedscope(name), f)
+        else:
+            files.append(base + ".folded")
+            with open(files[-1], "w", encoding="utf-8") as f:
+                f.write(profiler.collapsed())
+        if watchdog.events:
+            files.append(base + ".blocking.txt")
+            with open(files[-1], "w", encoding="utf-8") as f:
+                f.write(watchdog.report())
+        if max_profiles is not None:
+            rotate_profiles(output_dir, max_profiles)
+
+        summary.update(
+            files=files,
+            seconds=time.perf_counter() - start,
+            samples=profiler.num_samples,
+            blocking_events=len(watchdog.events),
+            hot_spots=profiler.hot_spots(),
+        )
+        print(
+            f"Profile '{name}': {summary['samples']} samples, "
+            f"{summary['blocking_events']} loop stalls, written to {files[0]}"
+        )
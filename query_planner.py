@@ -0,0 +1,182 @@
+"""
+Query Planner Module
+Turns the per-seed Reddit queries of Step 3 into fewer live searches:
+- Track queries whose artist is searched anyway ride along with that search
+- Several tracks by the same artist share one artist query
+- Artist queries with a history of low yield are combined into one OR-query
+  (queries that never ran keep a search of their own)
+- Searches are ordered by expected yield (past hit rates from the index)
+"""
+
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+from reddit_index import artist_seed_query
+
+# Posts per search assumed for queries that never ran (same weight as one run),
+# used to order searches; only a real history gets a query OR-combined
+PRIOR_EXPECTED_YIELD: float = 3.0
+
+# Reddit search result limit per request
+MAX_SEARCH_LIMIT: int = 100
+
+
+class SeedSearch(NamedTuple):
+    """The search one seed would run on its own"""
+
+    seed: str  # artist or "Song - Artist", listed in the posts' "seeds"
+    query: str  # the seed's own query (its local index key)
+    subreddit: str
+    max_posts: int
+    artists: Tuple[str, ...]
+    is_artist: bool
+
+
+@dataclass
+class PlannedSearch:
+    """One live Reddit search covering one or more seeds"""
+
+    query: str
+    subreddit: str
+    max_posts: int
+    # Seeds whose own query this search answers
+    members: List[SeedSearch]
+    # Seeds that ride along (tracks of a searched artist), not stored
+    riders: List[str] = field(default_factory=list)
+    expected_yield: float = 0.0
+    # expected_yield comes from past runs, not the prior
+    has_history: bool = False
+
+    @property
+    def seeds(self) -> List[str]:
+        return [member.seed for member in self.members] + self.riders
+
+    def seeds_for(self, post_data: Dict) -> List[str]:
+        """Seeds a post found by this search counts for"""
+        if len(self.members) == 1:
+            return self.seeds
+        # OR-query: credit the artists the thread actually talks about
+        text = " ".join(
+            [post_data["title"], post_data["body"]]
+            + [comment["body"] for comment in post_data["comments"]]
+        ).lower()
+        matched = [
+            member.seed
+            for member in self.members
+            if any(artist.lower() in text for artist in member.artists)
+        ]
+        return (matched or [member.seed for member in self.members]) + self.riders
+
+    def member_posts(self, member: SeedSearch, posts: List[Dict]) -> List[Dict]:
+        """Posts of this search that count for one member (its co-mention edges)"""
+        return [post for post in posts if member.seed in self.seeds_for(post)]
+
+
+def or_query(members: List[SeedSearch]) -> str:
+    """One query matching any of several artists (Reddit search supports OR)"""
+    if len(members) == 1:
+        return members[0].query
+    names = " OR ".join('"' + member.seed.replace('"', "") + '"' for member in members)
+    return f"({names}) recommend similar"
+
+
+def plan_searches(
+    seeds: List[SeedSearch],
+    expected_yield: Callable[[str, str], Optional[float]],
+    or_group_size: int = 3,
+    solo_min_yield: float = 5.0,
+) -> List[PlannedSearch]:
+    """
+    Plan the live searches for the seeds the local index couldn't answer
+
+    Args:
+        seeds: Seed searches that missed the index
+        expected_yield: (query, subreddit) -> expected posts from past runs,
+                        None if the query never ran (no local index)
+        or_group_size: Maximum artists per OR-query (1 = never combine)
+        solo_min_yield: Artist queries expected to return at least this
+                        many posts keep a search of their own (as do
+                        queries without history)
+
+    Returns:
+        list: Planned searches, highest expected yield first
+    """
+    planned: List[PlannedSearch] = []
+    by_subreddit: Dict[str, List[SeedSearch]] = {}
+    for seed in seeds:
+        by_subreddit.setdefault(seed.subreddit, []).append(seed)
+
+    for subreddit, group in by_subreddit.items():
+        artist_searches: Dict[str, PlannedSearch] = {}
+        for seed in group:
+            if seed.is_artist:
+                artist_searches.setdefault(
+                    seed.seed.lower(),
+                    PlannedSearch(seed.query, subreddit, seed.max_posts, [seed]),
+                )
+
+        # Tracks by an artist that is searched anyway ride along with it,
+        # tracks sharing an artist share one artist query
+        tracks_by_artist: Dict[str, List[SeedSearch]] = {}
+        for seed in group:
+            if seed.is_artist:
+                continue
+            artist = seed.artists[0] if seed.artists else ""
+            search = artist_searches.get(artist.lower())
+            if search is not None:
+                search.riders.append(seed.seed)
+            else:
+                tracks_by_artist.setdefault(artist, []).append(seed)
+
+        track_searches = []
+        for artist, tracks in tracks_by_artist.items():
+            if len(tracks) == 1 or not artist:
+                track_searches += [
+                    PlannedSearch(track.query, subreddit, track.max_posts, [track])
+                    for track in tracks
+                ]
+                continue
+            artist_seed, query = artist_seed_query(artist)
+            shared = SeedSearch(
+                artist_seed, query, subreddit, tracks[0].max_posts, (artist,), True
+            )
+            artist_searches[artist.lower()] = PlannedSearch(
+                query,
+                subreddit,
+                shared.max_posts,
+                [shared],
+                riders=[track.seed for track in tracks],
+            )
+
+        # Strong artist queries run alone, the rest share OR-queries
+        for search in [*artist_searches.values(), *track_searches]:
+            estimate = expected_yield(search.query, subreddit)
+            search.has_history = estimate is not None
+            search.expected_yield = (
+                PRIOR_EXPECTED_YIELD if estimate is None else estimate
+            )
+        solo, weak = [], []
+        for search in sorted(
+            artist_searches.values(), key=lambda s: s.expected_yield, reverse=True
+        ):
+            combine = or_group_size > 1 and not search.riders and search.has_history
+            if combine and search.expected_yield < solo_min_yield:
+                weak.append(search)
+            else:
+                solo.append(search)
+        planned += solo + track_searches
+        for start in range(0, len(weak), or_group_size):
+            chunk = weak[start : start + or_group_size]
+            members = [s.members[0] for s in chunk]
+            planned.append(
+                PlannedSearch(
+                    or_query(members),
+                    subreddit,
+                    min(sum(s.max_posts for s in chunk), MAX_SEARCH_LIMIT),
+                    members,
+                    expected_yield=sum(s.expected_yield for s in chunk),
+                    has_history=True,
+                )
+            )
+
+    planned.sort(key=lambda s: s.expected_yield, reverse=True)
+    return planned
@@ -4,14 +4,44 @@ Handles Reddit authentication and operations:
 - Step 3: Search Reddit for recommendations (Async with parallel searches)
 """
 
-import asyncpraw
 import asyncio
-from typing import Dict, List, Any
+import sys
+from bisect import insort
+from contextlib import AsyncExitStack, aclosing
+from typing import TYPE_CHECKING, Dict, List, Any, AsyncIterator, Optional, Tuple
+from track_selection import make_rng, select_tracks, select_artists
+from reddit_index import (
+    FetchLimits,
+    RedditIndex,
+    artist_seed_query,
+    track_seed_query,
+)
+from resilience import Upstream
+from text_budget import (
+    DEFAULT_MAX_BODY_BYTES,
+    DEFAULT_MAX_COMMENT_BYTES,
+    MAX_AUTHOR_BYTES,
+    MAX_TITLE_BYTES,
+    text_bytes,
+    truncate_utf8,
+)
+from pipeline_settings import PipelineSettings
+from subreddit_sources import choose_subreddits
+from query_planner import (
+    PlannedSearch,
+    SeedSearch,
+    plan_searches,
+    PRIOR_EXPECTED_YIELD,
+)
+
+if TYPE_CHECKING:
+    # Only imported once a client is needed (index hits never need one)
+    import asyncpraw
 
 
 def initialize_reddit(
     client_id: str, client_secret: str, username: str, password: str, user_agent: str
-) -> asyncpraw.Reddit:
+) -> "asyncpraw.Reddit":
     """
     Initialize async Reddit API client
 
@@ -25,6 +55,8 @@ def initialize_reddit(
     Returns:
         Async Reddit client object
     """
+    import asyncpraw
+
     reddit = asyncpraw.Reddit(
         client_id=client_id,
         client_secret=client_secret,
@@ -37,31 +69,41 @@ def initialize_reddit(
     return reddit
 
 
-async def search_reddit_for_recommendations(
-    reddit: asyncpraw.Reddit,
+async def iter_reddit_recommendations(
+    reddit: "asyncpraw.Reddit",
     query: str,
     subreddit_name: str,
     max_posts: int = 20,
     max_comments: int = 30,
-) -> List[Dict[str, Any]]:
+    max_body_bytes: Optional[int] = DEFAULT_MAX_BODY_BYTES,
+    max_comment_bytes: Optional[int] = DEFAULT_MAX_COMMENT_BYTES,
+) -> AsyncIterator[Dict[str, Any]]:
     """
-    Search Reddit for recommendation posts/comments (Async)
+    Stream Reddit recommendation posts/comments as they are filtered (Async)
     Focus on: "recommend", "similar to", "if you like"
 
+    Closing the generator early stops fetching further posts/comments.
+    Search errors are raised (after the posts found so far were yielded).
+
+    Post and comment text is cut to its byte budget once the keyword
+    filters ran, so a yielded post holds at most
+    text_budget.post_bytes_bound(max_comments, ...) bytes of text.
+
     Args:
         reddit: Async Reddit client object
         query: Search query string
         subreddit_name: Name of subreddit to search
         max_posts: Maximum number of posts to retrieve
         max_comments: Maximum number of comments per post
+        max_body_bytes: UTF-8 bytes kept of each post body (None = all)
+        max_comment_bytes: UTF-8 bytes kept of each comment (None = all)
 
-    Returns:
-        list: List of recommendation posts with comments
+    Yields:
+        dict: Recommendation post with comments
     """
-    subreddit = await reddit.subreddit(subreddit_name)
-    recommendations = []
-
     try:
+        subreddit = await reddit.subreddit(subreddit_name)
+
         # Search for posts
         search_results = subreddit.search(query, limit=max_posts)
 
@@ -81,8 +123,8 @@ async def search_reddit_for_recommendations(
                 ]
             ):
                 post_data = {
-                    "title": post.title,
-                    "body": post.selftext,
+                    "title": truncate_utf8(post.title, MAX_TITLE_BYTES),
+                    "body": truncate_utf8(post.selftext, max_body_bytes),
                     "score": post.score,
                     "url": f"https://reddit.com{post.permalink}",
                     "comments": [],
@@ -107,13 +149,22 @@ async def search_reddit_for_recommendations(
                                     "try",
                                 ]
                             ):
+                                # The same users comment across many
+                                # threads, share one string per name
+                                author = (
+                                    str(comment.author)
+                                    if comment.author
+                                    else "[deleted]"
+                                )
                                 post_data["comments"].append(
                                     {
-                                        "body": comment.body,
+                                        "body": truncate_utf8(
+                                            comment.body, max_comment_bytes
+                                        ),
                                         "score": comment.score,
-                                        "author": str(comment.author)
-                                        if comment.author
-                                        else "[deleted]",
+                                        "author": sys.intern(
+                                            truncate_utf8(author, MAX_AUTHOR_BYTES)
+                                        ),
                                     }
                                 )
                         except AttributeError:
@@ -125,12 +176,194 @@ async def search_reddit_for_recommendations(
                 if post_data["comments"] or any(
                     keyword in text for keyword in ["recommend", "similar"]
                 ):
-                    recommendations.append(post_data)
+                    yield post_data
 
     except Exception as e:
-        print(f"   Error searching Reddit: {e}")
+        # Re-raised so callers can tell a failed search from an empty one
+        print(f"   Error searching Reddit for '{query}': {e}")
+        raise
+
+
+async def search_reddit_for_recommendations(
+    reddit: "asyncpraw.Reddit",
+    query: str,
+    subreddit_name: str,
+    max_posts: int = 20,
+    max_comments: int = 30,
+    max_body_bytes: Optional[int] = DEFAULT_MAX_BODY_BYTES,
+    max_comment_bytes: Optional[int] = DEFAULT_MAX_COMMENT_BYTES,
+) -> List[Dict[str, Any]]:
+    """
+    Search Reddit for recommendation posts/comments (Async)
+    Collects everything iter_reddit_recommendations yields for one query
+    (search errors are raised)
+
+    Args:
+        reddit: Async Reddit client object
+        query: Search query string
+        subreddit_name: Name of subreddit to search
+        max_posts: Maximum number of posts to retrieve
+        max_comments: Maximum number of comments per post
+        max_body_bytes: UTF-8 bytes kept of each post body (None = all)
+        max_comment_bytes: UTF-8 bytes kept of each comment (None = all)
+
+    Returns:
+        list: List of recommendation posts with comments
+    """
+    return [
+        post_data
+        async for post_data in iter_reddit_recommendations(
+            reddit,
+            query,
+            subreddit_name,
+            max_posts,
+            max_comments,
+            max_body_bytes,
+            max_comment_bytes,
+        )
+    ]
+
+
+def rank_reddit_post(post_data: Dict[str, Any]) -> int:
+    """Rank a recommendation post by its score plus its kept comments' scores"""
+    return post_data["score"] + sum(
+        comment["score"] for comment in post_data["comments"]
+    )
+
+
+async def merge_reddit_streams(
+    streams: List[AsyncIterator[Dict[str, Any]]]
+) -> AsyncIterator[Tuple[int, Optional[Dict[str, Any]]]]:
+    """
+    Run several post streams concurrently and yield posts in arrival order
+
+    Closing the merged generator cancels every stream that is still running.
+
+    Args:
+        streams: Post streams (e.g. from iter_reddit_recommendations)
+
+    Yields:
+        tuple: (stream index, post), post is None once that stream is
+               exhausted, or the exception a failed stream raised
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def pump(idx: int, stream: AsyncIterator[Dict[str, Any]]) -> None:
+        end = None
+        try:
+            async with aclosing(stream):
+                async for post_data in stream:
+                    queue.put_nowait((idx, post_data))
+        except Exception as e:
+            end = e
+        finally:
+            queue.put_nowait((idx, end))
+
+    tasks = [
+        asyncio.create_task(pump(idx, stream)) for idx, stream in enumerate(streams)
+    ]
+    remaining = len(tasks)
 
-    return recommendations
+    try:
+        while remaining:
+            idx, post_data = await queue.get()
+            if post_data is None or isinstance(post_data, Exception):
+                remaining -= 1
+            yield idx, post_data
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _iter_posts(posts: List[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+    """Stream already available posts (e.g. local index hits)"""
+    for post_data in posts:
+        yield post_data
+
+
+async def _iter_guarded(
+    stream: AsyncIterator[Dict[str, Any]], upstream: Upstream
+) -> AsyncIterator[Dict[str, Any]]:
+    """Run a live search stream under the Reddit circuit breaker and bulkhead"""
+    async with upstream.guard():
+        async with aclosing(stream):
+            async for post_data in stream:
+                yield post_data
+
+
+async def _iter_and_index(
+    stream: AsyncIterator[Dict[str, Any]],
+    index: RedditIndex,
+    search: PlannedSearch,
+    limits: FetchLimits,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Pass posts through and, if the search completes, store them in the
+    index under the search's query. An OR-query's posts are stored under
+    the OR-query, never under its members' own queries (their lookups and
+    yields only reflect their own searches); members get the co-mention
+    edges of the posts that count for them.
+    """
+    posts = []
+    async with aclosing(stream):
+        async for post_data in stream:
+            posts.append(post_data)
+            yield post_data
+    # Searches cut short (budget, deadline) never get here, so partial
+    # results are never cached as complete ones
+    # SQLite writes run in a worker thread, off the event loop
+    if len(search.members) == 1:
+        member = search.members[0]
+        await asyncio.to_thread(
+            index.store_query_results,
+            search.query,
+            search.subreddit,
+            posts,
+            member.seed,
+            limits,
+        )
+        return
+    await asyncio.to_thread(
+        index.store_query_results, search.query, search.subreddit, posts, None, limits
+    )
+    for member in search.members:
+        await asyncio.to_thread(
+            index.store_edges, member.seed, search.member_posts(member, posts), limits
+        )
+
+
+def fetch_limits(settings: PipelineSettings, max_posts: int) -> FetchLimits:
+    """Limits a search for max_posts posts is fetched with under these settings"""
+    return FetchLimits(
+        max_posts,
+        settings.max_comments_per_post,
+        settings.reddit_max_body_bytes,
+        settings.reddit_max_comment_bytes,
+    )
+
+
+def count_strong_evidence(post_data: Dict[str, Any], min_score: int) -> int:
+    """Count the post and its kept comments that score at least min_score"""
+    return int(post_data["score"] >= min_score) + sum(
+        1 for comment in post_data["comments"] if comment["score"] >= min_score
+    )
+
+
+def _negative_rank(post_data: Dict[str, Any]) -> float:
+    """Sort key that keeps the best ranked post first (weighted by its subreddit)"""
+    return -rank_reddit_post(post_data) * post_data.get("source_weight", 1.0)
+
+
+def _content_key(post_data: Dict[str, Any]) -> Optional[Tuple[str, str]]:
+    """Title + body of a text post, the same for its crossposts (None if no body)"""
+    if not post_data["body"].strip():
+        # Short title-only posts ("Songs like X?") are too generic to match on
+        return None
+    return (
+        " ".join(post_data["title"].lower().split()),
+        " ".join(post_data["body"].lower().split())[:500],
+    )
 
 
 async def get_reddit_recommendations(
@@ -140,15 +373,12 @@ async def get_reddit_recommendations(
     password: str,
     user_agent: str,
     tracks_data: List[Dict[str, Any]],
-    subreddit_name: str,
-    max_reddit_posts_per_query: int = 20,
-    max_comments_per_post: int = 30,
-    num_top_tracks: int = 3,
-    num_bottom_tracks: int = 3,
-    num_random_tracks: int = 3,
-    num_top_artists: int = 2,
-    num_bottom_artists: int = 2,
-    num_random_artists: int = 2,
+    settings: Optional[PipelineSettings] = None,
+    max_total_posts: Optional[int] = None,
+    deadline: Optional[float] = None,
+    index: Optional[RedditIndex] = None,
+    upstream: Optional[Upstream] = None,
+    reddit: Any = None,
 ) -> Dict[str, Any]:
     """
     Step 3: Search Reddit for Recommendations (Async with parallel searches)
@@ -160,164 +390,340 @@ async def get_reddit_recommendations(
         password: Reddit password
         user_agent: Reddit user agent
         tracks_data: List of track dictionaries from Spotify
-        subreddit_name: Name of subreddit to search
-        max_reddit_posts_per_query: Maximum posts to fetch per query
-        max_comments_per_post: Maximum comments per post
-        num_top_tracks: Number of top (most popular) tracks to select
-        num_bottom_tracks: Number of bottom (least popular) tracks to select
-        num_random_tracks: Number of random tracks to select
-        num_top_artists: Number of top artists to select
-        num_bottom_artists: Number of bottom artists to select
-        num_random_artists: Number of random artists to select
+        settings: Subreddit, per-query limits, track/artist selection and
+                  evidence target (defaults to PipelineSettings())
+        max_total_posts: Stop all searches once this many unique posts are
+                         collected (e.g. the prompt budget), None = no limit
+        deadline: Seconds to wait for searches before returning partial
+                  results, None = wait for every search
+        index: Local RedditIndex answered first, live Reddit is only searched
+               for misses (and their complete results are written back);
+               entries older than settings.reddit_index_max_age_seconds
+               count as misses
+        upstream: Reddit circuit breaker/bulkhead. While its circuit is open,
+                  live Reddit is skipped and misses fall back to index entries
+                  of any age (cached evidence)
+        reddit: Open Reddit client to search with (snapshot replay, tests),
+                None = log in with the credentials when a search is needed
 
     Returns:
-        dict: Contains all_reddit_data, selected_tracks, and selected_artists
+        dict: Contains all_reddit_data (ranked best first by score times
+              source weight, each post lists the seeds - artist or
+              "Song - Artist" - whose queries found it under "seeds", and its
+              "subreddit" and "source_weight"), selected_tracks,
+              selected_artists, complete (every search finished),
+              completed_queries, failed_queries, total_queries, subreddits
+              (posts kept per subreddit), text_bytes (UTF-8 bytes of
+              the kept posts' text) and stop_reason
     """
+    settings = settings or PipelineSettings()
+    subreddit_name = settings.subreddit_name
+
     print("=" * 80)
     print("SEARCHING REDDIT FOR RECOMMENDATIONS (PARALLEL)")
     print("=" * 80)
 
-    # Initialize Reddit client within async context
-    async with asyncpraw.Reddit(
-        client_id=client_id,
-        client_secret=client_secret,
-        username=username,
-        password=password,
-        user_agent=user_agent,
-    ) as reddit:
-        print("Async Reddit API initialized")
-
-        # Import random for random selection
-        import random
-
-        # Get diverse track selection: top, bottom, and random
-        sorted_tracks = sorted(tracks_data, key=lambda x: x["popularity"], reverse=True)
-
-        # Check if playlist has enough tracks
-        total_tracks_needed = num_top_tracks + num_bottom_tracks + num_random_tracks
-        if len(sorted_tracks) < total_tracks_needed:
-            print(
-                f"   Warning: Playlist has only {len(sorted_tracks)} tracks, need {total_tracks_needed} for diverse selection"
-            )
-            print(f"   Using available tracks...")
-            selected_tracks = sorted_tracks
-        else:
-            # Top tracks
-            top_tracks = sorted_tracks[:num_top_tracks]
-            # Bottom tracks
-            bottom_tracks = sorted_tracks[-num_bottom_tracks:]
-            # Random tracks (excluding top and bottom)
-            middle_tracks = sorted_tracks[
-                num_top_tracks : -num_bottom_tracks if num_bottom_tracks > 0 else None
-            ]
-            if len(middle_tracks) >= num_random_tracks:
-                random_tracks = random.sample(middle_tracks, num_random_tracks)
-            else:
-                random_tracks = middle_tracks
-
-            selected_tracks = top_tracks + bottom_tracks + random_tracks
-
-        # Get diverse artist selection: top, bottom, and random
-        all_artists_list = list(
-            set([artist for track in tracks_data for artist in track["artists"]])
+    # The Reddit client is only opened if some query misses the local index
+    async with AsyncExitStack() as stack:
+        # Get diverse track and artist selection: top, bottom, and random
+        rng = make_rng(settings.selection_seed)
+        selected_tracks = select_tracks(
+            tracks_data,
+            settings.num_top_tracks,
+            settings.num_bottom_tracks,
+            settings.num_random_tracks,
+            rng,
+        )
+        selected_artists = select_artists(
+            tracks_data,
+            settings.num_top_artists,
+            settings.num_bottom_artists,
+            settings.num_random_artists,
+            rng,
         )
-
-        total_artists_needed = num_top_artists + num_bottom_artists + num_random_artists
-        if len(all_artists_list) < total_artists_needed:
-            print(
-                f"   Warning: Playlist has only {len(all_artists_list)} unique artists, need {total_artists_needed} for diverse selection"
-            )
-            print(f"   Using available artists...")
-            selected_artists = all_artists_list
-        else:
-            # For artists, we don't have popularity, so we'll use first, last, and random from the list
-            top_artists = all_artists_list[:num_top_artists]
-            bottom_artists = all_artists_list[-num_bottom_artists:]
-            middle_artists = all_artists_list[
-                num_top_artists : -num_bottom_artists
-                if num_bottom_artists > 0
-                else None
-            ]
-            if len(middle_artists) >= num_random_artists:
-                random_artists = random.sample(middle_artists, num_random_artists)
-            else:
-                random_artists = middle_artists
-
-            selected_artists = top_artists + bottom_artists + random_artists
 
         print(f"\nSearching for recommendations based on DIVERSE selection:")
         print(
-            f"   - {len(selected_tracks)} tracks (top {num_top_tracks} + bottom {num_bottom_tracks} + random {num_random_tracks})"
+            f"   - {len(selected_tracks)} tracks (top {settings.num_top_tracks} + bottom {settings.num_bottom_tracks} + random {settings.num_random_tracks})"
         )
         print(
-            f"   - {len(selected_artists)} artists (top {num_top_artists} + bottom {num_bottom_artists} + random {num_random_artists})"
+            f"   - {len(selected_artists)} artists (top {settings.num_top_artists} + bottom {settings.num_bottom_artists} + random {settings.num_random_artists})"
         )
         print(f"   - Running ALL searches in parallel...")
         print()
 
-        # Create all search tasks for tracks
-        track_search_tasks = []
+        # Build one query per selected track and artist
+        seed_queries = []
+        seed_artists = []
         for idx, track in enumerate(selected_tracks, 1):
-            query = f"{track['name']} {track['artist_names']} recommend"
+            seed_queries.append(track_seed_query(track))
+            seed_artists.append((tuple(track["artists"]), False))
             print(f"[Track {idx}/{len(selected_tracks)}] Queuing: '{track['name']}'")
-            task = search_reddit_for_recommendations(
-                reddit,
-                query,
-                subreddit_name,
-                max_reddit_posts_per_query,
-                max_comments_per_post,
-            )
-            track_search_tasks.append(task)
-
-        # Create all search tasks for artists
-        artist_search_tasks = []
         for idx, artist in enumerate(selected_artists, 1):
-            query = f"{artist} recommend similar"
+            seed_queries.append(artist_seed_query(artist))
+            seed_artists.append(((artist,), True))
             print(f"[Artist {idx}/{len(selected_artists)}] Queuing: '{artist}'")
-            task = search_reddit_for_recommendations(
-                reddit,
+        artist_queries = seed_queries[len(selected_tracks) :]
+
+        # Fan out the artist queries to extra subreddits picked from the
+        # playlist's artists, they all run in the same round as the main ones.
+        # Index reads run in a worker thread, they can wait on a write's lock
+        extra_sources = choose_subreddits(
+            settings.subreddit_sources,
+            {artist for track in tracks_data for artist in track["artists"]},
+            settings.max_extra_subreddits,
+            subreddit_name,
+            (
+                await asyncio.to_thread(
+                    index.subreddit_yield, [query for _, query in artist_queries]
+                )
+                if index
+                else None
+            ),
+        )
+        source_weights = {subreddit_name: 1.0}
+        source_caps: Dict[str, Optional[int]] = {subreddit_name: None}
+        seeds = [
+            SeedSearch(
+                seed_name,
                 query,
                 subreddit_name,
-                max_reddit_posts_per_query,
-                max_comments_per_post,
+                settings.max_reddit_posts_per_query,
+                artists,
+                is_artist,
+            )
+            for (seed_name, query), (artists, is_artist) in zip(
+                seed_queries, seed_artists
+            )
+        ]
+        for source in extra_sources:
+            source_weights[source.name] = source.weight
+            source_caps[source.name] = source.max_posts
+            seeds += [
+                seed._replace(
+                    subreddit=source.name,
+                    max_posts=min(source.max_posts, seed.max_posts),
+                )
+                for seed in seeds[: len(seed_queries)]
+                if seed.is_artist
+            ]
+        if extra_sources:
+            print(
+                f"Also searching {', '.join(f'r/{s.name}' for s in extra_sources)} (artist queries)"
             )
-            artist_search_tasks.append(task)
 
-        print(
-            f"\nExecuting {len(track_search_tasks) + len(artist_search_tasks)} searches in parallel..."
+        # Answer what we can from the local index first
+        cached_results = (
+            await asyncio.to_thread(
+                lambda: [
+                    index.lookup(
+                        seed.query,
+                        seed.subreddit,
+                        settings.reddit_index_max_age_seconds,
+                        fetch_limits(settings, seed.max_posts),
+                    )
+                    for seed in seeds
+                ]
+            )
+            if index
+            else [None] * len(seeds)
         )
-        print()
-
-        # Run ALL searches in parallel (tracks + artists together)
-        all_results = await asyncio.gather(*track_search_tasks, *artist_search_tasks)
+        num_misses = sum(1 for cached in cached_results if cached is None)
+        if index is not None:
+            print(f"\nLocal index: {len(seeds) - num_misses} hits, {num_misses} misses")
+
+        # Reddit is down: answer misses from stale index entries, skip the rest
+        skipped = [False] * len(seeds)
+        if num_misses and upstream is not None and not upstream.available:
+            for idx, seed in enumerate(seeds):
+                if cached_results[idx] is None and index is not None:
+                    # Any run will do, cut down to this request's limits
+                    cached = await asyncio.to_thread(
+                        index.lookup, seed.query, seed.subreddit
+                    )
+                    if cached is not None:
+                        cached = fetch_limits(settings, seed.max_posts).apply(cached)
+                    cached_results[idx] = cached
+                skipped[idx] = cached_results[idx] is None
+            num_misses = 0
+            print(
+                f"Reddit circuit open: using cached evidence, skipping {sum(skipped)} searches"
+            )
 
-        # Flatten all results and show individual search results
-        all_reddit_data = []
+        # One stream per index hit (or skipped seed), then the planned live
+        # searches covering all misses with as few Reddit calls as possible
+        searches: List[PlannedSearch] = []
+        streams = []
+        stream_skipped = []
+        for seed, cached, skip in zip(seeds, cached_results, skipped):
+            if cached is not None or skip:
+                searches.append(
+                    PlannedSearch(seed.query, seed.subreddit, seed.max_posts, [seed])
+                )
+                streams.append(_iter_posts(cached or []))
+                stream_skipped.append(skip)
+        # The planner reads past yields from the index, so it runs off the loop
+        planned = await asyncio.to_thread(
+            plan_searches,
+            [
+                seed
+                for seed, cached, skip in zip(seeds, cached_results, skipped)
+                if cached is None and not skip
+            ],
+            lambda query, subreddit: (
+                index.expected_yield(
+                    query, subreddit, PRIOR_EXPECTED_YIELD, require_history=True
+                )
+                if index
+                else None
+            ),
+            settings.reddit_or_group_size,
+            settings.reddit_solo_min_yield,
+        )
+        if num_misses:
+            print(
+                f"Query planner: {num_misses} missed queries -> {len(planned)} live searches"
+            )
 
-        # Display track search results
-        for idx, results in enumerate(all_results[: len(selected_tracks)], 1):
-            track_name = selected_tracks[idx - 1]["name"]
-            if results:
-                all_reddit_data.extend(results)
-                print(f"[{idx}/{len(selected_tracks)}] Searching: '{track_name}'")
-                print(f"         Found {len(results)} recommendation posts/threads")
-            else:
-                print(f"[{idx}/{len(selected_tracks)}] Searching: '{track_name}'")
-                print(f"         No recommendations found")
+        if planned and reddit is None:
+            import asyncpraw
+
+            # Initialize Reddit client within async context
+            reddit = await stack.enter_async_context(
+                asyncpraw.Reddit(
+                    client_id=client_id,
+                    client_secret=client_secret,
+                    username=username,
+                    password=password,
+                    user_agent=user_agent,
+                )
+            )
+            print("Async Reddit API initialized")
 
-        # Display artist search results
-        for idx, results in enumerate(all_results[len(selected_tracks) :], 1):
-            artist_name = selected_artists[idx - 1]
-            if results:
-                all_reddit_data.extend(results)
-                print(
-                    f"[Artist {idx}/{len(selected_artists)}] Searching: '{artist_name}'"
+        # Highest expected yield first, so the bulkhead starts those first
+        for search in planned:
+            stream = iter_reddit_recommendations(
+                reddit,
+                search.query,
+                search.subreddit,
+                search.max_posts,
+                settings.max_comments_per_post,
+                settings.reddit_max_body_bytes,
+                settings.reddit_max_comment_bytes,
+            )
+            if upstream is not None:
+                stream = _iter_guarded(stream, upstream)
+            if index is not None:
+                stream = _iter_and_index(
+                    stream, index, search, fetch_limits(settings, search.max_posts)
                 )
-                print(f"         Found {len(results)} recommendation posts/threads")
+            searches.append(search)
+            streams.append(stream)
+            stream_skipped.append(False)
+
+        print(f"\nExecuting {len(planned)} searches in parallel...")
+        if max_total_posts is not None:
+            print(f"   Stopping once {max_total_posts} posts are collected")
+        if settings.reddit_evidence_target is not None:
+            print(
+                f"   Stopping once {settings.reddit_evidence_target} posts/comments score {settings.reddit_min_evidence_score}+"
+            )
+        if deadline is not None:
+            print(f"   Deadline: {deadline:.1f}s")
+        if settings.reddit_max_request_bytes is not None:
+            print(
+                f"   Stopping once {settings.reddit_max_request_bytes // 1000} KB of post/comment text are kept"
+            )
+        print()
+
+        # Run ALL searches in parallel (tracks + artists, every subreddit)
+        # and rank posts as they stream in, best first
+        all_reddit_data = []
+        known_posts = {}
+        kept_per_source = dict.fromkeys(source_weights, 0)
+        found_per_search = [0] * len(searches)
+        completed_queries = 0
+        failed_queries = sum(skipped)
+        evidence_found = 0
+        kept_text_bytes = 0
+        stop_reason = "all_queries_done"
+
+        try:
+            async with asyncio.timeout(deadline):
+                async with aclosing(merge_reddit_streams(streams)) as merged:
+                    async for idx, post_data in merged:
+                        if post_data is None:
+                            if not stream_skipped[idx]:
+                                completed_queries += 1
+                            continue
+                        if isinstance(post_data, Exception):
+                            failed_queries += 1
+                            continue
+                        # Posts found by several queries or crossposted to
+                        # several subreddits are kept once, with every seed
+                        # (track/artist) that led to them
+                        search = searches[idx]
+                        post_seeds = search.seeds_for(post_data)
+                        known_post = known_posts.get(
+                            post_data["url"]
+                        ) or known_posts.get(_content_key(post_data))
+                        if known_post is not None:
+                            for seed_name in post_seeds:
+                                if seed_name not in known_post["seeds"]:
+                                    known_post["seeds"].append(seed_name)
+                            continue
+                        cap = source_caps[search.subreddit]
+                        if cap is not None and kept_per_source[search.subreddit] >= cap:
+                            continue
+                        # Copy, the stored index entry shouldn't carry the
+                        # per-request annotations
+                        post_data = dict(
+                            post_data,
+                            seeds=post_seeds,
+                            subreddit=search.subreddit,
+                            source_weight=source_weights[search.subreddit],
+                        )
+                        known_posts[post_data["url"]] = post_data
+                        content_key = _content_key(post_data)
+                        if content_key is not None:
+                            known_posts[content_key] = post_data
+                        kept_per_source[search.subreddit] += 1
+                        found_per_search[idx] += 1
+                        insort(all_reddit_data, post_data, key=_negative_rank)
+                        evidence_found += count_strong_evidence(
+                            post_data, settings.reddit_min_evidence_score
+                        )
+                        kept_text_bytes += text_bytes(post_data)
+
+                        # Leaving the block cancels the other searches
+                        if max_total_posts is not None and (
+                            len(all_reddit_data) >= max_total_posts
+                        ):
+                            stop_reason = "post_budget"
+                            break
+                        if settings.reddit_evidence_target is not None and (
+                            evidence_found >= settings.reddit_evidence_target
+                        ):
+                            stop_reason = "evidence_target"
+                            break
+                        if settings.reddit_max_request_bytes is not None and (
+                            kept_text_bytes >= settings.reddit_max_request_bytes
+                        ):
+                            stop_reason = "text_budget"
+                            break
+        except TimeoutError:
+            stop_reason = "deadline"
+            print(f"   Deadline reached, using partial results")
+
+        # Display individual search results
+        for idx, (search, found) in enumerate(zip(searches, found_per_search), 1):
+            source = "live" if search in planned else "index"
+            print(
+                f"[{idx}/{len(searches)}] r/{search.subreddit} '{search.query}' ({source})"
+            )
+            if found:
+                print(f"         Found {found} recommendation posts/threads")
             else:
-                print(
-                    f"[Artist {idx}/{len(selected_artists)}] Searching: '{artist_name}'"
-                )
                 print(f"         No recommendations found")
 
         print(
@@ -326,9 +732,29 @@ async def get_reddit_recommendations(
         print(
             f"   Total comments: {sum(len(post['comments']) for post in all_reddit_data)}"
         )
+        print(f"   Text kept: {kept_text_bytes / 1000:.1f} KB")
+        if extra_sources:
+            print(
+                "   Posts per subreddit: "
+                + ", ".join(
+                    f"r/{name} {kept}" for name, kept in kept_per_source.items()
+                )
+            )
+        print(
+            f"   Completed searches: {completed_queries}/{len(searches)} (stopped by: {stop_reason})"
+        )
+        if failed_queries:
+            print(f"   Failed/skipped searches: {failed_queries}")
 
     return {
         "all_reddit_data": all_reddit_data,
         "top_tracks": selected_tracks,
         "all_artists": selected_artists,
+        "complete": completed_queries == len(searches),
+        "completed_queries": completed_queries,
+        "failed_queries": failed_queries,
+        "total_queries": len(searches),
+        "subreddits": kept_per_source,
+        "text_bytes": kept_text_bytes,
+        "stop_reason": stop_reason,
     }
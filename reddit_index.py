@@ -0,0 +1,642 @@
+"""
+Reddit Index Module
+Local recommendation knowledge base built from Reddit threads:
+- Stores recommendation posts/comments per search query in SQLite,
+  post and comment text zlib-compressed
+- Mines (seed artist/track -> mentioned artist/track) co-mention edges,
+  kept per post so storing a thread again never counts it twice
+- Co-mention candidates from threads a request didn't fetch itself
+- Tracks how many posts each query returned (for the query planner)
+- Answers Step 3 queries locally so only cache misses hit live Reddit,
+  from runs fetched with at least the request's limits (FetchLimits)
+- Background ingestion job (run this file to ingest artists/playlists)
+"""
+
+import asyncio
+import json
+import sqlite3
+import sys
+import threading
+import time
+from typing import Dict, List, Any, Iterable, NamedTuple, Optional, Tuple
+from entity_extraction import extract_mentions, iter_weighted_texts
+from text_budget import (
+    DEFAULT_MAX_BODY_BYTES,
+    DEFAULT_MAX_COMMENT_BYTES,
+    compress_text,
+    decompress_text,
+    truncate_utf8,
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    url TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    body TEXT NOT NULL,
+    score INTEGER NOT NULL,
+    limits TEXT
+);
+CREATE TABLE IF NOT EXISTS comments (
+    post_url TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    body TEXT NOT NULL,
+    score INTEGER NOT NULL,
+    author TEXT NOT NULL,
+    PRIMARY KEY (post_url, position)
+);
+CREATE TABLE IF NOT EXISTS query_runs (
+    query TEXT NOT NULL,
+    subreddit TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    limits TEXT,
+    PRIMARY KEY (query, subreddit)
+);
+CREATE TABLE IF NOT EXISTS query_stats (
+    query TEXT NOT NULL,
+    subreddit TEXT NOT NULL,
+    runs INTEGER NOT NULL,
+    posts INTEGER NOT NULL,
+    PRIMARY KEY (query, subreddit)
+);
+CREATE TABLE IF NOT EXISTS query_posts (
+    query TEXT NOT NULL,
+    subreddit TEXT NOT NULL,
+    post_url TEXT NOT NULL,
+    PRIMARY KEY (query, subreddit, post_url)
+);
+CREATE TABLE IF NOT EXISTS post_edges (
+    seed TEXT NOT NULL,
+    target TEXT NOT NULL,
+    post_url TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    score REAL NOT NULL,
+    mentions INTEGER NOT NULL,
+    PRIMARY KEY (seed, target, post_url)
+);
+CREATE INDEX IF NOT EXISTS post_edges_by_post ON post_edges (post_url, seed);
+DROP TABLE IF EXISTS edges;
+DROP TABLE IF EXISTS posts_fts;
+"""
+
+
+class FetchLimits(NamedTuple):
+    """
+    Limits a search's posts were fetched with (None = no limit). Stored
+    with each query run: results depend on them, so a request only reuses
+    runs fetched with at least its own limits.
+    """
+
+    max_posts: Optional[int]
+    max_comments: Optional[int]
+    max_body_bytes: Optional[int]
+    max_comment_bytes: Optional[int]
+
+    def covers(self, other: "FetchLimits") -> bool:
+        """Whether a run fetched with these limits can answer `other`"""
+        return all(
+            mine is None or (theirs is not None and mine >= theirs)
+            for mine, theirs in zip(self, other)
+        )
+
+    def apply(self, posts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Cut posts fetched with larger limits down to these"""
+        return [
+            dict(
+                post_data,
+                body=truncate_utf8(post_data["body"], self.max_body_bytes),
+                comments=[
+                    dict(
+                        comment,
+                        body=truncate_utf8(comment["body"], self.max_comment_bytes),
+                    )
+                    for comment in post_data["comments"][: self.max_comments]
+                ],
+            )
+            for post_data in posts[: self.max_posts]
+        ]
+
+
+class RedditIndex:
+    """
+    SQLite store of Reddit recommendation threads and co-mention edges
+
+    Post and comment bodies are stored as zlib BLOBs (SQLite keeps BLOBs
+    as is in the TEXT columns, and plain text written by older versions
+    still reads back). There is no full-text index: lookups go by query,
+    and candidates by co-mention edges.
+    """
+
+    def __init__(self, path: str = "reddit_index.db"):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        # Reads and writes run in worker threads (asyncio.to_thread), one at
+        # a time so their transactions don't interleave on the shared
+        # connection and the event loop never waits for the lock
+        self._lock = threading.RLock()
+        with self._lock:
+            self.conn.executescript(SCHEMA)
+            # Indexes created before runs recorded their fetch limits
+            columns = {
+                row[1] for row in self.conn.execute("PRAGMA table_info(query_runs)")
+            }
+            if "limits" not in columns:
+                self.conn.execute("ALTER TABLE query_runs ADD COLUMN limits TEXT")
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(posts)")}
+            if "limits" not in columns:
+                self.conn.execute("ALTER TABLE posts ADD COLUMN limits TEXT")
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def store_query_results(
+        self,
+        query: str,
+        subreddit_name: str,
+        posts: List[Dict[str, Any]],
+        seed: Optional[str] = None,
+        limits: Optional[FetchLimits] = None,
+    ) -> None:
+        """
+        Store the posts one search query returned (replaces older results).
+        A post already stored from a deeper fetch (larger limits, or more
+        comments if either side's limits are unknown) is kept as is, along
+        with its co-mention edges.
+
+        Args:
+            query: Search query string
+            subreddit_name: Subreddit that was searched
+            posts: Posts from search_reddit_for_recommendations
+            seed: Artist or "Song - Artist" the query was built from, used
+                  for co-mention edges (no edges if None)
+            limits: Limits the posts were fetched with (None = unknown, the
+                    run then only answers lookups without limits)
+        """
+        # Compression and mention extraction run before taking the lock, so
+        # the transaction (and readers waiting on it) only covers the writes
+        rows = [self._post_rows(post_data, limits) for post_data in posts]
+        edges = [
+            self._edge_rows(seed, post_data) if seed else None for post_data in posts
+        ]
+        with self._lock, self.conn:
+            self.conn.execute(
+                "DELETE FROM query_posts WHERE query = ? AND subreddit = ?",
+                (query, subreddit_name),
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO query_runs VALUES (?, ?, ?, ?)",
+                (
+                    query,
+                    subreddit_name,
+                    time.time(),
+                    None if limits is None else json.dumps(limits),
+                ),
+            )
+            self.conn.execute(
+                """
+                INSERT INTO query_stats VALUES (?, ?, 1, ?)
+                ON CONFLICT (query, subreddit) DO UPDATE SET
+                    runs = runs + 1,
+                    posts = posts + excluded.posts
+                """,
+                (query, subreddit_name, len(posts)),
+            )
+            for (post_row, comment_rows), post_edges in zip(rows, edges):
+                replaced = self._write_post(post_row, comment_rows, limits)
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO query_posts VALUES (?, ?, ?)",
+                    (query, subreddit_name, post_row[0]),
+                )
+                if post_edges:
+                    self._write_edges(*post_edges, replace=replaced)
+
+    @staticmethod
+    def _post_rows(
+        post_data: Dict[str, Any], limits: Optional[FetchLimits]
+    ) -> Tuple[Tuple, List[Tuple]]:
+        url = post_data["url"]
+        post_row = (
+            url,
+            post_data["title"],
+            compress_text(post_data["body"]),
+            post_data["score"],
+            None if limits is None else json.dumps(limits),
+        )
+        comment_rows = [
+            (
+                url,
+                position,
+                compress_text(comment["body"]),
+                comment["score"],
+                comment["author"],
+            )
+            for position, comment in enumerate(post_data["comments"])
+        ]
+        return post_row, comment_rows
+
+    def _write_post(
+        self,
+        post_row: Tuple,
+        comment_rows: List[Tuple],
+        limits: Optional[FetchLimits],
+    ) -> bool:
+        # Returns False if the stored post came from a deeper fetch and stays
+        url = post_row[0]
+        if self._stored_deeper(url, limits, len(comment_rows)):
+            return False
+        self.conn.execute(
+            "INSERT OR REPLACE INTO posts (url, title, body, score, limits) VALUES (?, ?, ?, ?, ?)",
+            post_row,
+        )
+        self.conn.execute("DELETE FROM comments WHERE post_url = ?", (url,))
+        self.conn.executemany(
+            "INSERT INTO comments VALUES (?, ?, ?, ?, ?)", comment_rows
+        )
+        return True
+
+    def _stored_deeper(
+        self, url: str, limits: Optional[FetchLimits], num_comments: int
+    ) -> bool:
+        row = self.conn.execute(
+            """
+            SELECT limits, (SELECT COUNT(*) FROM comments WHERE post_url = posts.url)
+            FROM posts WHERE url = ?
+            """,
+            (url,),
+        ).fetchone()
+        if row is None:
+            return False
+        stored_limits, stored_comments = row
+        if limits is None or stored_limits is None:
+            return stored_comments > num_comments
+        stored_limits = FetchLimits(*json.loads(stored_limits))
+        return stored_limits != limits and stored_limits.covers(limits)
+
+    def store_edges(
+        self,
+        seed: str,
+        posts: List[Dict[str, Any]],
+        limits: Optional[FetchLimits] = None,
+    ) -> None:
+        """
+        Store co-mention edges of posts found for a seed by a search not
+        stored under the seed's own query (e.g. an OR-query). Edges of posts
+        stored from a deeper fetch are kept.
+        """
+        edges = [
+            (self._edge_rows(seed, post_data), len(post_data["comments"]))
+            for post_data in posts
+        ]
+        with self._lock, self.conn:
+            for post_edges, num_comments in edges:
+                deeper = self._stored_deeper(post_edges[1], limits, num_comments)
+                self._write_edges(*post_edges, replace=not deeper)
+
+    @staticmethod
+    def _edge_rows(
+        seed: str, post_data: Dict[str, Any]
+    ) -> Tuple[str, str, List[Tuple]]:
+        # Each mention adds the score of the post/comment it appeared in
+        url = post_data["url"]
+        rows = []
+        for text, weight in iter_weighted_texts(post_data):
+            for song, artist in extract_mentions(text):
+                rows.append((seed, f"{song} - {artist}", url, "track", weight))
+                rows.append((seed, artist, url, "artist", weight))
+        return seed, url, rows
+
+    def _write_edges(
+        self, seed: str, url: str, rows: List[Tuple], replace: bool = True
+    ) -> None:
+        # The post's previous edges for this seed are replaced, not added to.
+        # Without replace, edges mined from a deeper copy of the post stay
+        if (
+            not replace
+            and self.conn.execute(
+                "SELECT 1 FROM post_edges WHERE post_url = ? AND seed = ? LIMIT 1",
+                (url, seed),
+            ).fetchone()
+        ):
+            return
+        self.conn.execute(
+            "DELETE FROM post_edges WHERE post_url = ? AND seed = ?", (url, seed)
+        )
+        self.conn.executemany(
+            """
+            INSERT INTO post_edges VALUES (?, ?, ?, ?, ?, 1)
+            ON CONFLICT (seed, target, post_url) DO UPDATE SET
+                score = score + excluded.score,
+                mentions = mentions + 1
+            """,
+            rows,
+        )
+
+    def lookup(
+        self,
+        query: str,
+        subreddit_name: str,
+        max_age: Optional[float] = None,
+        limits: Optional[FetchLimits] = None,
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Answer a search query from the index
+
+        Args:
+            query: Search query string
+            subreddit_name: Subreddit that was searched
+            max_age: Ignore results older than this many seconds (None = any age)
+            limits: Fetch limits of the request: runs fetched with smaller
+                    (or unknown) limits are a miss, larger ones are cut
+                    down to these (None = any run, as stored)
+
+        Returns:
+            list: Stored posts (best score first), or None on a cache miss
+        """
+        row = self._fetchone(
+            "SELECT fetched_at, limits FROM query_runs WHERE query = ? AND subreddit = ?",
+            (query, subreddit_name),
+        )
+        if row is None or (max_age is not None and time.time() - row[0] > max_age):
+            return None
+        if limits is not None and (
+            row[1] is None or not FetchLimits(*json.loads(row[1])).covers(limits)
+        ):
+            return None
+
+        urls = [
+            url
+            for (url,) in self._fetchall(
+                "SELECT post_url FROM query_posts WHERE query = ? AND subreddit = ?",
+                (query, subreddit_name),
+            )
+        ]
+        posts = self.get_posts(urls)
+        return posts if limits is None else limits.apply(posts)
+
+    def expected_yield(
+        self,
+        query: str,
+        subreddit_name: str,
+        prior: float = 3.0,
+        require_history: bool = False,
+    ) -> Optional[float]:
+        """
+        Posts a live search for this query is expected to return: the mean
+        over its past runs, with `prior` counted as one extra run
+        (None for a query that never ran, if require_history)
+        """
+        row = self._fetchone(
+            "SELECT runs, posts FROM query_stats WHERE query = ? AND subreddit = ?",
+            (query, subreddit_name),
+        )
+        runs, posts = row or (0, 0)
+        if require_history and not runs:
+            return None
+        return (posts + prior) / (runs + 1)
+
+    def subreddit_yield(self, queries: Iterable[str]) -> Dict[str, int]:
+        """Posts stored per subreddit for these queries (who answered them before)"""
+        queries = list(queries)
+        if not queries:
+            return {}
+        placeholders = ", ".join("?" * len(queries))
+        return dict(
+            self._fetchall(
+                f"SELECT subreddit, COUNT(*) FROM query_posts WHERE query IN ({placeholders}) GROUP BY subreddit",
+                queries,
+            )
+        )
+
+    def get_posts(self, urls: Iterable[str]) -> List[Dict[str, Any]]:
+        """Load stored posts (with comments) by URL, best score first"""
+        posts = []
+        for url in urls:
+            row = self._fetchone(
+                "SELECT title, body, score FROM posts WHERE url = ?", (url,)
+            )
+            if row is None:
+                continue
+            comments = [
+                {
+                    "body": decompress_text(body),
+                    "score": score,
+                    "author": sys.intern(author),
+                }
+                for body, score, author in self._fetchall(
+                    "SELECT body, score, author FROM comments WHERE post_url = ? ORDER BY position",
+                    (url,),
+                )
+            ]
+            posts.append(
+                {
+                    "title": row[0],
+                    "body": decompress_text(row[1]),
+                    "score": row[2],
+                    "url": url,
+                    "comments": comments,
+                }
+            )
+        posts.sort(key=lambda post_data: post_data["score"], reverse=True)
+        return posts
+
+    def related(
+        self, seed: str, kind: Optional[str] = None, limit: int = 20
+    ) -> List[Dict[str, Any]]:
+        """
+        Strongest co-mention edges from a seed artist or track
+
+        Args:
+            seed: Artist or "Song - Artist" seed
+            kind: Only "artist" or "track" targets (None = both)
+            limit: Maximum number of edges to return
+
+        Returns:
+            list: Dicts with target, kind, score and mentions, best first
+        """
+        sql = "SELECT target, kind, SUM(score), SUM(mentions) FROM post_edges WHERE seed = ?"
+        params: List[Any] = [seed]
+        if kind is not None:
+            sql += " AND kind = ?"
+            params.append(kind)
+        sql += " GROUP BY target, kind ORDER BY SUM(score) DESC LIMIT ?"
+        params.append(limit)
+        return [
+            {"target": target, "kind": kind, "score": score, "mentions": mentions}
+            for target, kind, score, mentions in self._fetchall(sql, params)
+        ]
+
+    def related_songs(
+        self,
+        seeds: Iterable[str],
+        exclude_urls: Iterable[str] = (),
+        limit: int = 50,
+    ) -> List[Dict[str, Any]]:
+        """
+        Songs co-mentioned with any of the seeds, as Step 3b candidates
+
+        Args:
+            seeds: Artist and "Song - Artist" seeds of the request
+            exclude_urls: Posts whose mentions are counted already (the
+                          request's own Reddit data)
+            limit: Maximum number of songs to return
+
+        Returns:
+            list: Dicts with song, artist, score and mentions (summed over
+                  seeds and posts), best first
+        """
+        seeds = list(seeds)
+        if not seeds:
+            return []
+        # The excluded posts go through a temp table, they can be hundreds
+        with self._lock, self.conn:
+            self.conn.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS excluded_posts (url TEXT PRIMARY KEY)"
+            )
+            self.conn.execute("DELETE FROM excluded_posts")
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO excluded_posts VALUES (?)",
+                [(url,) for url in exclude_urls],
+            )
+            placeholders = ", ".join("?" * len(seeds))
+            rows = self.conn.execute(
+                f"""
+                SELECT target, SUM(score), SUM(mentions) FROM post_edges
+                WHERE kind = 'track' AND seed IN ({placeholders})
+                    AND post_url NOT IN (SELECT url FROM excluded_posts)
+                GROUP BY target ORDER BY SUM(score) DESC LIMIT ?
+                """,
+                [*seeds, limit],
+            ).fetchall()
+        songs = []
+        for target, score, mentions in rows:
+            song, _, artist = target.rpartition(" - ")
+            songs.append(
+                {"song": song, "artist": artist, "score": score, "mentions": mentions}
+            )
+        return songs
+
+    def _fetchall(self, sql: str, params: Iterable[Any] = ()) -> List[Tuple]:
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def _fetchone(self, sql: str, params: Iterable[Any] = ()) -> Optional[Tuple]:
+        with self._lock:
+            return self.conn.execute(sql, params).fetchone()
+
+
+async def ingest_seeds(
+    index: RedditIndex,
+    reddit,
+    seeds: List[Tuple[str, str]],
+    subreddit_name: str,
+    max_posts: int = 20,
+    max_comments: int = 30,
+    concurrency: int = 4,
+) -> int:
+    """
+    Background ingestion job: search Reddit for each seed and store results
+
+    Args:
+        index: RedditIndex to write to
+        reddit: Async Reddit client object
+        seeds: (seed, query) pairs, e.g. from artist_seed_query/track_seed_query
+        subreddit_name: Name of subreddit to search
+        max_posts: Maximum posts to fetch per query
+        max_comments: Maximum comments per post
+        concurrency: Maximum searches running at once (keeps rate limits happy)
+
+    Returns:
+        int: Number of posts stored
+    """
+    # Imported here so reddit_api can import this module
+    from reddit_api import search_reddit_for_recommendations
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def ingest(seed: str, query: str) -> int:
+        async with semaphore:
+            try:
+                posts = await search_reddit_for_recommendations(
+                    reddit, query, subreddit_name, max_posts, max_comments
+                )
+            except Exception as e:
+                # Failed searches are not stored, so they are retried next run
+                print(f"   Failed to index '{query}': {e!r}")
+                return 0
+        await asyncio.to_thread(
+            index.store_query_results,
+            query,
+            subreddit_name,
+            posts,
+            seed,
+            FetchLimits(
+                max_posts,
+                max_comments,
+                DEFAULT_MAX_BODY_BYTES,
+                DEFAULT_MAX_COMMENT_BYTES,
+            ),
+        )
+        print(f"   Indexed {len(posts)} posts for '{query}'")
+        return len(posts)
+
+    counts = await asyncio.gather(*(ingest(seed, query) for seed, query in seeds))
+    return sum(counts)
+
+
+def track_seed_query(track: Dict[str, Any]) -> Tuple[str, str]:
+    """(seed, query) for a track, same query format Step 3 uses"""
+    return (
+        f"{track['name']} - {track['artist_names']}",
+        f"{track['name']} {track['artist_names']} recommend",
+    )
+
+
+def artist_seed_query(artist: str) -> Tuple[str, str]:
+    """(seed, query) for an artist, same query format Step 3 uses"""
+    return artist, f"{artist} recommend similar"
+
+
+async def _run_ingestion(args) -> None:
+    import asyncpraw
+    import main as config
+
+    seeds = [artist_seed_query(artist) for artist in args.artist]
+    if args.playlist:
+        from spotify_api import initialize_spotify, get_playlist_data
+        from track_selection import compute_artist_weights
+
+        sp = initialize_spotify(config.SPOTIFY_CLIENT_ID, config.SPOTIFY_CLIENT_SECRET)
+        tracks_data = get_playlist_data(sp, args.playlist)["tracks_data"]
+        seeds += [artist_seed_query(a) for a in compute_artist_weights(tracks_data)]
+        seeds += [track_seed_query(track) for track in tracks_data]
+
+    index = RedditIndex(args.db)
+    async with asyncpraw.Reddit(
+        client_id=config.REDDIT_CLIENT_ID,
+        client_secret=config.REDDIT_CLIENT_SECRET,
+        username=config.REDDIT_USERNAME,
+        password=config.REDDIT_PASSWORD,
+        user_agent=config.REDDIT_USER_AGENT,
+    ) as reddit:
+        total = await ingest_seeds(
+            index,
+            reddit,
+            seeds,
+            args.subreddit,
+            config.MAX_REDDIT_POSTS_PER_QUERY,
+            config.MAX_COMMENTS_PER_POST,
+            args.concurrency,
+        )
+    index.close()
+    print(f"\nIndexed {total} posts for {len(seeds)} queries into {args.db}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Ingest Reddit threads into the index")
+    parser.add_argument("--db", default="reddit_index.db", help="SQLite index path")
+    parser.add_argument("--artist", action="append", default=[], help="artist seed")
+    parser.add_argument("--playlist", help="Spotify playlist URL to take seeds from")
+    parser.add_argument("--subreddit", default="music", help="subreddit to search")
+    parser.add_argument("--concurrency", type=int, default=4)
+    asyncio.run(_run_ingestion(parser.parse_args()))
@@ -0,0 +1,188 @@
+"""
+Resilience Module
+Keeps one failing upstream (Spotify, Reddit, OpenAI) from stalling every request:
+- Circuit breaker per upstream, with half-open probing after a cool-down
+- Bulkhead per upstream: its own concurrency limit and worker threads, so
+  a slow upstream can't take every worker
+"""
+
+import asyncio
+import contextvars
+import functools
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open"""
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after failure_threshold consecutive failures. Once
+    reset_timeout seconds have passed, one probe call is let through
+    (half-open): success closes the circuit, failure opens it again.
+
+    Used from the event loop only, so no locking is needed.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    @property
+    def available(self) -> bool:
+        """Whether a call would be let through right now (no side effects)"""
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            return self._clock() - self._opened_at >= self.reset_timeout
+        return not self._probe_in_flight
+
+    def allow(self) -> bool:
+        """Ask to make a call (in half-open state only one probe at a time)"""
+        if self.state == "open" and self.available:
+            self.state = "half_open"
+            print(f"   Circuit '{self.name}' half-open, probing")
+        if self.state == "half_open":
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+        return self.state != "open"
+
+    def record_success(self) -> None:
+        if self.state != "closed":
+            print(f"   Circuit '{self.name}' closed")
+        self.state = "closed"
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                print(f"   Circuit '{self.name}' opened after {self.failures} failures")
+            self.state = "open"
+            self._opened_at = self._clock()
+
+    def release_probe(self) -> None:
+        """Free the probe slot of a call that ended without an outcome"""
+        self._probe_in_flight = False
+
+
+class Upstream:
+    """Circuit breaker plus bulkhead (concurrency limit) for one upstream service"""
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int = 8,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        is_failure: Callable[[Exception], bool] = lambda error: True,
+    ):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_timeout)
+        # Errors that say nothing about the upstream's health (e.g. a 404
+        # for a private playlist) don't count as failures
+        self.is_failure = is_failure
+        # Calls waiting for or holding a bulkhead slot (low-priority work
+        # like the cache warmer backs off while this is high)
+        self.in_flight = 0
+        # asyncio semaphores belong to one event loop
+        self._bulkheads: "weakref.WeakKeyDictionary[Any, asyncio.Semaphore]" = (
+            weakref.WeakKeyDictionary()
+        )
+        # Blocking calls get threads of their own rather than the loop's
+        # shared default executor, which a stuck upstream (or other
+        # to_thread work) could fill. A call that timed out keeps its thread
+        # until it returns, so a hung upstream only ever stalls its own calls
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix=f"upstream-{name}"
+        )
+
+    @property
+    def available(self) -> bool:
+        return self.breaker.available
+
+    def _bulkhead(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        bulkhead = self._bulkheads.get(loop)
+        if bulkhead is None:
+            bulkhead = self._bulkheads[loop] = asyncio.Semaphore(self.max_concurrency)
+        return bulkhead
+
+    @asynccontextmanager
+    async def guard(self) -> AsyncIterator[None]:
+        """
+        Run a block against the upstream: fails fast with CircuitOpenError
+        while the circuit is open, waits for a bulkhead slot, and records
+        the block's outcome (cancelled/closed blocks record nothing)
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.name} is unavailable (circuit open)")
+        recorded = False
+        self.in_flight += 1
+        try:
+            async with self._bulkhead():
+                yield
+        except Exception as e:
+            recorded = True
+            if self.is_failure(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+        else:
+            recorded = True
+            self.breaker.record_success()
+        finally:
+            self.in_flight -= 1
+            if not recorded:
+                self.breaker.release_probe()
+
+    async def call(
+        self, fn: Callable[..., Any], *args: Any, timeout: Optional[float] = None
+    ) -> Any:
+        """
+        Run a blocking call in one of the upstream's worker threads under
+        guard()
+
+        Args:
+            fn: Function making the upstream request
+            *args: Arguments for fn
+            timeout: Seconds before the call counts as failed (None = no limit)
+
+        Returns:
+            Whatever fn returns
+        """
+        loop = asyncio.get_running_loop()
+        # Like asyncio.to_thread, the call sees the caller's context variables
+        call = functools.partial(contextvars.copy_context().run, fn, *args)
+        async with self.guard():
+            async with asyncio.timeout(timeout):
+                return await loop.run_in_executor(self._executor, call)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "state": self.breaker.state,
+            "failures": self.breaker.failures,
+            "in_flight": self.in_flight,
+        }
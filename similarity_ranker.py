@@ -0,0 +1,359 @@
+"""
+Similarity Ranker Module
+Local re-ranking of recommended tracks (no external model service):
+- Hashed artist/album feature vectors, cached in a memory-mapped matrix
+- Co-mention vectors: which playlist artists' Reddit threads mention a track
+- Cosine similarity to the playlist centroid (running sums, no playlist
+  matrix) picks the best N tracks
+"""
+
+import os
+import threading
+import zlib
+from collections import OrderedDict
+import numpy as np
+from typing import Dict, List, Any, Optional, Sequence, Tuple
+from track_store import TrackStore
+from entity_extraction import iter_weighted_texts
+
+try:
+    import fcntl
+except ImportError:  # Windows: no file locks, the cache stays in memory
+    fcntl = None
+
+EMBEDDING_DIM = 1024  # hash buckets per block (metadata block + co-mention block)
+ALBUM_WEIGHT = 0.5  # album match counts half as much as an artist match
+COMENTION_WEIGHT = 1.0  # co-mention block weight relative to the metadata block
+GPT_RANK_WEIGHT = (
+    0.3  # share of the final score from the GPT order, the rest is similarity
+)
+
+
+def _bucket(feature: str, dim: int) -> Tuple[int, float]:
+    """
+    (bucket, sign) of a feature. Signed hashing: two features sharing a
+    bucket cancel out as often as they add up, so collisions don't make
+    unrelated artists look similar on average.
+    """
+    # crc32 rather than hash() so buckets are stable across processes
+    digest = zlib.crc32(" ".join(feature.lower().split()).encode("utf-8"))
+    return digest % dim, 1.0 if (digest >> 31) & 1 else -1.0
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+def metadata_vector(
+    artists: Sequence[str], album: Optional[str], dim: int = EMBEDDING_DIM
+) -> np.ndarray:
+    """
+    Hashed artist/album features of one track (unit length)
+
+    Args:
+        artists: Artist names of the track
+        album: Album name (None if unknown)
+        dim: Number of hash buckets
+
+    Returns:
+        np.ndarray: float32 vector of length dim
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for artist in artists:
+        bucket, sign = _bucket(f"artist:{artist}", dim)
+        vector[bucket] += sign / len(artists)
+    if album:
+        bucket, sign = _bucket(f"album:{album}", dim)
+        vector[bucket] += sign * ALBUM_WEIGHT
+    return _normalize(vector)
+
+
+def seed_artists(seed: str) -> List[str]:
+    """Artist names of a Reddit seed ("Artist" or "Song - Artist, Artist")"""
+    return seed.rsplit(" - ", 1)[-1].split(", ")
+
+
+def comention_vectors(
+    artist_lists: Sequence[Sequence[str]],
+    reddit_data: List[Dict[str, Any]],
+    dim: int = EMBEDDING_DIM,
+) -> np.ndarray:
+    """
+    Co-mention vectors: for each track, the (score-weighted) seed artists whose
+    Reddit threads mention the track's primary artist
+
+    Args:
+        artist_lists: Artist names of each track
+        reddit_data: Reddit posts (with "seeds", see get_reddit_recommendations)
+        dim: Number of hash buckets
+
+    Returns:
+        np.ndarray: float32 (tracks x dim) matrix, rows are unit length or zero
+    """
+    vectors = np.zeros((len(artist_lists), dim), dtype=np.float32)
+    primary = [artists[0].lower() if artists else "" for artists in artist_lists]
+
+    for post_data in reddit_data:
+        hashed = [
+            _bucket(f"artist:{artist}", dim)
+            for seed in post_data.get("seeds") or []
+            for artist in seed_artists(seed)
+        ]
+        if not hashed:
+            continue
+        buckets = [bucket for bucket, _ in hashed]
+        signs = np.array([sign for _, sign in hashed], dtype=np.float32)
+        for text, weight in iter_weighted_texts(post_data):
+            lowered = text.lower()
+            for row, artist in enumerate(primary):
+                if artist and artist in lowered:
+                    np.add.at(vectors[row], buckets, signs * weight)
+
+    return _normalize(vectors)
+
+
+class EmbeddingMatrix:
+    """
+    Track ID -> metadata embedding, stored as rows of a memory-mapped .npy file
+    (plus a "<path>.ids" file with one track ID per row)
+
+    With path=None the matrix is kept in memory only, holding at most
+    max_rows tracks (least recently used ones are evicted).
+
+    The file has a single writer: the process that opened it holds an
+    exclusive lock on "<path>.lock" until close(). Other processes (e.g.
+    other uvicorn workers) fall back to an in-memory matrix. New track IDs
+    are appended to the ids file on flush(), in one write.
+
+    Thread-safe: requests re-rank in worker threads sharing one matrix.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        dim: int = EMBEDDING_DIM,
+        capacity: int = 1024,
+        max_rows: int = 20_000,
+    ):
+        self.dim = dim
+        self.max_rows = max_rows
+        self._rows: "OrderedDict[str, int]" = OrderedDict()
+        self._pending_ids: List[str] = []
+        self._lock = threading.RLock()
+        self._lock_file = None
+        self.path = path if path and self._acquire_lock(path) else None
+
+        if self.path and os.path.exists(self.path):
+            self._matrix = np.load(self.path, mmap_mode="r+")
+            self.dim = self._matrix.shape[1]
+            with open(self._ids_path, encoding="utf-8") as ids_file:
+                for row, track_id in enumerate(ids_file.read().splitlines()):
+                    self._rows[track_id] = row
+        else:
+            self._matrix = self._allocate(
+                capacity if self.path else min(capacity, max_rows)
+            )
+
+    def _acquire_lock(self, path: str) -> bool:
+        if fcntl is None:
+            print(f"Embedding cache {path}: no file locking here, using memory")
+            return False
+        lock_file = open(f"{path}.lock", "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            print(f"Embedding cache {path} is in use by another process, using memory")
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def close(self) -> None:
+        """Flush the file and release its lock (the matrix stays usable)"""
+        self.flush()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    @property
+    def _ids_path(self) -> str:
+        return f"{self.path}.ids"
+
+    def _allocate(self, capacity: int) -> np.ndarray:
+        if not self.path:
+            return np.zeros((capacity, self.dim), dtype=np.float32)
+        matrix = np.lib.format.open_memmap(
+            self.path, mode="w+", dtype=np.float32, shape=(capacity, self.dim)
+        )
+        open(self._ids_path, "w", encoding="utf-8").close()
+        return matrix
+
+    def _grow(self) -> None:
+        old = self._matrix
+        if not self.path:
+            self._matrix = np.zeros(
+                (min(2 * len(old), self.max_rows), self.dim), dtype=np.float32
+            )
+            self._matrix[: len(old)] = old
+            return
+        # Write the bigger matrix next to the file, then swap it in (safe
+        # under the file lock, nobody else has the file mapped)
+        grow_path = f"{self.path}.grow"
+        matrix = np.lib.format.open_memmap(
+            grow_path, mode="w+", dtype=np.float32, shape=(2 * len(old), self.dim)
+        )
+        matrix[: len(old)] = old
+        matrix.flush()
+        self._matrix = old = matrix = None
+        os.replace(grow_path, self.path)
+        self._matrix = np.load(self.path, mmap_mode="r+")
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, track_id: str) -> bool:
+        return track_id in self._rows
+
+    def get(self, track_id: str) -> Optional[np.ndarray]:
+        """Embedding of a track (None if not stored)"""
+        with self._lock:
+            row = self._rows.get(track_id)
+            if row is None:
+                return None
+            self._rows.move_to_end(track_id)
+            # A copy, the row may be reused once the track is evicted
+            return np.array(self._matrix[row])
+
+    def add(self, track_id: str, vector: np.ndarray) -> None:
+        """Store a track's embedding (ignored if already stored)"""
+        with self._lock:
+            if track_id in self._rows:
+                return
+            if len(self._rows) == len(self._matrix):
+                if self.path or len(self._matrix) < self.max_rows:
+                    self._grow()
+            if len(self._rows) < len(self._matrix):
+                row = len(self._rows)
+            else:
+                _, row = self._rows.popitem(last=False)
+            self._matrix[row] = vector
+            self._rows[track_id] = row
+            if self.path:
+                self._pending_ids.append(track_id)
+
+    def flush(self) -> None:
+        """Write the matrix and the IDs added since the last flush"""
+        with self._lock:
+            if isinstance(self._matrix, np.memmap):
+                self._matrix.flush()
+            if self._pending_ids:
+                # After the rows: a crash in between only loses the new rows
+                with open(self._ids_path, "a", encoding="utf-8") as ids_file:
+                    ids_file.write("".join(f"{i}\n" for i in self._pending_ids))
+                self._pending_ids = []
+
+    def embed(
+        self, track_id: Optional[str], artists: Sequence[str], album: Optional[str]
+    ) -> np.ndarray:
+        """metadata_vector for a track, computed once per track ID"""
+        with self._lock:
+            vector = self.get(track_id) if track_id else None
+            if vector is None:
+                vector = metadata_vector(artists, album, self.dim)
+                if track_id:
+                    self.add(track_id, vector)
+            return vector
+
+
+def _playlist_columns(
+    tracks_data: Sequence[Dict[str, Any]]
+) -> Tuple[Sequence[Optional[str]], Sequence[Sequence[str]], Sequence[str]]:
+    """Return (ids, artists, albums) columns, read directly from a TrackStore"""
+    if isinstance(tracks_data, TrackStore):
+        return tracks_data.ids, tracks_data.artists, tracks_data.albums
+    return (
+        [track["id"] for track in tracks_data],
+        [track["artists"] for track in tracks_data],
+        [track["album"] for track in tracks_data],
+    )
+
+
+def rerank_by_similarity(
+    recommendations: List[Dict[str, Any]],
+    tracks_data: Sequence[Dict[str, Any]],
+    reddit_data: List[Dict[str, Any]],
+    num_recommendations: int,
+    embeddings: Optional[EmbeddingMatrix] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Keep the recommended tracks most similar to the playlist
+
+    Each track is embedded as [metadata vector, co-mention vector] and scored
+    by cosine similarity to the mean playlist embedding, blended with its
+    place in the original (GPT) order (GPT_RANK_WEIGHT), so similarity
+    adjusts GPT's ranking rather than replacing it. Ties keep the GPT order.
+
+    Args:
+        recommendations: Spotify tracks from search_spotify_until
+        tracks_data: Playlist tracks (TrackStore or track dicts)
+        reddit_data: Reddit posts (with "seeds") behind the recommendations
+        num_recommendations: Number of tracks to keep
+        embeddings: Cache of metadata embeddings (in-memory if not given)
+
+    Returns:
+        list: Up to num_recommendations tracks, most similar first
+    """
+    if not recommendations or not len(tracks_data):
+        return recommendations[:num_recommendations]
+    embeddings = embeddings or EmbeddingMatrix()
+    dim = embeddings.dim
+
+    # Playlist centroid from running sums, one track at a time: a playlist
+    # embedding matrix would take tracks x 2 x dim floats. Playlist tracks
+    # "co-mention" their own artists (they are the seeds)
+    ids, artists_column, albums = _playlist_columns(tracks_data)
+    meta_sum = np.zeros(dim, dtype=np.float64)
+    comention_sum = np.zeros(dim, dtype=np.float64)
+    for track_id, artists, album in zip(ids, artists_column, albums):
+        meta_sum += embeddings.embed(track_id, artists, album)
+        comention_sum += metadata_vector(artists, None, dim)
+    centroid_meta = meta_sum
+    centroid_comention = COMENTION_WEIGHT * comention_sum
+    centroid_norm = np.sqrt(
+        centroid_meta @ centroid_meta + centroid_comention @ centroid_comention
+    )
+
+    candidate_artists = [track["artist"].split(", ") for track in recommendations]
+    candidate_meta = np.stack(
+        [
+            embeddings.embed(track["id"], artists, track["album"])
+            for track, artists in zip(recommendations, candidate_artists)
+        ]
+    )
+    candidate_comention = COMENTION_WEIGHT * comention_vectors(
+        candidate_artists, reddit_data, dim
+    )
+    embeddings.flush()
+
+    # Cosine similarity of [meta, comention] rows to the centroid, block by block
+    dots = candidate_meta @ centroid_meta + candidate_comention @ centroid_comention
+    norms = (
+        np.sqrt(
+            (candidate_meta**2).sum(axis=1) + (candidate_comention**2).sum(axis=1)
+        )
+        * centroid_norm
+    )
+    similarity = np.divide(dots, norms, out=np.zeros_like(dots), where=norms > 0)
+    # 1 for GPT's first pick down to 1/n for its last
+    gpt_rank = 1.0 - np.arange(len(recommendations)) / len(recommendations)
+    score = (1 - GPT_RANK_WEIGHT) * similarity + GPT_RANK_WEIGHT * gpt_rank
+
+    order = np.argsort(-score, kind="stable")[:num_recommendations]
+    for rank, idx in enumerate(order, 1):
+        track = recommendations[idx]
+        print(
+            f"   {rank}. {track['name']} - {track['artist']} "
+            f"(similarity {similarity[idx]:.3f}, GPT #{idx + 1})"
+        )
+    return [recommendations[idx] for idx in order]
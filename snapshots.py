@@ -0,0 +1,488 @@
+"""
+Playlist Snapshots
+Offline, reproducible runs of the recommendation pipeline:
+- Export: run one playlist live and record every Spotify response, Reddit
+  search result and GPT answer into a compressed snapshot file
+- Replay: run the pipeline on a snapshot with all network I/O answered from
+  the recording (deterministic, no credentials needed)
+- A corpus of snapshots doubles as a performance and regression check
+"""
+
+import asyncio
+import contextlib
+import glob
+import gzip
+import io
+import json
+import os
+import statistics
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import orjson
+from spotipy.exceptions import SpotifyException
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_SUFFIX = ".snapshot.json.gz"
+
+
+class SnapshotMissError(LookupError):
+    """Raised when replay needs a response the snapshot didn't record"""
+
+
+class SpotifySnapshotMissError(SnapshotMissError, SpotifyException):
+    """
+    An unrecorded Spotify call, raised as a 404: a response missing from the
+    snapshot says nothing about Spotify's health, so it never counts toward
+    the Spotify circuit
+    """
+
+    def __init__(self, key: str):
+        SpotifyException.__init__(self, 404, -1, f"Spotify call not in snapshot: {key}")
+
+
+def _call_key(method: str, args: Tuple, kwargs: Dict[str, Any]) -> str:
+    return json.dumps([method, list(args), kwargs], sort_keys=True, default=str)
+
+
+class RecordingSpotify:
+    """Spotipy client wrapper recording every call and its JSON response"""
+
+    def __init__(self, sp: Any, log: List[Dict[str, Any]]):
+        self._sp = sp
+        self._log = log
+
+    def __getattr__(self, method: str):
+        target = getattr(self._sp, method)
+
+        def call(*args, **kwargs):
+            result = target(*args, **kwargs)
+            self._log.append({"key": _call_key(method, args, kwargs), "result": result})
+            return result
+
+        return call
+
+
+class RecordingOpenAI:
+    """OpenAI client wrapper recording the answer of every chat completion"""
+
+    def __init__(self, client: Any, log: List[Dict[str, Any]]):
+        self._client = client
+        self._log = log
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def with_options(self, **options) -> "RecordingOpenAI":
+        return RecordingOpenAI(self._client.with_options(**options), self._log)
+
+    def _create(self, **kwargs):
+        response = self._client.chat.completions.create(**kwargs)
+        self._log.append(
+            {
+                "model": kwargs.get("model"),
+                "content": response.choices[0].message.content,
+            }
+        )
+        return response
+
+
+class RecordingReddit:
+    """
+    asyncpraw client wrapper recording each search's posts and the comments
+    the pipeline loaded for them (posts the search never reached aren't
+    recorded, same as they were never seen)
+    """
+
+    def __init__(self, reddit: Any, log: List[Dict[str, Any]]):
+        self._reddit = reddit
+        self._log = log
+
+    async def subreddit(self, name: str) -> "_RecordingSubreddit":
+        return _RecordingSubreddit(await self._reddit.subreddit(name), name, self._log)
+
+
+class _RecordingSubreddit:
+    def __init__(self, subreddit: Any, name: str, log: List[Dict[str, Any]]):
+        self._subreddit = subreddit
+        self._name = name
+        self._log = log
+
+    def search(self, query: str, limit: int = 20):
+        return self._search(query, limit)
+
+    async def _search(self, query: str, limit: int):
+        entry = {"subreddit": self._name, "query": query, "posts": []}
+        self._log.append(entry)
+        async for post in self._subreddit.search(query, limit=limit):
+            recorded = {
+                "title": post.title,
+                "selftext": post.selftext,
+                "score": post.score,
+                "permalink": post.permalink,
+                "comments": [],
+            }
+            entry["posts"].append(recorded)
+            yield SimpleNamespace(
+                title=post.title,
+                selftext=post.selftext,
+                score=post.score,
+                permalink=post.permalink,
+                comments=_RecordingComments(post.comments, recorded),
+            )
+
+
+class _RecordingComments:
+    def __init__(self, comments: Any, recorded: Dict[str, Any]):
+        self._comments = comments
+        self._recorded = recorded
+
+    async def replace_more(self, limit: Optional[int] = 0):
+        return await self._comments.replace_more(limit=limit)
+
+    def list(self) -> List[Any]:
+        comments = self._comments.list()
+        self._recorded["comments"] = [
+            {
+                "body": comment.body,
+                "score": comment.score,
+                "author": str(comment.author) if comment.author else None,
+            }
+            for comment in comments
+            if hasattr(comment, "body")  # skip MoreComments
+        ]
+        return comments
+
+
+class SnapshotSpotify:
+    """
+    Spotipy stand-in answering recorded calls. Unrecorded searches find
+    nothing, any other unrecorded call raises SpotifySnapshotMissError.
+    """
+
+    def __init__(self, calls: List[Dict[str, Any]]):
+        self._responses = {call["key"]: call["result"] for call in calls}
+        self.num_calls = 0
+        self.misses: List[str] = []
+
+    def __getattr__(self, method: str):
+        def call(*args, **kwargs):
+            self.num_calls += 1
+            key = _call_key(method, args, kwargs)
+            if key in self._responses:
+                return self._responses[key]
+            self.misses.append(key)
+            if method == "search":
+                return {"tracks": {"items": []}}
+            raise SpotifySnapshotMissError(key)
+
+        return call
+
+
+class SnapshotOpenAI:
+    """OpenAI stand-in returning the recorded answers in order"""
+
+    def __init__(self, answers: List[Dict[str, Any]]):
+        self._answers = answers
+        self.num_calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def with_options(self, **options) -> "SnapshotOpenAI":
+        return self
+
+    def _create(self, **kwargs):
+        self.num_calls += 1
+        if self.num_calls > len(self._answers):
+            raise SnapshotMissError(f"GPT call {self.num_calls} not in snapshot")
+        content = self._answers[self.num_calls - 1]["content"]
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))]
+        )
+
+
+class SnapshotReddit:
+    """asyncpraw stand-in serving the recorded search results"""
+
+    def __init__(self, searches: List[Dict[str, Any]]):
+        self._posts: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        for search in searches:
+            key = (search["subreddit"], search["query"])
+            # A search recorded twice keeps its longest result
+            if len(search["posts"]) >= len(self._posts.get(key, [])):
+                self._posts[key] = search["posts"]
+        self.num_calls = 0
+        self.misses: List[Tuple[str, str]] = []
+
+    async def subreddit(self, name: str) -> "_SnapshotSubreddit":
+        return _SnapshotSubreddit(self, name)
+
+
+class _SnapshotSubreddit:
+    def __init__(self, reddit: SnapshotReddit, name: str):
+        self._reddit = reddit
+        self._name = name
+
+    def search(self, query: str, limit: int = 20):
+        return self._search(query, limit)
+
+    async def _search(self, query: str, limit: int):
+        self._reddit.num_calls += 1
+        posts = self._reddit._posts.get((self._name, query))
+        if posts is None:
+            self._reddit.misses.append((self._name, query))
+            return
+        for post in posts[:limit]:
+            yield SimpleNamespace(
+                title=post["title"],
+                selftext=post["selftext"],
+                score=post["score"],
+                permalink=post["permalink"],
+                comments=_SnapshotComments(post["comments"]),
+            )
+
+
+class _SnapshotComments:
+    def __init__(self, comments: List[Dict[str, Any]]):
+        self._comments = comments
+
+    async def replace_more(self, limit: Optional[int] = 0):
+        return []
+
+    def list(self) -> List[Any]:
+        return [SimpleNamespace(**comment) for comment in self._comments]
+
+
+def save_snapshot(snapshot: Dict[str, Any], path: str) -> None:
+    """Write a snapshot as gzip-compressed JSON"""
+    with gzip.open(path, "wb") as f:
+        f.write(orjson.dumps(snapshot))
+
+
+def load_snapshot(path: str) -> Dict[str, Any]:
+    """
+    Read a snapshot file
+
+    Raises:
+        ValueError: If the file is from another snapshot format version
+    """
+    with gzip.open(path, "rb") as f:
+        snapshot = orjson.loads(f.read())
+    if snapshot.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(
+            f"{path}: snapshot version {snapshot.get('version')}, expected {SNAPSHOT_VERSION}"
+        )
+    return snapshot
+
+
+def snapshot_paths(paths: Iterable[str]) -> List[str]:
+    """Snapshot files among paths, directories are searched for *.snapshot.json.gz"""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found += sorted(glob.glob(os.path.join(path, f"*{SNAPSHOT_SUFFIX}")))
+        else:
+            found.append(path)
+    return found
+
+
+def _result_summary(result: Dict[str, Any]) -> Dict[str, Any]:
+    # What a regression check compares (not timings)
+    return {
+        "recommendations": [track["uri"] for track in result["final_recommendations"]],
+        "gpt_recommendations": result["gpt_recommendations"],
+        "num_reddit_posts": result["metadata"]["num_reddit_posts"],
+        "degraded_stages": result["metadata"]["degraded_stages"],
+    }
+
+
+def _settings(snapshot: Dict[str, Any]):
+    import main
+
+    return main.get_settings(snapshot["preset"], **snapshot["overrides"])
+
+
+async def export_snapshot(
+    playlist_url: str,
+    preset: str = "balanced",
+    overrides: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Run the pipeline live on one playlist and record it
+
+    Needs the Spotify, Reddit and OpenAI credentials (see main.py). Track
+    and artist selection uses a fixed seed (selection_seed=0 unless
+    overridden) so replays search the same queries.
+
+    Args:
+        playlist_url: Spotify playlist URL
+        preset: Settings preset of the run
+        overrides: Setting overrides on top of the preset (JSON values)
+
+    Returns:
+        dict: The snapshot. "recorded" holds the live run's results,
+              "expected" those of a first replay (the regression baseline,
+              Reddit results arrive in a different order offline)
+    """
+    import asyncpraw
+    import main
+
+    overrides = {"selection_seed": 0, **(overrides or {})}
+    snapshot: Dict[str, Any] = {
+        "version": SNAPSHOT_VERSION,
+        "playlist_url": playlist_url,
+        "preset": preset,
+        "overrides": overrides,
+        "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "spotify": [],
+        "reddit": [],
+        "openai": [],
+    }
+    settings = _settings(snapshot)
+
+    async with asyncpraw.Reddit(
+        client_id=main.REDDIT_CLIENT_ID,
+        client_secret=main.REDDIT_CLIENT_SECRET,
+        username=main.REDDIT_USERNAME,
+        password=main.REDDIT_PASSWORD,
+        user_agent=main.REDDIT_USER_AGENT,
+    ) as reddit:
+        clients = main.PipelineClients(
+            RecordingSpotify(main.get_spotify_client(), snapshot["spotify"]),
+            (
+                RecordingOpenAI(main.get_openai_client(), snapshot["openai"])
+                if settings.mode == "full"
+                else None
+            ),
+            RecordingReddit(reddit, snapshot["reddit"]),
+        )
+        result = await main.get_recommendations(
+            playlist_url, settings=settings, clients=clients
+        )
+    snapshot["recorded"] = _result_summary(result)
+    snapshot["expected"] = (await replay_snapshot(snapshot))["summary"]
+    return snapshot
+
+
+async def replay_snapshot(
+    snapshot: Dict[str, Any], quiet: bool = True
+) -> Dict[str, Any]:
+    """
+    Run the pipeline on a snapshot, no network I/O
+
+    Args:
+        snapshot: Loaded snapshot (see load_snapshot)
+        quiet: Hide the pipeline's console output
+
+    Returns:
+        dict: seconds, summary (compared against the snapshot's "expected"),
+              matches (None for a snapshot without a baseline yet), calls
+              and misses per service
+    """
+    import main
+
+    spotify = SnapshotSpotify(snapshot["spotify"])
+    openai_client = SnapshotOpenAI(snapshot["openai"])
+    reddit = SnapshotReddit(snapshot["reddit"])
+    clients = main.PipelineClients(spotify, openai_client, reddit)
+
+    output = io.StringIO() if quiet else None
+    with contextlib.redirect_stdout(output) if quiet else contextlib.nullcontext():
+        start = time.perf_counter()
+        result = await main.get_recommendations(
+            snapshot["playlist_url"], settings=_settings(snapshot), clients=clients
+        )
+        seconds = time.perf_counter() - start
+
+    summary = _result_summary(result)
+    expected = snapshot.get("expected")
+    return {
+        "seconds": seconds,
+        "summary": summary,
+        "matches": None if expected is None else summary == expected,
+        "calls": {
+            "spotify": spotify.num_calls,
+            "reddit": reddit.num_calls,
+            "openai": openai_client.num_calls,
+        },
+        "misses": {
+            "spotify": len(spotify.misses),
+            "reddit": len(reddit.misses),
+            "openai": max(0, openai_client.num_calls - len(snapshot["openai"])),
+        },
+    }
+
+
+async def _run_replays(args) -> int:
+    paths = snapshot_paths(args.paths)
+    if not paths:
+        print("No snapshots found")
+        return 1
+    failures = 0
+    for path in paths:
+        snapshot = load_snapshot(path)
+        runs = [
+            await replay_snapshot(snapshot, quiet=not args.verbose)
+            for _ in range(args.runs)
+        ]
+        last = runs[-1]
+        changed = last["matches"] is False or any(
+            run["summary"] != last["summary"] for run in runs
+        )
+        failures += changed
+        print(
+            f"{'CHANGED' if changed else 'ok':8} {os.path.basename(path)}: "
+            f"{statistics.median(run['seconds'] for run in runs) * 1000:.0f} ms median, "
+            f"calls {last['calls']}, misses {last['misses']}"
+        )
+        if changed and last["matches"] is False:
+            print(f"         expected {snapshot['expected']['recommendations']}")
+            print(f"         got      {last['summary']['recommendations']}")
+    print(f"\n{len(paths) - failures}/{len(paths)} snapshots unchanged")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Export and replay playlist snapshots")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="record a live run")
+    export_parser.add_argument("playlist_url")
+    export_parser.add_argument(
+        "-o", "--output", help=f"file (default <id>{SNAPSHOT_SUFFIX})"
+    )
+    export_parser.add_argument("--preset", default="balanced")
+    export_parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="NAME=JSON",
+        help="setting override, e.g. --set num_recommendations=10",
+    )
+
+    replay_parser = commands.add_parser("replay", help="replay snapshots offline")
+    replay_parser.add_argument("paths", nargs="+", help="snapshot files or directories")
+    replay_parser.add_argument("--runs", type=int, default=3, help="runs per snapshot")
+    replay_parser.add_argument(
+        "--verbose", action="store_true", help="show pipeline output"
+    )
+
+    args = parser.parse_args()
+    if args.command == "export":
+        overrides = {}
+        for item in args.set:
+            name, _, value = item.partition("=")
+            overrides[name] = json.loads(value)
+        snapshot = asyncio.run(
+            export_snapshot(args.playlist_url, args.preset, overrides)
+        )
+        from spotify_api import get_playlist_id
+
+        output = args.output or get_playlist_id(args.playlist_url) + SNAPSHOT_SUFFIX
+        save_snapshot(snapshot, output)
+        print(
+            f"\nSnapshot written to {output} ({os.path.getsize(output) / 1024:.0f} KB)"
+        )
+    else:
+        sys.exit(asyncio.run(_run_replays(args)))
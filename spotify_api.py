@@ -6,9 +6,17 @@ Handles Spotify authentication and operations:
 """
 
 import spotipy
+from spotipy.exceptions import SpotifyException
 from spotipy.oauth2 import SpotifyClientCredentials
-from typing import Dict, List, Optional, Any
+from typing import Callable, Dict, List, Optional, Any, Iterable, Tuple
+from collections import OrderedDict
+import asyncio
 import os
+import threading
+import time
+from track_store import TrackStore
+from entity_extraction import normalize_key
+from resilience import Upstream
 
 
 def initialize_spotify(client_id: str, client_secret: str) -> spotipy.Spotify:
@@ -45,7 +53,8 @@ def get_playlist_data(sp: spotipy.Spotify, playlist_url: str) -> Dict[str, Any]:
         playlist_url: Spotify playlist URL
 
     Returns:
-        dict: Contains playlist_info and tracks_data
+        dict: Contains playlist_info and tracks_data (a TrackStore, shared
+              with playlist_info["tracks"])
     """
     # Get playlist data
     playlist_id = get_playlist_id(playlist_url)
@@ -60,31 +69,17 @@ def get_playlist_data(sp: spotipy.Spotify, playlist_url: str) -> Dict[str, Any]:
     print(f"Description: {playlist['description']}")
     print("=" * 80)
 
-    # Extract tracks
-    tracks_data = []
+    # Extract tracks into a columnar store (rows read like the old track dicts)
+    tracks_data = TrackStore()
     results = sp.playlist_tracks(playlist_id)
 
     for idx, item in enumerate(results["items"], 1):
         track = item["track"]
         if track:
-            track_info = {
-                "name": track["name"],
-                "artists": [artist["name"] for artist in track["artists"]],
-                "artist_names": ", ".join(
-                    [artist["name"] for artist in track["artists"]]
-                ),
-                "album": track["album"]["name"],
-                "id": track["id"],
-                "uri": track["uri"],
-                "popularity": track["popularity"],
-                "preview_url": track["preview_url"],
-                "external_url": track.get("external_urls", {}).get("spotify", None),
-                "album_image": track["album"]["images"][0]["url"]
-                if track["album"]["images"]
-                else None,
-            }
-            tracks_data.append(track_info)
-            print(f"[{idx}] {track_info['name']} - {track_info['artist_names']}")
+            row = tracks_data.append_spotify_track(track)
+            print(
+                f"[{idx}] {tracks_data.names[row]} - {', '.join(tracks_data.artists[row])}"
+            )
 
     print(f"\nExtracted {len(tracks_data)} tracks from playlist")
 
@@ -100,6 +95,51 @@ def get_playlist_data(sp: spotipy.Spotify, playlist_url: str) -> Dict[str, Any]:
     return {"playlist_info": playlist_data, "tracks_data": tracks_data}
 
 
+def is_spotify_outage(error: Exception) -> bool:
+    """Whether an error means Spotify itself is failing (not a bad request)"""
+    if isinstance(error, SpotifyException):
+        return error.http_status == 429 or error.http_status >= 500
+    return True
+
+
+def fetch_spotify_song(
+    sp: spotipy.Spotify, song_name: str, artist_name: str
+) -> Optional[Dict[str, Any]]:
+    """
+    Search Spotify for a song, letting API errors propagate
+
+    Args:
+        sp: Spotify client object
+        song_name: Name of the song
+        artist_name: Name of the artist
+
+    Returns:
+        dict: Track information or None if not found
+    """
+    query = f"track:{song_name} artist:{artist_name}"
+    results = sp.search(q=query, type="track", limit=1)
+
+    if results["tracks"]["items"]:
+        track = results["tracks"]["items"][0]
+        return {
+            "name": track["name"],
+            "artist": ", ".join([a["name"] for a in track["artists"]]),
+            "album": track["album"]["name"],
+            "release_date": track["album"]["release_date"],
+            "popularity": track["popularity"],
+            "duration_ms": track["duration_ms"],
+            "duration_readable": f"{track['duration_ms'] // 60000}:{(track['duration_ms'] % 60000) // 1000:02d}",
+            "preview_url": track["preview_url"],
+            "external_url": track["external_urls"]["spotify"],
+            "uri": track["uri"],
+            "album_art": track["album"]["images"][0]["url"]
+            if track["album"]["images"]
+            else None,
+            "id": track["id"],
+        }
+    return None
+
+
 def search_spotify_song(
     sp: spotipy.Spotify, song_name: str, artist_name: str
 ) -> Optional[Dict[str, Any]]:
@@ -112,73 +152,336 @@ def search_spotify_song(
         artist_name: Name of the artist
 
     Returns:
-        dict: Track information or None if not found
+        dict: Track information or None if not found (or on API errors)
     """
     try:
-        query = f"track:{song_name} artist:{artist_name}"
-        results = sp.search(q=query, type="track", limit=1)
-
-        if results["tracks"]["items"]:
-            track = results["tracks"]["items"][0]
-            return {
-                "name": track["name"],
-                "artist": ", ".join([a["name"] for a in track["artists"]]),
-                "album": track["album"]["name"],
-                "release_date": track["album"]["release_date"],
-                "popularity": track["popularity"],
-                "duration_ms": track["duration_ms"],
-                "duration_readable": f"{track['duration_ms'] // 60000}:{(track['duration_ms'] % 60000) // 1000:02d}",
-                "preview_url": track["preview_url"],
-                "external_url": track["external_urls"]["spotify"],
-                "uri": track["uri"],
-                "album_art": track["album"]["images"][0]["url"]
-                if track["album"]["images"]
-                else None,
-                "id": track["id"],
-            }
+        return fetch_spotify_song(sp, song_name, artist_name)
     except Exception as e:
         print(f"   Error searching for '{song_name}': {e}")
 
     return None
 
 
-def search_spotify_recommendations(
-    sp: spotipy.Spotify, gpt_recommendations: List[Dict[str, str]]
+class SpotifyCatalogCache:
+    """
+    LRU cache of search_spotify_song results keyed by normalized song/artist
+    (misses are cached too so unknown songs aren't searched again)
+    """
+
+    def __init__(self, max_size: int = 5000):
+        self.max_size = max_size
+        # (song, artist) key -> track dict or None, least recently used first
+        self._entries = OrderedDict()
+        # Searches run in worker threads (see validate_candidates)
+        self._lock = threading.Lock()
+
+    def get(
+        self, song_name: str, artist_name: str
+    ) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """Return (cached, track) without searching"""
+        key = normalize_key(song_name, artist_name)
+        with self._lock:
+            if key not in self._entries:
+                return False, None
+            self._entries.move_to_end(key)
+            return True, self._entries[key]
+
+    def put(
+        self, song_name: str, artist_name: str, track: Optional[Dict[str, Any]]
+    ) -> None:
+        key = normalize_key(song_name, artist_name)
+        with self._lock:
+            self._entries[key] = track
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def search(
+        self, sp: spotipy.Spotify, song_name: str, artist_name: str
+    ) -> Optional[Dict[str, Any]]:
+        """
+        fetch_spotify_song through the cache (API errors propagate and are
+        not cached, so a failed lookup isn't remembered as a miss)
+        """
+        cached, track = self.get(song_name, artist_name)
+        if not cached:
+            track = fetch_spotify_song(sp, song_name, artist_name)
+            self.put(song_name, artist_name, track)
+        return track
+
+    async def lookup(
+        self,
+        sp: spotipy.Spotify,
+        song_name: str,
+        artist_name: str,
+        upstream: Optional[Upstream] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        search() in a worker thread, through the upstream's circuit breaker
+        and bulkhead when given (None on errors, which are printed)
+        """
+        cached, track = self.get(song_name, artist_name)
+        if cached:
+            return track
+        try:
+            if upstream is None:
+                return await asyncio.to_thread(self.search, sp, song_name, artist_name)
+            return await upstream.call(self.search, sp, song_name, artist_name)
+        except Exception as e:
+            print(f"   Error searching for '{song_name}': {e}")
+            return None
+
+
+class PlaylistCache:
+    """
+    get_playlist_data results by playlist ID, fresh for ttl seconds
+    (least recently used entries go first beyond max_size)
+
+    Used from the event loop only, so no locking is needed.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 300.0,
+        max_size: int = 256,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._clock = clock
+        # Playlist ID -> (stored at, get_playlist_data result)
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    def age(self, playlist_id: str) -> Optional[float]:
+        """Seconds since the playlist was stored, None if missing or expired"""
+        entry = self._entries.get(playlist_id)
+        if entry is None:
+            return None
+        age = self._clock() - entry[0]
+        if age >= self.ttl:
+            del self._entries[playlist_id]
+            return None
+        return age
+
+    def get(self, playlist_id: str) -> Optional[Dict[str, Any]]:
+        if self.age(playlist_id) is None:
+            return None
+        self._entries.move_to_end(playlist_id)
+        return self._entries[playlist_id][1]
+
+    def put(self, playlist_id: str, playlist_result: Dict[str, Any]) -> None:
+        if self.ttl <= 0:
+            return
+        self._entries[playlist_id] = (self._clock(), playlist_result)
+        self._entries.move_to_end(playlist_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+async def validate_candidates(
+    sp: spotipy.Spotify,
+    candidates: List[Dict[str, Any]],
+    catalog: SpotifyCatalogCache,
+    limit: int = 20,
+    exclude_ids: Optional[Iterable[str]] = None,
+    deadline: Optional[float] = None,
+    upstream: Optional[Upstream] = None,
 ) -> List[Dict[str, Any]]:
     """
-    Step 6: Search Spotify for Recommended Songs
+    Keep the Reddit candidates that exist on Spotify (searches run in parallel)
 
     Args:
         sp: Spotify client object
-        gpt_recommendations: List of dicts with 'song' and 'artist' keys
+        candidates: Scored song candidates (see entity_extraction.extract_candidates)
+        catalog: Cache of Spotify search results
+        limit: Number of best candidates to check
+        exclude_ids: Spotify track IDs to drop (e.g. songs already in the playlist)
+        deadline: Seconds to wait for searches, unfinished ones count as misses
+                  (None = wait for all)
+        upstream: Spotify circuit breaker/bulkhead for the searches
 
     Returns:
-        list: List of found Spotify tracks
+        list: Candidates with canonical song/artist names and the Spotify track
+              under "track", best score first
     """
-    print("=" * 80)
-    print("SEARCHING SPOTIFY FOR RECOMMENDATIONS")
-    print("=" * 80)
+    exclude_ids = set(exclude_ids or [])
+    checked = candidates[:limit]
+    tasks = [
+        asyncio.create_task(catalog.lookup(sp, c["song"], c["artist"], upstream))
+        for c in checked
+    ]
+    if tasks:
+        _, pending = await asyncio.wait(tasks, timeout=deadline)
+        if pending:
+            print(f"Deadline hit, {len(pending)} Spotify lookups unfinished")
+            for task in pending:
+                task.cancel()
+    tracks = [
+        task.result() if task.done() and not task.cancelled() else None
+        for task in tasks
+    ]
+
+    validated = []
+    seen_ids = set()
+    for candidate, track in zip(checked, tracks):
+        if not track or track["id"] in exclude_ids or track["id"] in seen_ids:
+            continue
+        seen_ids.add(track["id"])
+        validated.append(
+            dict(candidate, song=track["name"], artist=track["artist"], track=track)
+        )
 
-    final_recommendations = []
+    print(f"Validated {len(validated)}/{len(checked)} Reddit candidates on Spotify")
+    return validated
+
+
+class SpotifyPrefetcher:
+    """
+    Speculative catalog lookups for songs GPT is likely to pick
+
+    Started while the GPT call is in flight so that Step 6 finds its picks
+    already in the catalog cache. Tracks hit-rate statistics for tuning.
+    """
 
-    for idx, rec in enumerate(gpt_recommendations, 1):
+    def __init__(
+        self,
+        sp: spotipy.Spotify,
+        catalog: SpotifyCatalogCache,
+        budget: int = 10,
+        upstream: Optional[Upstream] = None,
+    ):
+        self.sp = sp
+        self.catalog = catalog
+        self.budget = budget
+        self.upstream = upstream
+        # Normalized (song, artist) key -> lookup task
+        self._tasks: Dict[Tuple[str, str], asyncio.Task] = {}
+        self.stats = {"prefetched": 0, "picks": 0, "cache_hits": 0, "prefetch_hits": 0}
+
+    def start(self, candidates: List[Dict[str, Any]]) -> None:
+        """
+        Look up the most-mentioned candidates not already cached (in the background)
+
+        Args:
+            candidates: Song candidates with song, artist, score and mentions keys
+                        (see entity_extraction.extract_candidates)
+        """
+        ranked = sorted(
+            candidates, key=lambda c: (c["mentions"], c["score"]), reverse=True
+        )
+        for candidate in ranked:
+            if len(self._tasks) >= self.budget:
+                break
+            song, artist = candidate["song"], candidate["artist"]
+            key = normalize_key(song, artist)
+            if key in self._tasks or self.catalog.get(song, artist)[0]:
+                continue
+            self._tasks[key] = asyncio.create_task(
+                self.catalog.lookup(self.sp, song, artist, self.upstream)
+            )
+        self.stats["prefetched"] = len(self._tasks)
+        print(f"Prefetching {len(self._tasks)} likely picks from Spotify")
+
+    async def resolve(
+        self, recommendations: List[Dict[str, str]], deadline: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Wait for the lookups matching GPT's picks, drop the rest, update stats
+
+        Args:
+            recommendations: GPT picks (dicts with 'song' and 'artist' keys)
+            deadline: Seconds to wait for the matching lookups (None = no limit)
+
+        Returns:
+            dict: prefetched, picks, cache_hits (picks already in the catalog),
+                  prefetch_hits (picks the prefetch looked up), hit_rate
+                  (prefetch_hits / picks) and precision (prefetch_hits / prefetched)
+        """
+        keys = [normalize_key(rec["song"], rec["artist"]) for rec in recommendations]
+        wanted = [self._tasks[key] for key in set(keys) if key in self._tasks]
+        if wanted:
+            await asyncio.wait(wanted, timeout=deadline)
+        for task in self._tasks.values():
+            if not task.done():
+                # The worker thread still finishes and fills the cache
+                task.cancel()
+
+        self.stats["picks"] = len(keys)
+        self.stats["prefetch_hits"] = sum(key in self._tasks for key in keys)
+        self.stats["cache_hits"] = sum(
+            self.catalog.get(rec["song"], rec["artist"])[0] for rec in recommendations
+        )
+        self.stats["hit_rate"] = self.stats["prefetch_hits"] / max(len(keys), 1)
+        self.stats["precision"] = self.stats["prefetch_hits"] / max(len(self._tasks), 1)
         print(
-            f"\n[{idx}/{len(gpt_recommendations)}] Searching: {rec['song']} - {rec['artist']}"
+            f"Prefetch: {self.stats['prefetch_hits']}/{len(keys)} picks prefetched "
+            f"({self.stats['prefetched']} lookups), {self.stats['cache_hits']} picks cached"
         )
+        return self.stats
+
+
+async def search_spotify_until(
+    sp: spotipy.Spotify,
+    recommendations: List[Dict[str, str]],
+    num_needed: int,
+    catalog: SpotifyCatalogCache,
+    exclude_ids: Optional[Iterable[str]] = None,
+    concurrency: int = 5,
+    deadline: Optional[float] = None,
+    upstream: Optional[Upstream] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Step 6 (concurrent): Search Spotify for ranked picks until enough are found
 
-        spotify_track = search_spotify_song(sp, rec["song"], rec["artist"])
+    Searches run in parallel, but results are taken in rank order, so the
+    outcome is the same as searching one by one and stopping at num_needed
+    found tracks. Searches that haven't started by then are cancelled.
 
-        if spotify_track:
-            final_recommendations.append(spotify_track)
-            print(f"         Found on Spotify!")
-            print(f"            Album: {spotify_track['album']}")
-            print(f"            Popularity: {spotify_track['popularity']}/100")
-            print(f"            URL: {spotify_track['external_url']}")
-        else:
-            print(f"         Not found on Spotify")
+    Args:
+        sp: Spotify client object
+        recommendations: Ranked picks (dicts with 'song' and 'artist' keys)
+        num_needed: Number of found tracks to stop at
+        catalog: Cache of Spotify search results
+        exclude_ids: Spotify track IDs to skip (e.g. songs already in the playlist)
+        concurrency: Maximum searches running at once
+        deadline: Seconds to search before returning the tracks found so far
+                  (None = no deadline)
+        upstream: Spotify circuit breaker/bulkhead for the searches
 
-    print(
-        f"\nSuccessfully found {len(final_recommendations)}/{len(gpt_recommendations)} recommendations on Spotify"
-    )
+    Returns:
+        list: Up to num_needed found Spotify tracks, in rank order
+    """
+    exclude_ids = set(exclude_ids or [])
+    semaphore = asyncio.Semaphore(concurrency)
 
-    return final_recommendations
+    async def lookup(rec: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        async with semaphore:
+            return await catalog.lookup(sp, rec["song"], rec["artist"], upstream)
+
+    tasks = [asyncio.create_task(lookup(rec)) for rec in recommendations]
+    found = []
+    try:
+        async with asyncio.timeout(deadline):
+            for idx, (rec, task) in enumerate(zip(recommendations, tasks), 1):
+                if len(found) >= num_needed:
+                    break
+                track = await task
+                label = (
+                    f"[{idx}/{len(recommendations)}] {rec['song']} - {rec['artist']}"
+                )
+                if not track:
+                    print(f"   {label}: not found on Spotify")
+                elif track["id"] in exclude_ids:
+                    print(f"   {label}: already in the playlist")
+                else:
+                    exclude_ids.add(track["id"])
+                    found.append(track)
+                    print(f"   {label}: found ({track['album']})")
+    except TimeoutError:
+        print(f"   Deadline hit after {deadline:.1f}s, keeping the tracks found so far")
+    finally:
+        skipped = sum(task.cancel() for task in tasks)
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    print(f"Found {len(found)}/{num_needed} tracks, {skipped} searches cancelled")
+    return found
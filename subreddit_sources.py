@@ -0,0 +1,155 @@
+"""
+Subreddit Sources Module
+Which subreddits besides the main one a request searches:
+- Configurable sources with a ranking weight and a per-request post cap
+- Genre subreddits picked per request from the playlist's artists
+- Subreddits that answered the same artist queries before (local index)
+"""
+
+import math
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class SubredditSource:
+    """One subreddit the Reddit step can search"""
+
+    name: str
+    weight: float = 1.0  # multiplies post/comment scores from this subreddit
+    max_posts: int = 10  # posts kept from this subreddit per request
+    # Playlist artists that make this subreddit relevant (empty = any playlist)
+    artists: Tuple[str, ...] = ()
+
+
+# Extra subreddits, each only searched with the artist queries
+DEFAULT_SUBREDDIT_SOURCES: Tuple[SubredditSource, ...] = (
+    SubredditSource("ifyoulikeblank", weight=1.5),
+    SubredditSource("listentothis", weight=0.8),
+    SubredditSource(
+        "indieheads",
+        weight=1.2,
+        artists=(
+            "Radiohead",
+            "Arctic Monkeys",
+            "The Strokes",
+            "Tame Impala",
+            "Phoebe Bridgers",
+            "Mitski",
+            "Alvvays",
+            "Big Thief",
+            "Mac DeMarco",
+            "Vampire Weekend",
+        ),
+    ),
+    SubredditSource(
+        "hiphopheads",
+        weight=1.2,
+        artists=(
+            "Kendrick Lamar",
+            "Drake",
+            "Kanye West",
+            "Travis Scott",
+            "J. Cole",
+            "Tyler, The Creator",
+            "Frank Ocean",
+            "Mac Miller",
+            "MF DOOM",
+            "A$AP Rocky",
+        ),
+    ),
+    SubredditSource(
+        "popheads",
+        weight=1.1,
+        artists=(
+            "Taylor Swift",
+            "Dua Lipa",
+            "Ariana Grande",
+            "Charli xcx",
+            "Lorde",
+            "Carly Rae Jepsen",
+            "Olivia Rodrigo",
+            "Billie Eilish",
+            "Sabrina Carpenter",
+            "Chappell Roan",
+        ),
+    ),
+    SubredditSource(
+        "electronicmusic",
+        weight=1.1,
+        artists=(
+            "Daft Punk",
+            "Aphex Twin",
+            "Four Tet",
+            "Fred again..",
+            "Flume",
+            "Disclosure",
+            "Caribou",
+            "Bonobo",
+            "Jamie xx",
+            "Justice",
+        ),
+    ),
+    SubredditSource(
+        "metal",
+        weight=1.1,
+        artists=(
+            "Metallica",
+            "Iron Maiden",
+            "Slayer",
+            "Gojira",
+            "Mastodon",
+            "Opeth",
+            "Black Sabbath",
+            "Megadeth",
+            "Tool",
+            "System Of A Down",
+        ),
+    ),
+)
+
+
+def choose_subreddits(
+    sources: Iterable[SubredditSource],
+    playlist_artists: Iterable[str],
+    max_sources: int,
+    exclude: str = "",
+    index_yield: Optional[Dict[str, int]] = None,
+) -> List[SubredditSource]:
+    """
+    Pick the extra subreddits for one request
+
+    A source scores weight * (1 + playlist artists it lists + log(1 + posts
+    it returned for these artists before)). Genre sources with neither
+    artist matches nor past posts are never picked.
+
+    Args:
+        sources: Configured subreddit sources
+        playlist_artists: Artist names of the playlist
+        max_sources: Maximum number of subreddits to pick
+        exclude: Subreddit already searched (the main one)
+        index_yield: Subreddit -> posts the local index holds for the
+                     request's artist queries (RedditIndex.subreddit_yield)
+
+    Returns:
+        list: Picked sources, best first (config order on ties)
+    """
+    artists = {" ".join(artist.lower().split()) for artist in playlist_artists}
+    index_yield = index_yield or {}
+
+    scored = []
+    for source in sources:
+        if source.name.lower() == exclude.lower():
+            continue
+        matches = sum(
+            1
+            for artist in source.artists
+            if " ".join(artist.lower().split()) in artists
+        )
+        past_posts = index_yield.get(source.name, 0)
+        if source.artists and not matches and not past_posts:
+            continue
+        scored.append((source.weight * (1 + matches + math.log1p(past_posts)), source))
+
+    scored.sort(key=lambda item: item[0], reverse=True)
+    return [source for _, source in scored[:max_sources]]
@@ -0,0 +1,70 @@
+"""
+Test Fixtures
+Offline pipeline fixtures built on the fake clients in fakes.py
+"""
+
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fakes import FakeOpenAI, FakeReddit, FakeSpotify
+
+
+@pytest.fixture
+def fake_clients():
+    """
+    Factory of PipelineClients backed by fakes, for
+    main.get_recommendations(..., clients=...)
+
+    Usage: clients = fake_clients(spotify_latency=0.02, reddit_latency=0.05)
+    The fakes are clients.spotify, clients.openai and clients.reddit.
+    """
+    import main
+
+    def make(
+        spotify_latency: float = 0.0,
+        reddit_latency: float = 0.0,
+        openai_latency: float = 0.0,
+        **reddit_options,
+    ) -> "main.PipelineClients":
+        return main.PipelineClients(
+            FakeSpotify(spotify_latency),
+            FakeOpenAI(openai_latency),
+            FakeReddit(reddit_latency, **reddit_options),
+        )
+
+    return make
+
+
+@pytest.fixture
+def fake_services(monkeypatch):
+    """
+    Install fakes as main's shared clients, so the API and requests made
+    without `clients` run offline too (fresh playlist and catalog caches,
+    no local Reddit index)
+
+    Returns:
+        SimpleNamespace: spotify, openai and reddit fakes
+    """
+    import asyncpraw
+    import main
+    from spotify_api import PlaylistCache, SpotifyCatalogCache
+
+    fakes = SimpleNamespace(
+        spotify=FakeSpotify(), openai=FakeOpenAI(), reddit=FakeReddit()
+    )
+    monkeypatch.setattr(main, "_spotify_client", fakes.spotify)
+    monkeypatch.setattr(main, "_openai_client", fakes.openai)
+    monkeypatch.setattr(asyncpraw, "Reddit", lambda **credentials: fakes.reddit)
+    monkeypatch.setattr(main, "REDDIT_INDEX_PATH", None)
+    monkeypatch.setattr(main, "_reddit_index", None)
+    monkeypatch.setattr(
+        main, "playlist_cache", PlaylistCache(main.PLAYLIST_CACHE_TTL_SECONDS)
+    )
+    monkeypatch.setattr(main, "spotify_catalog", SpotifyCatalogCache())
+    return fakes
@@ -0,0 +1,251 @@
+"""
+Fake API Clients
+Offline stand-ins for spotipy.Spotify, asyncpraw.Reddit and the OpenAI
+client, for end-to-end and benchmark tests:
+- Configurable latency per call (blocking sleeps for the sync Spotify and
+  OpenAI clients, like their HTTP calls; awaited sleeps for asyncpraw)
+- Reddit threads with nested comment trees and "load more" placeholders
+- Every fake counts its calls and the most calls it had in flight at once
+"""
+
+import asyncio
+import json
+import threading
+import time
+import zlib
+from collections import Counter
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+
+class CallCounter:
+    """Calls per method and peak concurrency, safe across worker threads"""
+
+    def __init__(self):
+        self.calls: Counter = Counter()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def total(self) -> int:
+        return sum(self.calls.values())
+
+    def enter(self, method: str) -> None:
+        with self._lock:
+            self.calls[method] += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def exit(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+
+def fake_track(name: str, artist: str) -> Dict[str, Any]:
+    """Spotify track object (the fields spotify_api reads)"""
+    track_id = f"{zlib.crc32(f'{name}|{artist}'.encode()):08x}"
+    return {
+        "name": name,
+        "id": track_id,
+        "uri": f"spotify:track:{track_id}",
+        "artists": [{"name": artist}],
+        "album": {"name": f"{artist} Album", "images": [], "release_date": "2001"},
+        "popularity": zlib.crc32(name.encode()) % 100,
+        "duration_ms": 200000,
+        "preview_url": None,
+        "external_urls": {"spotify": f"https://open.spotify.com/track/{track_id}"},
+    }
+
+
+class FakeSpotify(CallCounter):
+    """
+    spotipy.Spotify stand-in: one playlist of num_tracks tracks by
+    num_artists artists. Searches find every song except those whose
+    name is in `missing`.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        num_tracks: int = 30,
+        num_artists: int = 6,
+        missing: Optional[set] = None,
+    ):
+        super().__init__()
+        self.latency = latency
+        self.missing = missing or set()
+        self.tracks = [
+            fake_track(f"Playlist Song {i}", f"Playlist Artist {i % num_artists}")
+            for i in range(num_tracks)
+        ]
+
+    def _call(self, method: str) -> None:
+        self.enter(method)
+        try:
+            time.sleep(self.latency)
+        finally:
+            self.exit()
+
+    def playlist(self, playlist_id: str, **kwargs) -> Dict[str, Any]:
+        self._call("playlist")
+        return {
+            "name": "Fake Playlist",
+            "owner": {"display_name": "tester"},
+            "tracks": {"total": len(self.tracks)},
+            "description": "",
+            "images": [],
+        }
+
+    def playlist_tracks(self, playlist_id: str, **kwargs) -> Dict[str, Any]:
+        self._call("playlist_tracks")
+        return {"items": [{"track": track} for track in self.tracks], "next": None}
+
+    def search(self, q: str, type: str = "track", limit: int = 10, **kwargs):
+        self._call("search")
+        song = q.split("track:")[1].split(" artist:")[0]
+        artist = q.split("artist:")[1]
+        if song in self.missing:
+            return {"tracks": {"items": []}}
+        return {"tracks": {"items": [fake_track(song, artist)]}}
+
+
+class FakeOpenAI(CallCounter):
+    """
+    OpenAI client stand-in: every chat completion answers num_picks songs
+    (as JSON), after `latency` seconds
+    """
+
+    def __init__(self, latency: float = 0.0, num_picks: int = 15):
+        super().__init__()
+        self.latency = latency
+        self.num_picks = num_picks
+        self.prompts: List[str] = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def with_options(self, **options) -> "FakeOpenAI":
+        return self
+
+    def _create(self, **kwargs):
+        self.enter("chat.completions.create")
+        try:
+            time.sleep(self.latency)
+        finally:
+            self.exit()
+        self.prompts.append(kwargs["messages"][-1]["content"])
+        picks = [
+            {"song": f"Reddit Song {i}", "artist": f"Mentioned Artist {i % 5}"}
+            for i in range(self.num_picks)
+        ]
+        return SimpleNamespace(
+            choices=[
+                SimpleNamespace(message=SimpleNamespace(content=json.dumps(picks)))
+            ]
+        )
+
+
+class FakeReddit(CallCounter):
+    """
+    asyncpraw.Reddit stand-in: every search returns posts_per_search
+    recommendation threads, each with a comment tree (top-level comments
+    with one reply each, and a "load more" placeholder). Each comment says
+    its recommendation `comment_repeat` times (long threads). Searching costs
+    `latency` before the first post, loading a thread's comments
+    (replace_more) costs `latency` again. Search queries are kept in
+    `queries`.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        posts_per_search: int = 5,
+        comments_per_post: int = 4,
+        comment_repeat: int = 1,
+        **credentials: Any,
+    ):
+        super().__init__()
+        self.latency = latency
+        self.posts_per_search = posts_per_search
+        self.comments_per_post = comments_per_post
+        self.comment_repeat = comment_repeat
+        self.queries: List[str] = []
+
+    async def __aenter__(self) -> "FakeReddit":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        pass
+
+    async def subreddit(self, name: str) -> "_FakeSubreddit":
+        return _FakeSubreddit(self, name)
+
+    async def _wait(self, method: str) -> None:
+        self.enter(method)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.exit()
+
+
+class _FakeSubreddit:
+    def __init__(self, reddit: FakeReddit, name: str):
+        self._reddit = reddit
+        self.display_name = name
+
+    def search(self, query: str, limit: int = 20):
+        return self._search(query, limit)
+
+    async def _search(self, query: str, limit: int):
+        reddit = self._reddit
+        reddit.queries.append(query)
+        await reddit._wait("search")
+        seed = zlib.crc32(f"{self.display_name}|{query}".encode())
+        for i in range(min(limit, reddit.posts_per_search)):
+            comments = []
+            for j in range(reddit.comments_per_post):
+                n = (seed + i * 7 + j) % 20
+                reply = _comment(f"Try Reddit Song {n + 1} - Mentioned Artist {n % 5}")
+                body = f'Check out "Reddit Song {n}" by Mentioned Artist {n % 5}. '
+                comments.append(_comment(body * reddit.comment_repeat, replies=[reply]))
+            yield SimpleNamespace(
+                title=f"Songs similar to {query}? ({i})",
+                selftext=f"Looking for recommendations like {query}",
+                score=10 + (seed + i) % 50,
+                permalink=f"/r/{self.display_name}/comments/{seed:x}{i}/",
+                comments=_FakeCommentForest(reddit, comments),
+            )
+
+
+def _comment(body: str, replies: Optional[List[Any]] = None) -> SimpleNamespace:
+    return SimpleNamespace(
+        body=body, score=12, author="fake_user", replies=replies or []
+    )
+
+
+class _FakeMoreComments:
+    """Placeholder for unloaded replies (no body, like asyncpraw's MoreComments)"""
+
+
+class _FakeCommentForest:
+    def __init__(self, reddit: FakeReddit, comments: List[Any]):
+        self._reddit = reddit
+        self._comments = comments + [_FakeMoreComments()]
+
+    async def replace_more(self, limit: Optional[int] = 0) -> List[Any]:
+        await self._reddit._wait("comments")
+        self._comments = [
+            c for c in self._comments if not isinstance(c, _FakeMoreComments)
+        ]
+        return []
+
+    def list(self) -> List[Any]:
+        """Every comment of the tree, breadth first (CommentForest.list)"""
+        flat, queue = [], list(self._comments)
+        while queue:
+            comment = queue.pop(0)
+            flat.append(comment)
+            queue += getattr(comment, "replies", [])
+        return flat
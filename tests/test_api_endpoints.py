@@ -3,10 +3,28 @@ API Endpoint Tests
 Tests for FastAPI endpoints including success and error cases
 """
 
+import os
 import pytest
 import requests
 
-BASE_URL = "https://reddit-jams-backend.vercel.app"  # vercel app
+BASE_URL = os.getenv(
+    "REDDITJAMS_API_URL", "https://reddit-jams-backend.vercel.app"
+)  # vercel app
+
+
+def _reachable(url: str) -> bool:
+    try:
+        requests.get(url, timeout=5)
+        return True
+    except requests.RequestException:
+        return False
+
+
+# These run against a deployment and are skipped offline (test_benchmarks.py
+# runs a recommendation request through the API with fake services)
+pytestmark = pytest.mark.skipif(
+    not _reachable(f"{BASE_URL}/api/health"), reason=f"{BASE_URL} not reachable"
+)
 
 
 def test_health_check():
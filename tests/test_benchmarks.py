@@ -0,0 +1,244 @@
+"""
+Benchmark Tests
+End-to-end and performance tests of the pipeline, offline (fake Spotify,
+Reddit and OpenAI clients with latency, see fakes.py and conftest.py):
+- The event loop is never blocked longer than MAX_LOOP_BLOCK_MS
+- External calls per request stay within their budgets
+- Reddit and Spotify stages run their calls in parallel
+"""
+
+import contextlib
+import io
+import os
+import sys
+
+import pytest
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import main
+from ai_analysis import MAX_PROMPT_POSTS
+from fakes import FakeReddit, FakeSpotify
+from profiling import LoopBlockingWatchdog
+from reddit_api import get_reddit_recommendations
+from reddit_index import RedditIndex, artist_seed_query
+from spotify_api import SpotifyCatalogCache, search_spotify_until
+
+PLAYLIST_URL = "https://open.spotify.com/playlist/3XyDvjoxiae0oWpfJ4kga9"
+
+# Latency of one call to each fake service, in seconds
+SPOTIFY_LATENCY = 0.02
+REDDIT_LATENCY = 0.05
+OPENAI_LATENCY = 0.1
+
+# Longest the event loop may be blocked during a request
+MAX_LOOP_BLOCK_MS = 100
+
+# External calls one default ("balanced") request may make
+MAX_SPOTIFY_CALLS = 30  # playlist + tracks, candidate checks, prefetch, picks
+MAX_REDDIT_CALLS = 50  # searches (no index: none OR-combined) + comment tree loads
+MAX_OPENAI_CALLS = 2  # recommendations + one fill-up follow-up
+
+
+async def run_request(clients, **overrides) -> dict:
+    """One request with fixed track/artist picks, console output hidden"""
+    settings = main.get_settings(selection_seed=0, **overrides)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return await main.get_recommendations(
+            PLAYLIST_URL, settings=settings, clients=clients
+        )
+
+
+class TestEndToEnd:
+    """Whole requests through the pipeline and the API, offline"""
+
+    @pytest.mark.asyncio
+    async def test_full_request(self, fake_clients):
+        """Test a full-mode request finds every recommendation"""
+        clients = fake_clients()
+        result = await run_request(clients)
+
+        assert len(result["final_recommendations"]) == 5
+        assert result["metadata"]["degraded_stages"] == {}
+        assert result["metadata"]["num_reddit_posts"] > 0
+        # GPT saw the Reddit evidence
+        assert "Reddit Song" in clients.openai.prompts[0]
+
+    @pytest.mark.asyncio
+    async def test_reddit_posts_capped_with_ranking_headroom(self, fake_clients):
+        """Test searches collect more posts than the prompt shows, up to the cap"""
+        assert MAX_PROMPT_POSTS < main.get_settings().reddit_max_total_posts
+        cap = MAX_PROMPT_POSTS + 5
+        result = await run_request(
+            fake_clients(), reddit_evidence_target=None, reddit_max_total_posts=cap
+        )
+
+        assert result["metadata"]["num_reddit_posts"] == cap
+        assert result["metadata"]["reddit_complete"] is False
+
+    @pytest.mark.asyncio
+    async def test_fast_request_skips_openai(self, fake_clients):
+        """Test a fast-mode request never calls OpenAI"""
+        clients = fake_clients()
+        result = await run_request(clients, mode="fast")
+
+        assert len(result["final_recommendations"]) == 5
+        assert clients.openai.total == 0
+
+    @pytest.mark.asyncio
+    async def test_gpt_timeout_without_deadline(self, fake_clients, monkeypatch):
+        """Test an OpenAI timeout with no request deadline falls back to Reddit"""
+        clients = fake_clients()
+        scored = []
+
+        def time_out(**kwargs):
+            raise TimeoutError
+
+        def score_comentions(posts):
+            scored.append(len(posts))
+            return real_score_comentions(posts)
+
+        real_score_comentions = main.score_comentions
+        monkeypatch.setattr(main, "score_comentions", score_comentions)
+        clients.openai.chat.completions.create = time_out
+        result = await run_request(
+            clients, request_deadline_seconds=None, use_candidate_table=False
+        )
+
+        assert result["metadata"]["degraded_stages"]["gpt"] == "no answer in time"
+        assert len(result["final_recommendations"]) == 5
+        # The fallback reused the one local ranking of the Reddit mentions
+        assert len(scored) == 1
+
+    def test_api_recommendation(self, fake_services):
+        """Test the recommendations endpoint answers with the shared clients"""
+        from fastapi.testclient import TestClient
+        import fastapi_endpoint
+
+        client = TestClient(fastapi_endpoint.app)
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = client.post(
+                "/api/recommendations", json={"playlist_url": PLAYLIST_URL}
+            )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["success"] is True
+        assert data["playlist_details"]["name"] == "Fake Playlist"
+        assert len(data["recommendations"]) == 5
+        assert fake_services.spotify.calls["playlist"] == 1
+
+
+class TestPerformanceLimits:
+    """Performance limits with realistic latency on every fake service"""
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "reddit_options, overrides",
+        [
+            ({}, {}),
+            # Long threads until the request's text budget (1 MB) is reached
+            (
+                dict(posts_per_search=20, comments_per_post=15, comment_repeat=20),
+                dict(reddit_evidence_target=None, reddit_max_total_posts=None),
+            ),
+            (
+                dict(posts_per_search=20, comments_per_post=15, comment_repeat=20),
+                dict(
+                    mode="fast",
+                    reddit_evidence_target=None,
+                    reddit_max_total_posts=None,
+                ),
+            ),
+        ],
+        ids=["default", "text_budget", "text_budget_fast"],
+    )
+    async def test_event_loop_never_blocked(
+        self, fake_clients, reddit_options, overrides
+    ):
+        """Test no step blocks the event loop longer than MAX_LOOP_BLOCK_MS"""
+        latencies = dict(
+            spotify_latency=SPOTIFY_LATENCY,
+            reddit_latency=REDDIT_LATENCY,
+            openai_latency=OPENAI_LATENCY,
+            **reddit_options,
+        )
+        # Warm-up, first-use imports and caches aren't what is measured
+        await run_request(fake_clients(**latencies), **overrides)
+
+        watchdog = LoopBlockingWatchdog(MAX_LOOP_BLOCK_MS / 1000)
+        watchdog.start()
+        try:
+            result = await run_request(fake_clients(**latencies), **overrides)
+        finally:
+            with contextlib.redirect_stdout(io.StringIO()):
+                await watchdog.stop()
+
+        assert watchdog.events == [], watchdog.report()
+        if overrides:
+            # Searches stopped at the text budget
+            assert not result["metadata"]["reddit_complete"]
+
+    @pytest.mark.asyncio
+    async def test_external_calls_per_request(self, fake_clients):
+        """Test a request stays within its external call budgets"""
+        clients = fake_clients(
+            spotify_latency=SPOTIFY_LATENCY,
+            reddit_latency=REDDIT_LATENCY,
+            openai_latency=OPENAI_LATENCY,
+        )
+        await run_request(clients)
+
+        assert clients.spotify.calls["playlist"] == 1
+        assert clients.spotify.calls["playlist_tracks"] == 1
+        assert clients.spotify.total <= MAX_SPOTIFY_CALLS
+        assert clients.reddit.total <= MAX_REDDIT_CALLS
+        assert clients.openai.total <= MAX_OPENAI_CALLS
+
+    @pytest.mark.asyncio
+    async def test_reddit_searches_run_in_parallel(self):
+        """Test the Reddit stage (default settings, OR-merged) runs searches at once"""
+        reddit = FakeReddit(REDDIT_LATENCY)
+        tracks_data = [
+            {
+                "name": track["name"],
+                "artists": [track["artists"][0]["name"]],
+                "artist_names": track["artists"][0]["name"],
+                "popularity": track["popularity"],
+            }
+            for track in FakeSpotify().tracks
+        ]
+        # Past runs of every artist query found nothing, so the planner
+        # OR-merges them. Stored without fetch limits, they never answer a
+        # request's lookups, every query still goes to Reddit.
+        index = RedditIndex(":memory:")
+        for artist in {track["artists"][0] for track in tracks_data}:
+            _, query = artist_seed_query(artist)
+            for subreddit in ("music", "ifyoulikeblank", "listentothis"):
+                index.store_query_results(query, subreddit, [])
+        settings = main.get_settings(selection_seed=0, reddit_evidence_target=None)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = await get_reddit_recommendations(
+                *["x"] * 5, tracks_data, settings, index=index, reddit=reddit
+            )
+
+        assert result["complete"] is True
+        assert any(" OR " in query for query in reddit.queries)
+        assert reddit.calls["search"] >= 5
+        # Wall-clock speedups are flaky on busy machines, concurrency isn't
+        assert reddit.max_in_flight >= 5
+
+    @pytest.mark.asyncio
+    async def test_spotify_searches_run_in_parallel(self):
+        """Test Step 6 searches run up to their concurrency limit at once"""
+        sp = FakeSpotify(latency=0.05)
+        picks = [{"song": f"Pick {i}", "artist": "Artist"} for i in range(20)]
+
+        found = await search_spotify_until(
+            sp, picks, len(picks), SpotifyCatalogCache(), concurrency=5
+        )
+
+        assert len(found) == 20
+        assert sp.max_in_flight == 5
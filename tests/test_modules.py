@@ -15,15 +15,85 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")
 # Load environment variables
 load_dotenv()
 
+# Tests calling the live APIs skip without credentials, the offline
+# pipeline tests are in test_benchmarks.py
+requires_spotify = pytest.mark.skipif(
+    not (os.getenv("SPOTIFY_CLIENT_ID") and os.getenv("SPOTIFY_CLIENT_SECRET")),
+    reason="needs SPOTIFY_CLIENT_ID and SPOTIFY_CLIENT_SECRET",
+)
+requires_openai = pytest.mark.skipif(
+    not os.getenv("OPENAI_API_KEY"), reason="needs OPENAI_API_KEY"
+)
+
 # Import modules to test
 from spotify_api import initialize_spotify, get_playlist_id, search_spotify_song
-from ai_analysis import initialize_openai, format_data_for_chatgpt
+from ai_analysis import (
+    initialize_openai,
+    format_data_for_chatgpt,
+    get_chatgpt_recommendations,
+    parse_recommendations,
+    analyze_and_recommend,
+    TOKENS_PER_SONG,
+)
+from track_selection import (
+    make_rng,
+    compute_artist_weights,
+    select_tracks,
+    select_artists,
+)
+from track_store import TrackStore
+from reddit_api import (
+    iter_reddit_recommendations,
+    merge_reddit_streams,
+    rank_reddit_post,
+    get_reddit_recommendations,
+    fetch_limits,
+    _iter_and_index,
+    _iter_posts,
+)
+from reddit_index import FetchLimits, RedditIndex, artist_seed_query
+from entity_extraction import extract_mentions, extract_candidates, merge_candidates
+from spotify_api import (
+    PlaylistCache,
+    SpotifyCatalogCache,
+    SpotifyPrefetcher,
+    is_spotify_outage,
+    search_spotify_until,
+    validate_candidates,
+)
+from fast_path import score_comentions, apply_recommendation_rules
+from deadlines import RequestDeadline
+from pipeline_settings import PipelineSettings, resolve_settings
+from subreddit_sources import SubredditSource, choose_subreddits
+from query_planner import PlannedSearch, SeedSearch, plan_searches
+from resilience import CircuitBreaker, CircuitOpenError, Upstream
+from profiling import profile_request, rotate_profiles
+from cache_warmer import DemandCounter, RateBudget, warm_caches
+from admission import AdmissionRejected, ClientRateLimiter, FairAdmissionQueue
+from snapshots import (
+    SNAPSHOT_SUFFIX,
+    SnapshotMissError,
+    SpotifySnapshotMissError,
+    export_snapshot,
+    load_snapshot,
+    replay_snapshot,
+    save_snapshot,
+    snapshot_paths,
+)
+from text_budget import post_bytes_bound, text_bytes, truncate_utf8
+from similarity_ranker import EmbeddingMatrix, metadata_vector, rerank_by_similarity
+from fastapi.responses import ORJSONResponse
 import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
 
 
 class TestSpotifyAPI:
     """Tests for spotify_api.py"""
 
+    @requires_spotify
     def test_initialize_spotify(self):
         """Test Spotify client initialization"""
         client_id = os.getenv("SPOTIFY_CLIENT_ID")
@@ -37,6 +107,7 @@ class TestSpotifyAPI:
         playlist_id = get_playlist_id(url)
         assert playlist_id == "3XyDvjoxiae0oWpfJ4kga9"
 
+    @requires_spotify
     def test_search_spotify_song(self):
         """Test Spotify song search"""
         client_id = os.getenv("SPOTIFY_CLIENT_ID")
@@ -52,6 +123,7 @@ class TestSpotifyAPI:
 class TestAIAnalysis:
     """Tests for ai_analysis.py"""
 
+    @requires_openai
     def test_initialize_openai(self):
         """Test OpenAI client initialization"""
         api_key = os.getenv("OPENAI_API_KEY")
@@ -75,6 +147,89 @@ class TestAIAnalysis:
         assert "Song 1" in prompt
         assert "JSON array" in prompt
 
+    def test_format_data_with_candidate_table(self):
+        """Test candidates replace the post/comment excerpts in the prompt"""
+        playlist_data = {"name": "Test Playlist", "total_tracks": 10}
+        reddit_data = [
+            {
+                "title": "Bands like Portishead?",
+                "body": "A long body " * 50,
+                "score": 10,
+                "comments": [{"body": "Teardrop - Massive Attack", "score": 5}],
+            }
+        ]
+        candidates = [
+            {"song": "Teardrop", "artist": "Massive Attack", "score": 5, "mentions": 1}
+        ]
+
+        prompt = format_data_for_chatgpt(
+            playlist_data, reddit_data, [], "music", 5, candidates
+        )
+
+        assert "Bands like Portishead?" in prompt
+        assert "1. Teardrop - Massive Attack (score 5, 1 mentions)" in prompt
+        assert "A long body" not in prompt
+
+    def test_parse_recommendations_is_tolerant(self):
+        """Test fenced, wrapped and truncated answers still parse"""
+        expected = [{"song": "Teardrop", "artist": "Massive Attack"}]
+        assert (
+            parse_recommendations(
+                '```json\n[{"song": "Teardrop", "artist": "Massive Attack"}]\n```'
+            )
+            == expected
+        )
+        assert (
+            parse_recommendations(
+                'Sure! {"recommendations": [{"song": "Teardrop", '
+                '"artist": "Massive Attack"}, {"song": "", "artist": "X"}]} Enjoy!'
+            )
+            == expected
+        )
+        assert (
+            parse_recommendations(
+                '[{"song": "Teardrop", "artist": "Massive Attack"}, {"song": "Glo'
+            )
+            == expected
+        )
+        with pytest.raises(ValueError):
+            parse_recommendations('[{"title": "Teardrop"}]')
+
+    def test_retry_with_shorter_prompt(self):
+        """Test one retry after an unparseable answer, no retry on API errors"""
+        client = Mock()
+        answers = ["Sorry, I can't help with that.", '[{"song": "A", "artist": "B"}]']
+        client.chat.completions.create.side_effect = [
+            Mock(choices=[Mock(message=Mock(content=answer))]) for answer in answers
+        ]
+        recommendations = get_chatgpt_recommendations(
+            client, "long prompt", retry_prompt="short prompt"
+        )
+        assert recommendations == [{"song": "A", "artist": "B"}]
+        retry_call = client.chat.completions.create.call_args_list[1]
+        assert retry_call.kwargs["messages"][-1]["content"] == "short prompt"
+        assert retry_call.kwargs["response_format"] == {"type": "json_object"}
+
+        client.chat.completions.create.side_effect = RuntimeError("quota")
+        with pytest.raises(RuntimeError):
+            get_chatgpt_recommendations(client, "p", retry_prompt="short")
+        assert client.chat.completions.create.call_count == 3
+
+    def test_max_tokens_scale_with_pool(self):
+        """Test the thorough preset's 18-song pool gets room to answer"""
+        client = Mock()
+        client.chat.completions.create.return_value = Mock(
+            choices=[Mock(message=Mock(content='[{"song": "A", "artist": "B"}]'))]
+        )
+        settings = PipelineSettings()
+        playlist_data = {"name": "P", "total_tracks": 1}
+        analyze_and_recommend(client, playlist_data, [], [], 5, settings)
+        assert client.chat.completions.create.call_args.kwargs["max_tokens"] == 500
+
+        analyze_and_recommend(client, playlist_data, [], [], 18, settings)
+        max_tokens = client.chat.completions.create.call_args.kwargs["max_tokens"]
+        assert max_tokens >= 18 * TOKENS_PER_SONG
+
 
 class TestRedditAPI:
     """Tests for reddit_api.py"""
@@ -88,6 +243,1562 @@ class TestRedditAPI:
         assert "top_tracks" in mock_result
         assert isinstance(mock_result["all_reddit_data"], list)
 
+    @staticmethod
+    async def fake_stream(name: str, count: int, delay: float, fetched: list):
+        for i in range(count):
+            await asyncio.sleep(delay)
+            fetched.append(name)
+            yield {"title": f"{name} {i}", "score": i, "comments": []}
+
+    @pytest.mark.asyncio
+    async def test_merge_reddit_streams(self):
+        """Test merged streams yield every post plus one end marker per stream"""
+        fetched = []
+        streams = [
+            self.fake_stream("a", 2, 0.001, fetched),
+            self.fake_stream("b", 3, 0.001, fetched),
+        ]
+        events = [event async for event in merge_reddit_streams(streams)]
+        assert len([post for _, post in events if post is not None]) == 5
+        assert len([post for _, post in events if post is None]) == 2
+
+    @pytest.mark.asyncio
+    async def test_merge_reddit_streams_stops_early(self):
+        """Test closing the merged stream cancels the slow streams"""
+        fetched = []
+        streams = [
+            self.fake_stream("fast", 1, 0.001, fetched),
+            self.fake_stream("slow", 5, 0.05, fetched),
+        ]
+        merged = merge_reddit_streams(streams)
+        idx, post = await merged.__anext__()
+        assert post["title"] == "fast 0"
+        await merged.aclose()
+        await asyncio.sleep(0.1)
+        assert "slow" not in fetched
+
+    @pytest.mark.asyncio
+    async def test_reddit_deadline_returns_partial_results(self):
+        """Test a deadline returns partial results marked incomplete"""
+
+        class SlowSubreddit:
+            async def _search(self, query, limit):
+                # Track queries never answer in time, artist queries answer fast
+                await asyncio.sleep(5 if "recommend similar" not in query else 0)
+                post = Mock(
+                    title=f"{query} post",
+                    selftext="",
+                    score=50,
+                    permalink=f"/r/music/{query}",
+                )
+                post.comments.replace_more = AsyncMock()
+                post.comments.list.return_value = []
+                yield post
+
+            def search(self, query, limit=20):
+                return self._search(query, limit)
+
+        reddit = AsyncMock()
+        reddit.__aenter__.return_value = reddit
+        reddit.subreddit.return_value = SlowSubreddit()
+        tracks_data = [
+            {
+                "name": f"Song {i}",
+                # The top track's artist isn't the top artist, so the
+                # planner keeps the track query
+                "artists": [f"Artist {i // 2}"],
+                "artist_names": f"Artist {i // 2}",
+                "popularity": i,
+            }
+            for i in range(3)
+        ]
+
+        with patch("asyncpraw.Reddit", return_value=reddit):
+            result = await get_reddit_recommendations(
+                *["x"] * 5,
+                tracks_data,
+                settings=PipelineSettings(
+                    num_top_tracks=1,
+                    num_bottom_tracks=0,
+                    num_random_tracks=0,
+                    num_top_artists=1,
+                    num_bottom_artists=0,
+                    num_random_artists=0,
+                    max_extra_subreddits=0,
+                ),
+                deadline=0.2,
+            )
+
+        assert result["complete"] is False
+        assert result["stop_reason"] == "deadline"
+        assert result["completed_queries"] == 1
+        assert len(result["all_reddit_data"]) == 1
+
+    def test_choose_subreddits(self):
+        """Test genre subreddits need a playlist artist or past index posts"""
+        sources = [
+            SubredditSource("general", weight=1.0),
+            SubredditSource("metal", weight=1.2, artists=("Metallica",)),
+            SubredditSource("jazz", weight=1.2, artists=("Miles Davis",)),
+            SubredditSource("music"),
+        ]
+        picked = choose_subreddits(sources, ["metallica", "Drake"], 3, "music")
+        assert [source.name for source in picked] == ["metal", "general"]
+
+        picked = choose_subreddits(sources, ["Drake"], 1, "music", {"jazz": 4})
+        assert [source.name for source in picked] == ["jazz"]
+
+    @pytest.mark.asyncio
+    async def test_subreddit_fan_out_caps_and_dedup(self):
+        """Test extra subreddits are capped, weighted and crossposts kept once"""
+
+        class Subreddit:
+            def __init__(self, name):
+                self.name = name
+
+            async def _search(self, query, limit):
+                for i in range(3):
+                    post = Mock(
+                        title=f"Crosspost {i}" if i == 0 else f"{self.name} {i}",
+                        selftext="Fans of this should check out more, recommend",
+                        score=10,
+                        permalink=f"/r/{self.name}/{query}/{i}",
+                    )
+                    post.comments.replace_more = AsyncMock()
+                    post.comments.list.return_value = []
+                    yield post
+
+            def search(self, query, limit=20):
+                return self._search(query, limit)
+
+        reddit = AsyncMock()
+        reddit.__aenter__.return_value = reddit
+        reddit.subreddit.side_effect = lambda name: Subreddit(name)
+        tracks_data = [
+            {
+                "name": "Song",
+                "artists": ["Artist"],
+                "artist_names": "Artist",
+                "popularity": 1,
+            }
+        ]
+        settings = PipelineSettings(
+            num_top_tracks=0,
+            num_bottom_tracks=0,
+            num_random_tracks=0,
+            num_top_artists=1,
+            num_bottom_artists=0,
+            num_random_artists=0,
+            subreddit_sources=[SubredditSource("extra", weight=2.0, max_posts=1)],
+            max_extra_subreddits=1,
+        )
+
+        with patch("asyncpraw.Reddit", return_value=reddit):
+            result = await get_reddit_recommendations(
+                *["x"] * 5, tracks_data, settings=settings
+            )
+
+        posts = result["all_reddit_data"]
+        assert result["total_queries"] == 2
+        assert [post["title"] for post in posts].count("Crosspost 0") == 1
+        assert result["subreddits"]["extra"] == 1  # capped at max_posts
+        assert sum(result["subreddits"].values()) == len(posts)
+        # Same score, but the extra subreddit's weight ranks its post first
+        assert posts[0]["subreddit"] == "extra"
+        assert posts[0]["source_weight"] == 2.0
+
+    def test_plan_searches_collapses_overlapping_queries(self):
+        """Test shared artists collapse, weak artists OR-combine, best first"""
+
+        def seed(name, artists, is_artist):
+            return SeedSearch(name, f"q {name}", "music", 20, artists, is_artist)
+
+        seeds = [
+            seed("Creep - Radiohead", ("Radiohead",), False),
+            seed("Intro - The xx", ("The xx",), False),
+            seed("Islands - The xx", ("The xx",), False),
+            seed("Solo - Frank Ocean", ("Frank Ocean",), False),
+            seed("Radiohead", ("Radiohead",), True),
+            seed("Mitski", ("Mitski",), True),
+            seed("Alvvays", ("Alvvays",), True),
+            seed("Big Thief", ("Big Thief",), True),
+        ]
+        yields = {"q Radiohead": 9.0, "q Mitski": 1.0, "q Alvvays": 2.0}
+        planned = plan_searches(
+            seeds, lambda query, subreddit: yields.get(query, 3.0), or_group_size=2
+        )
+
+        by_query = {search.query: search for search in planned}
+        assert len(planned) == 5
+        assert by_query["q Radiohead"].riders == ["Creep - Radiohead"]
+        _, xx_query = artist_seed_query("The xx")
+        assert by_query[xx_query].riders == ["Intro - The xx", "Islands - The xx"]
+        assert "q Solo - Frank Ocean" in by_query
+        # Weakest artists share OR-queries, two at a time
+        or_searches = [s for s in planned if " OR " in s.query]
+        assert [s.seeds for s in or_searches] == [["Big Thief", "Alvvays"]]
+        assert by_query["q Mitski"].max_posts == 20
+        assert or_searches[0].max_posts == 40
+        yields_in_order = [search.expected_yield for search in planned]
+        assert yields_in_order == sorted(yields_in_order, reverse=True)
+
+        # OR-query posts count for the artists they mention
+        post = {"title": "Like Alvvays?", "body": "", "comments": []}
+        assert or_searches[0].seeds_for(post) == ["Alvvays"]
+        assert or_searches[0].member_posts(or_searches[0].members[0], [post]) == []
+
+        # Queries that never ran (e.g. no local index) keep their own search
+        planned = plan_searches(seeds[4:], lambda query, subreddit: None, 2)
+        assert len(planned) == 4
+        assert not any(" OR " in search.query for search in planned)
+
+    def test_rank_reddit_post(self):
+        """Test post rank includes comment scores"""
+        post = {"score": 10, "comments": [{"score": 5}, {"score": -2}]}
+        assert rank_reddit_post(post) == 13
+
+    @staticmethod
+    def long_text_reddit(num_posts: int):
+        """Reddit client whose posts and comments are far over the budgets"""
+
+        class Subreddit:
+            async def _search(self, query, limit):
+                for i in range(min(limit, num_posts)):
+                    comment = Mock(
+                        body="Check out Teardrop - Massive Attack. " + "é" * 5000,
+                        score=5,
+                        author="same_user",
+                    )
+                    post = Mock(
+                        title=f"Songs similar to {query}? {i}",
+                        selftext="I recommend " + "ü" * 10000,
+                        score=20,
+                        permalink=f"/r/music/{query}/{i}",
+                    )
+                    post.comments.replace_more = AsyncMock()
+                    post.comments.list.return_value = [comment, comment]
+                    yield post
+
+            def search(self, query, limit=20):
+                return self._search(query, limit)
+
+        reddit = AsyncMock()
+        reddit.subreddit.return_value = Subreddit()
+        return reddit
+
+    def test_truncate_utf8(self):
+        """Test text is cut on a character boundary, on a word if one is close"""
+        assert truncate_utf8("short", 10) == "short"
+        assert truncate_utf8("short", None) == "short"
+        assert truncate_utf8("é" * 10, 5) == "éé"
+        assert truncate_utf8("one two three four", 15) == "one two three"
+        assert truncate_utf8("one twothree", 11) == "one twothre"
+
+    @pytest.mark.asyncio
+    async def test_text_cut_at_ingestion(self):
+        """Test posts and comments keep at most their byte budgets"""
+        posts = [
+            post
+            async for post in iter_reddit_recommendations(
+                self.long_text_reddit(2), "Radiohead", "music", 2, 30, 300, 100
+            )
+        ]
+        assert len(posts) == 2
+        for post in posts:
+            assert post["body"].startswith("I recommend")
+            assert len(post["body"].encode("utf-8")) <= 300
+            for comment in post["comments"]:
+                assert comment["body"].startswith("Check out Teardrop")
+                assert len(comment["body"].encode("utf-8")) <= 100
+            assert text_bytes(post) <= post_bytes_bound(30, 300, 100)
+        # Repeated author names share one string
+        assert posts[0]["comments"][0]["author"] is posts[1]["comments"][1]["author"]
+
+    @pytest.mark.asyncio
+    async def test_request_text_budget(self):
+        """Test collecting stops once the kept text reaches the request budget"""
+        settings = PipelineSettings(
+            num_top_tracks=0,
+            num_bottom_tracks=0,
+            num_random_tracks=0,
+            num_top_artists=1,
+            num_bottom_artists=0,
+            num_random_artists=0,
+            max_extra_subreddits=0,
+            reddit_evidence_target=None,
+            reddit_max_body_bytes=1000,
+            reddit_max_comment_bytes=500,
+            reddit_max_request_bytes=5000,
+        )
+        tracks_data = [
+            {"name": "Creep", "artists": ["Radiohead"], "artist_names": "Radiohead"}
+        ]
+        result = await get_reddit_recommendations(
+            *["x"] * 5,
+            [dict(track, popularity=50) for track in tracks_data],
+            settings=settings,
+            reddit=self.long_text_reddit(20),
+        )
+        assert result["stop_reason"] == "text_budget"
+        # Each post holds about 2 KB, the budget is reached on the third
+        assert len(result["all_reddit_data"]) == 3
+        assert result["text_bytes"] == sum(
+            text_bytes(post) for post in result["all_reddit_data"]
+        )
+        assert result["text_bytes"] < 5000 + post_bytes_bound(30, 1000, 500)
+
+
+class TestTrackSelection:
+    """Tests for track_selection.py"""
+
+    tracks_data = [
+        {"name": f"Song {i}", "artists": [f"Artist {i % 4}"], "popularity": i * 10}
+        for i in range(10)
+    ]
+
+    def test_compute_artist_weights(self):
+        """Test track count and mean popularity per artist"""
+        weights = compute_artist_weights(self.tracks_data)
+        assert list(weights) == ["Artist 0", "Artist 1", "Artist 2", "Artist 3"]
+        assert weights["Artist 1"]["track_count"] == 3
+        assert weights["Artist 1"]["mean_popularity"] == 50
+
+    def test_select_tracks_top_bottom(self):
+        """Test top and bottom tracks match a full sort"""
+        selected = select_tracks(self.tracks_data, 3, 3, 2, make_rng(1))
+        names = [track["name"] for track in selected]
+        assert names[:3] == ["Song 9", "Song 8", "Song 7"]
+        assert names[3:6] == ["Song 2", "Song 1", "Song 0"]
+        assert len(set(names)) == 8
+
+    def test_selection_is_reproducible(self):
+        """Test the same seed gives the same tracks and artists"""
+        first = select_tracks(self.tracks_data, 1, 1, 3, make_rng(42))
+        second = select_tracks(self.tracks_data, 1, 1, 3, make_rng(42))
+        assert first == second
+        artists = select_artists(self.tracks_data, 1, 1, 1, make_rng(42))
+        assert artists[:2] == ["Artist 1", "Artist 2"]
+
+
+class TestTrackStore:
+    """Tests for track_store.py"""
+
+    @staticmethod
+    def make_store(num_tracks: int = 6) -> TrackStore:
+        store = TrackStore()
+        for i in range(num_tracks):
+            store.append_spotify_track(
+                {
+                    "name": f"Song {i}",
+                    "artists": [{"name": f"Artist {i % 2}"}, {"name": "Feature"}],
+                    "album": {"name": "Album", "images": []},
+                    "id": f"id{i}",
+                    "uri": f"spotify:track:id{i}",
+                    "popularity": i * 10,
+                    "preview_url": None,
+                    "external_urls": {"spotify": f"https://open.spotify.com/{i}"},
+                }
+            )
+        return store
+
+    def test_rows_are_dict_like(self):
+        """Test rows expose the same keys as the old track dicts"""
+        store = self.make_store()
+        track = store[1]
+        assert len(store) == 6
+        assert track["name"] == "Song 1"
+        assert track["artists"] == ["Artist 1", "Feature"]
+        assert track["artist_names"] == "Artist 1, Feature"
+        assert track["album_image"] is None
+        assert store[-1]["popularity"] == 50
+        assert store.to_dicts()[0]["external_url"] == "https://open.spotify.com/0"
+
+    def test_artist_tuples_are_shared(self):
+        """Test repeated artist combinations reuse one tuple"""
+        store = self.make_store()
+        assert store.artists[0] is store.artists[2]
+
+    def test_selection_matches_dicts(self):
+        """Test selection on the store matches selection on plain dicts"""
+        store = self.make_store()
+        from_store = select_tracks(store, 2, 2, 1, make_rng(7))
+        from_dicts = select_tracks(store.to_dicts(), 2, 2, 1, make_rng(7))
+        assert [dict(track) for track in from_store] == from_dicts
+        assert compute_artist_weights(store) == compute_artist_weights(store.to_dicts())
+
+
+class TestEntityExtraction:
+    """Tests for entity_extraction.py"""
+
+    def test_extract_mentions(self):
+        """Test song/artist mention patterns"""
+        assert extract_mentions("Try Teardrop - Massive Attack, trust me") == [
+            ("Teardrop", "Massive Attack")
+        ]
+        assert extract_mentions('Also "Videotape" by Radiohead.') == [
+            ("Videotape", "Radiohead")
+        ]
+        assert extract_mentions("I love Radiohead - they are great") == []
+
+    def test_extract_candidates_weighted_by_score(self):
+        """Test candidates aggregate mentions weighted by comment score"""
+        reddit_data = [
+            {
+                "title": "Like Portishead?",
+                "body": "",
+                "score": 0,
+                "comments": [
+                    {"body": "Teardrop - Massive Attack", "score": 30},
+                    {"body": "teardrop - massive attack", "score": 5},
+                    {"body": "Unfinished Sympathy - Massive Attack", "score": 8},
+                ],
+            }
+        ]
+        candidates = extract_candidates(reddit_data)
+        assert candidates["songs"][0]["song"] == "Teardrop"
+        assert candidates["songs"][0]["score"] == 30
+        assert candidates["songs"][0]["mentions"] == 1
+        assert candidates["artists"][0]["artist"] == "Massive Attack"
+        assert candidates["artists"][0]["score"] == 38
+
+    @pytest.mark.asyncio
+    async def test_validate_candidates_uses_catalog_cache(self):
+        """Test Spotify validation drops unknown/playlist songs and caches lookups"""
+        sp = Mock()
+        sp.search.side_effect = lambda q, type, limit: {
+            "tracks": {
+                "items": (
+                    [
+                        {
+                            "name": "Teardrop",
+                            "artists": [{"name": "Massive Attack"}],
+                            "album": {
+                                "name": "Mezzanine",
+                                "release_date": "1998",
+                                "images": [],
+                            },
+                            "popularity": 70,
+                            "duration_ms": 330000,
+                            "preview_url": None,
+                            "external_urls": {"spotify": "url"},
+                            "uri": "spotify:track:t1",
+                            "id": "t1",
+                        }
+                    ]
+                    if "teardrop" in q.lower()
+                    else []
+                )
+            }
+        }
+        candidates = [
+            {"song": "teardrop", "artist": "massive attack", "score": 9, "mentions": 2},
+            {"song": "Nope", "artist": "Nobody", "score": 1, "mentions": 1},
+        ]
+        catalog = SpotifyCatalogCache()
+
+        validated = await validate_candidates(sp, candidates, catalog)
+        assert [c["song"] for c in validated] == ["Teardrop"]
+        assert validated[0]["track"]["id"] == "t1"
+
+        assert (
+            await validate_candidates(sp, candidates, catalog, exclude_ids={"t1"}) == []
+        )
+        assert sp.search.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_prefetch_budget_and_hit_rate(self):
+        """Test the prefetch looks up the most-mentioned songs within budget"""
+        sp = Mock()
+        sp.search.return_value = {"tracks": {"items": []}}
+        catalog = SpotifyCatalogCache()
+        catalog.put("Cached", "Artist", None)
+        candidates = [
+            {"song": "Rare", "artist": "Artist", "score": 99, "mentions": 1},
+            {"song": "Cached", "artist": "Artist", "score": 5, "mentions": 9},
+            {"song": "Often", "artist": "Artist", "score": 5, "mentions": 5},
+            {"song": "Sometimes", "artist": "Artist", "score": 5, "mentions": 3},
+        ]
+
+        prefetcher = SpotifyPrefetcher(sp, catalog, budget=2)
+        prefetcher.start(candidates)
+        stats = await prefetcher.resolve(
+            [
+                {"song": "often", "artist": "artist"},
+                {"song": "Cached", "artist": "Artist"},
+                {"song": "Rare", "artist": "Artist"},
+            ]
+        )
+        assert stats["prefetched"] == 2
+        assert stats["prefetch_hits"] == 1
+        assert stats["cache_hits"] == 2
+        assert stats["hit_rate"] == pytest.approx(1 / 3)
+        assert stats["precision"] == 0.5
+
+    @pytest.mark.asyncio
+    async def test_search_spotify_until_stops_at_enough_tracks(self):
+        """Test picks keep rank order, misses are skipped, extra searches cancelled"""
+        catalog = SpotifyCatalogCache()
+        searched = []
+
+        def search(sp, song, artist):
+            searched.append(song)
+            if song == "Missing":
+                return None
+            return {"id": song, "name": song, "artist": artist, "album": "Album"}
+
+        catalog.search = search
+        picks = [
+            {"song": song, "artist": "Artist"}
+            for song in ["In Playlist", "First", "Missing", "Second", "Third", "Fourth"]
+        ]
+
+        found = await search_spotify_until(
+            Mock(), picks, 2, catalog, exclude_ids=["In Playlist"], concurrency=1
+        )
+        assert [track["name"] for track in found] == ["First", "Second"]
+        assert "Fourth" not in searched
+
+
+class TestFastPath:
+    """Tests for fast_path.py"""
+
+    def test_score_comentions(self):
+        """Test candidates backed by more seeds and higher scores rank first"""
+        reddit_data = [
+            {
+                "title": "Like Portishead?",
+                "body": "",
+                "score": 0,
+                "seeds": ["Portishead"],
+                "comments": [
+                    {"body": "Glory Box - Tricky", "score": 20},
+                    {"body": "Teardrop - Massive Attack", "score": 10},
+                ],
+            },
+            {
+                "title": "Like Bjork?",
+                "body": "",
+                "score": 0,
+                "seeds": ["Bjork", "Radiohead"],
+                "comments": [{"body": "Teardrop - Massive Attack", "score": 10}],
+            },
+        ]
+        ranked = score_comentions(reddit_data)
+        assert [c["song"] for c in ranked] == ["Teardrop", "Glory Box"]
+        assert ranked[0]["seed_support"] == 3
+        assert ranked[0]["mentions"] == 2
+        assert score_comentions([]) == []
+
+    def test_apply_recommendation_rules(self):
+        """Test max 2 songs per artist and no songs already in the playlist"""
+        candidates = [
+            {"song": "Creep", "artist": "Radiohead"},
+            {"song": "Karma Police", "artist": "Radiohead"},
+            {"song": "No Surprises", "artist": "Radiohead, Someone"},
+            {"song": "Reckoner", "artist": "radiohead"},
+            {"song": "Teardrop", "artist": "Massive Attack"},
+        ]
+        tracks_data = [{"name": "creep", "artist_names": "Radiohead"}]
+        picks = apply_recommendation_rules(candidates, tracks_data, 5)
+        assert [c["song"] for c in picks] == [
+            "Karma Police",
+            "No Surprises",
+            "Teardrop",
+        ]
+
+
+class TestSimilarityRanker:
+    """Tests for similarity_ranker.py"""
+
+    def test_rerank_prefers_playlist_artists_and_comentions(self):
+        """Test tracks by playlist artists, then co-mentioned artists, rank first"""
+        tracks_data = [
+            {"id": "p1", "artists": ["Portishead"], "album": "Dummy"},
+            {"id": "p2", "artists": ["Massive Attack"], "album": "Mezzanine"},
+        ]
+        recommendations = [
+            {"id": "r1", "name": "Yellow", "artist": "Coldplay", "album": "Parachutes"},
+            {"id": "r2", "name": "Hilltop", "artist": "Tricky", "album": "Maxinquaye"},
+            {"id": "r3", "name": "Roads", "artist": "Portishead", "album": "Dummy"},
+        ]
+        reddit_data = [
+            {
+                "title": "Like Portishead?",
+                "body": "",
+                "score": 5,
+                "seeds": ["Portishead"],
+                "comments": [{"body": "Tricky, no question", "score": 40}],
+            }
+        ]
+        ranked = rerank_by_similarity(recommendations, tracks_data, reddit_data, 2)
+        assert [track["id"] for track in ranked] == ["r3", "r2"]
+
+    def test_rerank_keeps_gpt_order_of_unrelated_tracks(self):
+        """Test tracks with no similarity to the playlist keep GPT's order"""
+        tracks_data = [{"id": "p1", "artists": ["Portishead"], "album": "Dummy"}]
+        recommendations = [
+            {"id": f"r{i}", "name": f"Song {i}", "artist": artist, "album": None}
+            for i, artist in enumerate(["Coldplay", "Muse", "Blur", "Oasis", "Pulp"])
+        ]
+        ranked = rerank_by_similarity(recommendations, tracks_data, [], 5)
+        assert [track["id"] for track in ranked] == ["r0", "r1", "r2", "r3", "r4"]
+
+    def test_embedding_matrix_is_persisted(self, tmp_path):
+        """Test embeddings survive a reopen and the matrix grows past capacity"""
+        path = str(tmp_path / "embeddings.npy")
+        embeddings = EmbeddingMatrix(path, capacity=2)
+        for i in range(5):
+            embeddings.embed(f"id{i}", [f"Artist {i}"], "Album")
+        # New IDs are written in one go on flush
+        with open(f"{path}.ids", encoding="utf-8") as ids_file:
+            assert ids_file.read() == ""
+        embeddings.flush()
+        with open(f"{path}.ids", encoding="utf-8") as ids_file:
+            assert ids_file.read().split() == [f"id{i}" for i in range(5)]
+        # A second writer gets an in-memory matrix, never the shared file
+        assert EmbeddingMatrix(path).path is None
+        embeddings.close()
+
+        reopened = EmbeddingMatrix(path)
+        assert len(reopened) == 5
+        assert (reopened.get("id3") == metadata_vector(["Artist 3"], "Album")).all()
+        assert reopened.get("missing") is None
+        reopened.close()
+
+    def test_in_memory_embeddings_are_bounded(self):
+        """Test the in-memory matrix evicts the least recently used tracks"""
+        embeddings = EmbeddingMatrix(capacity=2, max_rows=3)
+        for i in range(3):
+            embeddings.embed(f"id{i}", [f"Artist {i}"], "Album")
+        embeddings.get("id0")
+        embeddings.embed("id3", ["Artist 3"], "Album")
+
+        assert len(embeddings) == 3
+        assert "id1" not in embeddings
+        assert (embeddings.get("id0") == metadata_vector(["Artist 0"], "Album")).all()
+        assert (embeddings.get("id3") == metadata_vector(["Artist 3"], "Album")).all()
+
+
+class TestDeadlines:
+    """Tests for deadlines.py"""
+
+    def test_stage_budgets_roll_over(self):
+        """Test stages split the time left by share, unused time rolls over"""
+        now = [0.0]
+        deadline = RequestDeadline(
+            10.0, {"reddit": 1, "gpt": 1, "spotify": 2}, clock=lambda: now[0]
+        )
+        assert deadline.budget("reddit") == pytest.approx(2.5)
+        assert deadline.budget("reddit", cap=1.0) == 1.0
+
+        now[0] = 1.0  # reddit finished early
+        assert deadline.budget("gpt") == pytest.approx(3.0)
+        now[0] = 4.0
+        assert deadline.budget("spotify") == pytest.approx(6.0)
+        assert not deadline.expired()
+
+        now[0] = 11.0
+        assert deadline.budget("spotify") == 0.0
+        assert deadline.expired()
+        deadline.degrade("spotify", "out of time")
+        assert deadline.degraded == {"spotify": "out of time"}
+
+    def test_no_deadline(self):
+        """Test budgets fall back to the stage cap without a request deadline"""
+        deadline = RequestDeadline(None)
+        assert deadline.budget("reddit") is None
+        assert deadline.budget("reddit", cap=10.0) == 10.0
+        assert not deadline.expired()
+
+
+class TestResilience:
+    """Tests for resilience.py"""
+
+    def test_circuit_breaker_half_open_probe(self):
+        """Test the circuit opens, lets one probe through, and closes on success"""
+        now = [0.0]
+        breaker = CircuitBreaker("test", 2, 10.0, clock=lambda: now[0])
+        breaker.record_failure()
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == "open" and not breaker.allow()
+
+        now[0] = 11.0
+        assert breaker.allow()
+        assert breaker.state == "half_open" and not breaker.allow()
+        breaker.record_success()
+        assert breaker.state == "closed" and breaker.allow()
+
+    @pytest.mark.asyncio
+    async def test_upstreams_have_their_own_workers(self):
+        """Test a saturated upstream never takes another upstream's threads"""
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=2))
+        stuck, other = Upstream("stuck", 2), Upstream("other", 2)
+        release = threading.Event()
+        in_flight, peak = [0], [0]
+
+        def count_in_flight():
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+            time.sleep(0.05)
+            in_flight[0] -= 1
+
+        # Fills the stuck upstream's slots and the loop's default executor
+        blocked = [
+            *(asyncio.create_task(stuck.call(release.wait, 5)) for _ in range(2)),
+            *(
+                asyncio.create_task(asyncio.to_thread(release.wait, 5))
+                for _ in range(2)
+            ),
+        ]
+        await asyncio.sleep(0.05)
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(other.call(count_in_flight) for _ in range(4))), 1.0
+            )
+        finally:
+            release.set()
+            await asyncio.gather(*blocked)
+        # The other upstream got both of its slots
+        assert peak[0] == 2
+
+    @pytest.mark.asyncio
+    async def test_upstream_fails_fast_when_open(self):
+        """Test outages open the circuit but non-failures (e.g. a 404) don't"""
+        upstream = Upstream("test", 2, 2, 60.0, lambda e: not isinstance(e, KeyError))
+
+        def fail(error):
+            raise error
+
+        for _ in range(3):
+            with pytest.raises(KeyError):
+                await upstream.call(fail, KeyError("missing"))
+        assert upstream.available
+
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                await upstream.call(fail, RuntimeError("down"))
+        assert not upstream.available
+        with pytest.raises(CircuitOpenError):
+            await upstream.call(len, "never called")
+
+    @pytest.mark.asyncio
+    async def test_reddit_circuit_open_uses_cached_evidence(self, tmp_path):
+        """Test an open Reddit circuit answers from stale index entries"""
+        index = RedditIndex(str(tmp_path / "index.db"))
+        query = artist_seed_query("Artist 0")[1]
+        post = {"title": "t", "body": "", "score": 5, "url": "u", "comments": []}
+        index.store_query_results(query, "music", [post], "Artist 0")
+        upstream = Upstream("reddit", failure_threshold=1)
+        upstream.breaker.record_failure()
+        tracks_data = [
+            {
+                "name": "Song 0",
+                "artists": ["Artist 0"],
+                "artist_names": "Artist 0",
+                "popularity": 0,
+            }
+        ]
+
+        with patch("asyncpraw.Reddit") as reddit:
+            result = await get_reddit_recommendations(
+                *["x"] * 5,
+                tracks_data,
+                settings=PipelineSettings(
+                    num_top_tracks=1,
+                    num_bottom_tracks=0,
+                    num_random_tracks=0,
+                    num_top_artists=1,
+                    num_bottom_artists=0,
+                    num_random_artists=0,
+                    max_extra_subreddits=0,
+                    reddit_index_max_age_seconds=0,
+                ),
+                index=index,
+                upstream=upstream,
+            )
+
+        reddit.assert_not_called()
+        assert [p["url"] for p in result["all_reddit_data"]] == ["u"]
+        assert result["failed_queries"] == 1
+        assert result["completed_queries"] == 1
+
+
+class TestProfiling:
+    """Tests for profiling.py"""
+
+    @pytest.mark.asyncio
+    async def test_profile_captures_loop_blocking_call(self, tmp_path):
+        """Test a blocking call is sampled and reported as a loop stall"""
+
+        def blocking_spotify_call():
+            time.sleep(0.3)
+
+        async with profile_request(
+            "test", str(tmp_path), "collapsed", interval=0.002, block_threshold=0.1
+        ) as profile:
+            await asyncio.sleep(0.05)
+            blocking_spotify_call()
+
+        assert profile["samples"] > 0
+        assert profile["blocking_events"] == 1
+        folded, blocking = profile["files"]
+        assert folded.endswith(".folded") and blocking.endswith(".blocking.txt")
+        assert "blocking_spotify_call" in open(blocking).read()
+        assert "blocking_spotify_call" in open(folded).read()
+
+    @pytest.mark.asyncio
+    async def test_profile_speedscope_file(self, tmp_path):
+        """Test the speedscope output is a valid sampled profile"""
+        async with profile_request("POST /api/x", str(tmp_path)) as profile:
+            await asyncio.sleep(0.05)
+
+        assert profile["blocking_events"] == 0
+        with open(profile["files"][0]) as f:
+            speedscope = json.load(f)
+        sampled = speedscope["profiles"][0]
+        assert sampled["type"] == "sampled"
+        assert len(sampled["samples"]) == len(sampled["weights"]) > 0
+        num_frames = len(speedscope["shared"]["frames"])
+        assert all(0 <= i < num_frames for s in sampled["samples"] for i in s)
+
+    def test_rotate_profiles_keeps_newest(self, tmp_path):
+        """Test the oldest profiles (with all their files) are deleted"""
+        for i in range(4):
+            for suffix in (".folded", ".blocking.txt"):
+                path = tmp_path / f"req-{i}{suffix}"
+                path.write_text("x")
+                os.utime(path, (1000 + i, 1000 + i))
+        (tmp_path / "notes.txt").write_text("not a profile")
+
+        assert rotate_profiles(str(tmp_path), 2) == 2
+        assert sorted(p.name for p in tmp_path.iterdir()) == [
+            "notes.txt",
+            "req-2.blocking.txt",
+            "req-2.folded",
+            "req-3.blocking.txt",
+            "req-3.folded",
+        ]
+        assert rotate_profiles(str(tmp_path), 2) == 0
+
+
+class TestPipelineSettings:
+    """Tests for pipeline_settings.py"""
+
+    def test_settings_are_hashable_cache_keys(self):
+        """Test equal settings hash alike and overrides make new objects"""
+        base = PipelineSettings()
+        cache = {(base, "playlist"): "cached"}
+        same = PipelineSettings(stage_budget_shares=dict(base.stage_budget_shares))
+
+        assert cache[(same, "playlist")] == "cached"
+        assert same.fingerprint == base.fingerprint
+        changed = base.override(num_recommendations=10)
+        assert (changed, "playlist") not in cache
+        assert base.num_recommendations == 5
+
+    def test_presets_and_overrides(self):
+        """Test presets apply on top of the base and overrides on top of presets"""
+        base = PipelineSettings(gpt_model="base-model")
+        fast = resolve_settings(base, "fast", num_recommendations=3)
+        assert fast.mode == "fast"
+        assert fast.gpt_model == "base-model"
+        assert fast.num_recommendations == 3
+        assert resolve_settings(base, "balanced") == base
+
+        with pytest.raises(ValueError):
+            resolve_settings(base, "instant")
+        with pytest.raises(ValueError):
+            base.override(num_recomendations=3)
+        with pytest.raises(ValueError):
+            base.override(mode="slow")
+
+
+class TestRedditIndex:
+    """Tests for reddit_index.py"""
+
+    post_data = {
+        "title": "Bands similar to Radiohead?",
+        "body": "Looking for recommendations",
+        "score": 40,
+        "url": "https://reddit.com/r/music/1",
+        "comments": [
+            {"body": "Teardrop - Massive Attack, trust me", "score": 12, "author": "a"},
+            {"body": '"Videotape" by Radiohead obviously', "score": 3, "author": "b"},
+        ],
+    }
+
+    def test_store_and_lookup(self):
+        """Test stored query results come back and misses return None"""
+        index = RedditIndex(":memory:")
+        seed, query = artist_seed_query("Radiohead")
+        index.store_query_results(query, "music", [self.post_data], seed)
+
+        assert index.lookup(query, "music") == [self.post_data]
+        assert index.lookup(query, "indieheads") is None
+        assert index.lookup("unknown query", "music") is None
+
+        edges = index.related("Radiohead", kind="artist")
+        assert edges[0]["target"] == "Massive Attack"
+        assert edges[0]["score"] == 12
+
+    def test_storing_again_keeps_edges(self):
+        """Test storing a thread again replaces its edges instead of adding to them"""
+        index = RedditIndex(":memory:")
+        seed, query = artist_seed_query("Radiohead")
+        for _ in range(3):
+            index.store_query_results(query, "music", [self.post_data], seed)
+
+        edges = index.related("Radiohead", kind="track")
+        assert edges[0]["target"] == "Teardrop - Massive Attack"
+        assert edges[0]["score"] == 12
+        assert edges[0]["mentions"] == 1
+
+    def test_related_songs(self):
+        """Test co-mentioned songs skip the request's own posts and merge in"""
+        index = RedditIndex(":memory:")
+        seed, query = artist_seed_query("Radiohead")
+        index.store_query_results(query, "music", [self.post_data], seed)
+
+        songs = index.related_songs(["Radiohead", "Unknown"])
+        assert songs[0] == {
+            "song": "Teardrop",
+            "artist": "Massive Attack",
+            "score": 12,
+            "mentions": 1,
+        }
+        assert index.related_songs(["Radiohead"], [self.post_data["url"]]) == []
+        assert index.related_songs([]) == []
+
+        merged = merge_candidates(
+            [
+                {
+                    "song": "teardrop",
+                    "artist": "Massive Attack",
+                    "score": 5,
+                    "mentions": 2,
+                }
+            ],
+            songs,
+        )
+        assert [(c["score"], c["mentions"]) for c in merged][0] == (17, 3)
+
+    def test_text_stored_compressed(self):
+        """Test long bodies are stored as zlib BLOBs and read back as text"""
+        index = RedditIndex(":memory:")
+        post_data = dict(self.post_data, body="Similar bands: Portishead. " * 40)
+        index.store_query_results("q", "music", [post_data])
+
+        (body,) = index.conn.execute("SELECT body FROM posts").fetchone()
+        # No other table keeps a plain copy of the text
+        tables = {
+            name for (name,) in index.conn.execute("SELECT name FROM sqlite_master")
+        }
+        assert not any("fts" in name for name in tables)
+        assert isinstance(body, bytes)
+        assert len(body) < len(post_data["body"]) / 4
+        assert index.lookup("q", "music") == [post_data]
+
+        # Plain text rows written before compression still read back
+        index.conn.execute("UPDATE posts SET body = 'old plain text'")
+        assert index.lookup("q", "music")[0]["body"] == "old plain text"
+
+    def test_lookup_respects_fetch_limits(self):
+        """Test runs only answer requests with the same or smaller fetch limits"""
+        index = RedditIndex(":memory:")
+        seed, query = artist_seed_query("Radiohead")
+        index.store_query_results(
+            query, "music", [self.post_data], seed, FetchLimits(20, 30, 2000, None)
+        )
+
+        assert index.lookup(query, "music", limits=FetchLimits(20, 30, 2000, 1000))
+        assert (
+            index.lookup(query, "music", limits=FetchLimits(30, 30, 2000, 1000)) is None
+        )
+        assert (
+            index.lookup(query, "music", limits=FetchLimits(20, 30, None, 1000)) is None
+        )
+        (post_data,) = index.lookup(query, "music", limits=FetchLimits(20, 1, 10, 8))
+        assert post_data["body"] == "Looking"
+        assert post_data["comments"] == [
+            dict(self.post_data["comments"][0], body="Teardrop")
+        ]
+
+        # Runs stored without limits only answer lookups without limits
+        index.store_query_results(query, "music", [self.post_data], seed)
+        assert index.lookup(query, "music", limits=FetchLimits(1, 1, 1, 1)) is None
+        assert index.lookup(query, "music") == [self.post_data]
+
+    def test_shallow_fetch_keeps_deeper_post(self):
+        """Test a post fetched with smaller limits never replaces a deeper copy"""
+        index = RedditIndex(":memory:")
+        base = PipelineSettings()
+        thorough = fetch_limits(resolve_settings(base, "thorough"), 30)
+        balanced = fetch_limits(resolve_settings(base, "balanced"), 20)
+        post_data = dict(
+            self.post_data,
+            comments=[
+                {"body": f"Song {i} - Band {i}", "score": 1, "author": "a"}
+                for i in range(thorough.max_comments)
+            ],
+        )
+        shallow = balanced.apply([post_data])
+        seed, query = artist_seed_query("Radiohead")
+        other_seed, other_query = artist_seed_query("Portishead")
+
+        index.store_query_results(query, "music", [post_data], seed, thorough)
+        index.store_query_results(other_query, "music", shallow, other_seed, balanced)
+        (cached,) = index.lookup(query, "music", limits=thorough)
+        assert len(cached["comments"]) == thorough.max_comments == 50
+        assert len(index.related(seed, kind="artist", limit=100)) == 50
+        # The balanced run's own lookups are cut down to its limits
+        (cached,) = index.lookup(other_query, "music", limits=balanced)
+        assert len(cached["comments"]) == balanced.max_comments
+
+        # A deeper fetch still replaces the stored post
+        index.store_query_results(query, "music", [post_data], seed, thorough)
+        deeper = dict(post_data, comments=post_data["comments"] * 2)
+        index.store_query_results(query, "music", [deeper], seed, None)
+        assert len(index.lookup(query, "music")[0]["comments"]) == 100
+
+    @pytest.mark.asyncio
+    async def test_or_query_results_stored_under_or_query(self):
+        """Test OR-query posts never end up under the members' own queries"""
+        index = RedditIndex(":memory:")
+        members = [
+            SeedSearch(
+                artist, *artist_seed_query(artist)[1:], "music", 20, (artist,), True
+            )
+            for artist in ("Radiohead", "Mitski")
+        ]
+        search = PlannedSearch("(Radiohead OR Mitski)", "music", 40, members)
+        limits = FetchLimits(40, 30, 2000, 1000)
+        stream = _iter_and_index(_iter_posts([self.post_data]), index, search, limits)
+        async for _ in stream:
+            pass
+
+        assert index.lookup(members[0].query, "music") is None
+        assert (
+            index.expected_yield(members[0].query, "music", require_history=True)
+            is None
+        )
+        assert index.lookup(search.query, "music") == [self.post_data]
+        # The post talks about Radiohead only, so only Radiohead gets its edges
+        assert (
+            index.related("Radiohead", kind="artist")[0]["target"] == "Massive Attack"
+        )
+        assert index.related("Mitski") == []
+
+    def test_expected_yield_tracks_past_runs(self):
+        """Test the expected yield starts at the prior and follows past runs"""
+        index = RedditIndex(":memory:")
+        seed, query = artist_seed_query("Radiohead")
+        assert index.expected_yield(query, "music", prior=3.0) == 3.0
+
+        index.store_query_results(query, "music", [self.post_data], seed)
+        assert index.expected_yield(query, "music", prior=3.0) == 2.0
+        assert index.expected_yield(query, "indieheads", prior=3.0) == 3.0
+
+    @pytest.mark.asyncio
+    async def test_index_hits_skip_live_reddit(self):
+        """Test queries answered by the index never open a Reddit client"""
+        index = RedditIndex(":memory:")
+        tracks_data = [
+            {"name": "Creep", "artists": ["Radiohead"], "artist_names": "Radiohead"}
+        ]
+        seed, query = artist_seed_query("Radiohead")
+        index.store_query_results(
+            query, "music", [self.post_data], seed, FetchLimits(20, 30, 2000, 1000)
+        )
+
+        with patch("asyncpraw.Reddit") as reddit_cls:
+            result = await get_reddit_recommendations(
+                *["x"] * 5,
+                [dict(track, popularity=50) for track in tracks_data],
+                settings=PipelineSettings(
+                    num_top_tracks=0,
+                    num_bottom_tracks=0,
+                    num_random_tracks=0,
+                    num_top_artists=1,
+                    num_bottom_artists=0,
+                    num_random_artists=0,
+                    max_extra_subreddits=0,
+                ),
+                index=index,
+            )
+
+        reddit_cls.assert_not_called()
+        assert result["all_reddit_data"] == [
+            dict(self.post_data, seeds=[seed], subreddit="music", source_weight=1.0)
+        ]
+        assert result["complete"] is True
+
+    @pytest.mark.asyncio
+    async def test_index_reads_never_block_loop(self):
+        """Test index lookups wait for a write's lock off the event loop"""
+        index = RedditIndex(":memory:")
+        tracks_data = [
+            {"name": "Creep", "artists": ["Radiohead"], "popularity": 50},
+        ]
+        seed, query = artist_seed_query("Radiohead")
+        index.store_query_results(
+            query, "music", [self.post_data], seed, FetchLimits(20, 30, 2000, 1000)
+        )
+        locked, release = threading.Event(), threading.Event()
+
+        def hold_lock():
+            # Stands in for a long store_query_results transaction
+            with index._lock:
+                locked.set()
+                release.wait(5)
+
+        writer = threading.Thread(target=hold_lock)
+        writer.start()
+        locked.wait(5)
+        request = asyncio.create_task(
+            get_reddit_recommendations(
+                *["x"] * 5,
+                tracks_data,
+                settings=PipelineSettings(
+                    num_top_tracks=0,
+                    num_bottom_tracks=0,
+                    num_random_tracks=0,
+                    num_top_artists=1,
+                    num_bottom_artists=0,
+                    num_random_artists=0,
+                    max_extra_subreddits=0,
+                ),
+                index=index,
+            )
+        )
+        start = time.perf_counter()
+        await asyncio.sleep(0.05)
+        # The loop kept running while the request waited for the lock
+        assert time.perf_counter() - start < 0.2
+        assert not request.done()
+
+        release.set()
+        result = await request
+        writer.join()
+        assert result["complete"] is True
+        assert len(result["all_reddit_data"]) == 1
+
+
+class TestAdmission:
+    """Tests for admission.py and the API's 429 responses"""
+
+    def test_client_rate_limiter(self):
+        """Test each client gets its own burst, then waits for the rate"""
+        now = [0.0]
+        limiter = ClientRateLimiter(rate=0.5, burst=2, clock=lambda: now[0])
+        limiter.check("a")
+        limiter.check("a")
+        with pytest.raises(AdmissionRejected) as rejected:
+            limiter.check("a")
+        assert rejected.value.retry_after == pytest.approx(2.0)
+        limiter.check("b")  # other clients are unaffected
+        now[0] = 2.0
+        limiter.check("a")
+
+    @pytest.mark.asyncio
+    async def test_fair_queue_interleaves_clients(self):
+        """Test a late client isn't stuck behind another client's burst"""
+        queue = FairAdmissionQueue(max_concurrency=1, max_queued=10)
+        order = []
+        release = asyncio.Event()
+
+        async def request(client, name):
+            async with queue.admit(client):
+                order.append(name)
+                await release.wait()
+
+        tasks = [asyncio.create_task(request("a", "a0"))]
+        await asyncio.sleep(0)
+        tasks += [asyncio.create_task(request("a", f"a{i}")) for i in (1, 2, 3)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(request("b", "b1")))
+        await asyncio.sleep(0)
+        assert queue.status()["queued"] == 4
+
+        release.set()
+        await asyncio.gather(*tasks)
+        assert order == ["a0", "a1", "b1", "a2", "a3"]
+
+    @pytest.mark.asyncio
+    async def test_full_queue_rejects_fast(self):
+        """Test requests beyond the queue bound are rejected with a retry time"""
+        queue = FairAdmissionQueue(max_concurrency=1, max_queued=1, max_wait=0.05)
+        hold = asyncio.Event()
+
+        async def request():
+            async with queue.admit("a"):
+                await hold.wait()
+
+        running = asyncio.create_task(request())
+        await asyncio.sleep(0)
+        waiting = asyncio.create_task(request())
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            async with queue.admit("b"):
+                pass
+        assert rejected.value.reason == "server busy"
+        assert int(rejected.value.retry_after_header) >= 1
+
+        # Waiting past max_wait is rejected too, and frees its queue place
+        with pytest.raises(AdmissionRejected):
+            await waiting
+        assert queue.status()["queued"] == 0
+        hold.set()
+        await running
+        assert queue.status()["running"] == 0
+
+    def test_api_returns_429_with_retry_after(self):
+        """Test a client over its rate gets a 429 with Retry-After"""
+        from fastapi.testclient import TestClient
+        import fastapi_endpoint
+
+        client = TestClient(fastapi_endpoint.app)
+        payload = {"playlist_url": "not a playlist"}
+        with patch.object(
+            fastapi_endpoint, "rate_limiter", ClientRateLimiter(1 / 60, 1)
+        ):
+            first = client.post("/api/recommendations", json=payload)
+            second = client.post("/api/recommendations", json=payload)
+            health = client.get("/api/health")
+
+        assert first.status_code == 200
+        assert second.status_code == 429
+        assert second.headers["retry-after"] == "60"
+        assert second.json()["success"] is False
+        assert health.status_code == 200
+
+
+class TestAPIResponses:
+    """Tests for fastapi_endpoint.py response models and JSON rendering"""
+
+    def test_response_shape_and_content_type(self):
+        """Test responses are the typed model, encoded as JSON by orjson"""
+        from fastapi.testclient import TestClient
+        import fastapi_endpoint
+
+        client = TestClient(fastapi_endpoint.app)
+        with patch.object(fastapi_endpoint, "rate_limiter", ClientRateLimiter(1, 5)):
+            response = client.post(
+                "/api/recommendations", json={"playlist_url": "not a playlist"}
+            )
+            health = client.get("/api/health")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/json"
+        data = response.json()
+        assert set(data) == {
+            "success",
+            "playlist_details",
+            "recommendations",
+            "metadata",
+            "error",
+        }
+        assert data["success"] is False
+        assert data["recommendations"] is None
+        assert "Invalid playlist URL" in data["error"]
+        assert health.headers["content-type"] == "application/json"
+        assert health.json() == {"status": "healthy", "service": "RedditJams API"}
+
+    def test_orjson_rendering(self):
+        """Test NaN, non-string keys and numpy values encode without errors"""
+        import numpy as np
+        import fastapi_endpoint
+
+        assert fastapi_endpoint.app.router.default_response_class is ORJSONResponse
+        response = ORJSONResponse(
+            {"score": float("nan"), "counts": {1: "a"}, "vector": np.array([1, 2])}
+        )
+        assert json.loads(response.body) == {
+            "score": None,
+            "counts": {"1": "a"},
+            "vector": [1, 2],
+        }
+        assert response.media_type == "application/json"
+
+
+class TestCacheWarmer:
+    """Tests for cache_warmer.py"""
+
+    def test_demand_counter_prefers_recent_requests(self):
+        """Test older requests fade so trending keys rank first"""
+        now = [0.0]
+        demand = DemandCounter(half_life=10.0, clock=lambda: now[0])
+        for _ in range(3):
+            demand.add("old")
+        now[0] = 30.0  # three half-lives later: old counts 3 / 8
+        demand.add("new")
+        assert [key for key, _ in demand.top(2)] == ["new", "old"]
+        assert demand.top(2)[1][1] == pytest.approx(3 / 8)
+
+    @pytest.mark.asyncio
+    async def test_rate_budget_backs_off(self):
+        """Test the budget waits for a quiet upstream and skips open circuits"""
+        upstream = Upstream("test", 4, 1, 60.0)
+        budget = RateBudget(rate=1000.0, busy_share=0.5, poll_seconds=0.01)
+        assert await budget.acquire(upstream)
+
+        upstream.in_flight = 2
+        waiter = asyncio.create_task(budget.acquire(upstream))
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        upstream.in_flight = 0
+        assert await waiter
+
+        upstream.breaker.record_failure()
+        assert not await budget.acquire(upstream)
+
+    @pytest.mark.asyncio
+    async def test_warm_caches_prefetches_demanded_content(self):
+        """Test a round fills the playlist, index and catalog caches once"""
+        import main
+
+        sp = Mock()
+        sp.playlist.return_value = {
+            "name": "Playlist",
+            "owner": {"display_name": "owner"},
+            "tracks": {"total": 1},
+            "description": "",
+            "images": [],
+        }
+        sp.playlist_tracks.return_value = {
+            "items": [
+                {
+                    "track": {
+                        "name": "Creep",
+                        "id": "creep",
+                        "uri": "spotify:track:creep",
+                        "artists": [{"name": "Radiohead"}],
+                        "album": {
+                            "name": "Pablo Honey",
+                            "images": [],
+                            "release_date": "1993",
+                        },
+                        "popularity": 80,
+                        "duration_ms": 238000,
+                        "preview_url": None,
+                        "external_urls": {"spotify": "https://open.spotify.com"},
+                    }
+                }
+            ]
+        }
+        sp.search.return_value = {"tracks": {"items": []}}
+
+        class Subreddit:
+            async def _search(self, query, limit):
+                post = Mock(
+                    title="Recommend similar to Radiohead",
+                    selftext="",
+                    score=5,
+                    permalink="/r/music/1",
+                )
+                post.comments.replace_more = AsyncMock()
+                post.comments.list.return_value = [
+                    Mock(body="Teardrop - Massive Attack, try it", score=10, author="a")
+                ]
+                yield post
+
+            def search(self, query, limit=20):
+                return self._search(query, limit)
+
+        reddit = AsyncMock()
+        reddit.subreddit.return_value = Subreddit()
+        playlist_demand = DemandCounter()
+        playlist_demand.add("abc")
+        index = RedditIndex(":memory:")
+        catalog = SpotifyCatalogCache()
+        playlist_cache = PlaylistCache()
+
+        with patch.object(main, "playlist_demand", playlist_demand), patch.object(
+            main, "artist_demand", DemandCounter()
+        ), patch.object(main, "playlist_cache", playlist_cache), patch.object(
+            main, "spotify_catalog", catalog
+        ), patch(
+            "main.get_spotify_client", return_value=sp
+        ), patch(
+            "main.get_reddit_index", return_value=index
+        ), patch(
+            "asyncpraw.Reddit", return_value=reddit
+        ):
+            budget = RateBudget(rate=1000.0)
+            stats = await warm_caches(budget)
+            again = await warm_caches(budget)
+
+        assert stats == {
+            "playlists": 1,
+            "reddit_queries": 1,
+            "spotify_searches": 1,
+            "skipped": 0,
+        }
+        assert playlist_cache.get("abc") is not None
+        _, query = artist_seed_query("Radiohead")
+        assert index.lookup(query, "music")
+        assert catalog.get("Teardrop", "Massive Attack") == (True, None)
+        # Everything is warm now, the second round makes no calls
+        assert again == dict.fromkeys(stats, 0)
+
+    def test_playlist_cache_expires(self):
+        """Test cached playlists expire after the TTL"""
+        now = [0.0]
+        cache = PlaylistCache(ttl=10.0, clock=lambda: now[0])
+        cache.put("abc", {"tracks_data": []})
+        now[0] = 5.0
+        assert cache.age("abc") == 5.0 and cache.get("abc") is not None
+        now[0] = 10.0
+        assert cache.get("abc") is None
+
+
+class TestSnapshots:
+    """Tests for snapshots.py"""
+
+    @staticmethod
+    def spotify_track(name, artist):
+        return {
+            "name": name,
+            "id": f"id-{name}",
+            "uri": f"spotify:track:id-{name}",
+            "artists": [{"name": artist}],
+            "album": {"name": "Album", "images": [], "release_date": "2000"},
+            "popularity": len(name),
+            "duration_ms": 200000,
+            "preview_url": None,
+            "external_urls": {"spotify": "https://open.spotify.com/track/x"},
+        }
+
+    def live_clients(self):
+        """Stand-ins for the live Spotify, OpenAI and Reddit clients"""
+        sp = Mock()
+        sp.playlist.return_value = {
+            "name": "Playlist",
+            "owner": {"display_name": "owner"},
+            "tracks": {"total": 4},
+            "description": "",
+            "images": [],
+        }
+        sp.playlist_tracks.return_value = {
+            "items": [
+                {"track": self.spotify_track(f"Song {i}", f"Artist {i % 2}")}
+                for i in range(4)
+            ]
+        }
+        sp.search.side_effect = lambda q, type, limit: {
+            "tracks": {
+                "items": [
+                    self.spotify_track(
+                        q.split("track:")[1].split(" artist:")[0], q.split("artist:")[1]
+                    )
+                ]
+            }
+        }
+
+        openai_client = Mock()
+        openai_client.with_options.return_value = openai_client
+        openai_client.chat.completions.create.return_value = Mock(
+            choices=[
+                Mock(
+                    message=Mock(
+                        content=json.dumps(
+                            [{"song": f"Pick {i}", "artist": "New"} for i in range(12)]
+                        )
+                    )
+                )
+            ]
+        )
+
+        class Subreddit:
+            async def _search(self, query, limit):
+                post = Mock(
+                    title=f"Recommend similar to {query}",
+                    selftext="",
+                    score=20,
+                    permalink=f"/r/music/{query}",
+                )
+                post.comments.replace_more = AsyncMock()
+                post.comments.list.return_value = [
+                    Mock(body="Try Pick 1 - New", score=15, author="user")
+                ]
+                yield post
+
+            def search(self, query, limit=20):
+                return self._search(query, limit)
+
+        reddit = AsyncMock()
+        reddit.__aenter__.return_value = reddit
+        reddit.subreddit.return_value = Subreddit()
+        return sp, openai_client, reddit
+
+    @pytest.mark.asyncio
+    async def test_export_and_replay_round_trip(self, tmp_path):
+        """Test a recorded run replays offline with the same results"""
+        sp, openai_client, reddit = self.live_clients()
+        with patch("main.get_spotify_client", return_value=sp), patch(
+            "main.get_openai_client", return_value=openai_client
+        ), patch("asyncpraw.Reddit", return_value=reddit):
+            snapshot = await export_snapshot(
+                "https://open.spotify.com/playlist/abc",
+                overrides={"max_extra_subreddits": 0},
+            )
+
+        path = str(tmp_path / f"abc{SNAPSHOT_SUFFIX}")
+        save_snapshot(snapshot, path)
+        loaded = load_snapshot(path)
+        assert snapshot_paths([str(tmp_path)]) == [path]
+        assert loaded["expected"]["recommendations"]
+        assert loaded["expected"] == loaded["recorded"]
+
+        # Replays never touch the live clients
+        with patch("main.get_spotify_client") as get_sp, patch(
+            "asyncpraw.Reddit"
+        ) as reddit_cls:
+            replay = await replay_snapshot(loaded)
+        get_sp.assert_not_called()
+        reddit_cls.assert_not_called()
+        assert replay["matches"] is True
+        # Spotify searches cancelled while recording (enough tracks found)
+        # may run before the cancel offline, they just find nothing
+        assert replay["misses"]["reddit"] == replay["misses"]["openai"] == 0
+        assert replay["calls"]["openai"] == 1
+
+    @pytest.mark.asyncio
+    async def test_replay_reports_changed_results(self):
+        """Test a snapshot whose baseline differs is reported as changed"""
+        sp, openai_client, reddit = self.live_clients()
+        with patch("main.get_spotify_client", return_value=sp), patch(
+            "main.get_openai_client", return_value=openai_client
+        ), patch("asyncpraw.Reddit", return_value=reddit):
+            snapshot = await export_snapshot("https://open.spotify.com/playlist/abc")
+
+        snapshot["expected"]["recommendations"] = ["spotify:track:other"]
+        replay = await replay_snapshot(snapshot)
+        assert replay["matches"] is False
+
+    @pytest.mark.asyncio
+    async def test_replay_misses_never_open_shared_circuit(self):
+        """Test replays use their own upstreams and misses aren't outages"""
+        import main
+
+        sp, openai_client, reddit = self.live_clients()
+        with patch("main.get_spotify_client", return_value=sp), patch(
+            "main.get_openai_client", return_value=openai_client
+        ), patch("asyncpraw.Reddit", return_value=reddit):
+            snapshot = await export_snapshot("https://open.spotify.com/playlist/abc")
+
+        # Production code never depends on the snapshot tooling
+        assert not hasattr(sys.modules["spotify_api"], "SnapshotMissError")
+        assert not is_spotify_outage(SpotifySnapshotMissError("not recorded"))
+        snapshot["spotify"] = [
+            call for call in snapshot["spotify"] if "playlist_tracks" not in call["key"]
+        ]
+        for _ in range(main.CIRCUIT_FAILURE_THRESHOLD + 1):
+            with pytest.raises(SnapshotMissError):
+                await replay_snapshot(snapshot)
+        assert main.spotify_upstream.available
+
 
 class TestMainOrchestrator:
     """Tests for main.py orchestrator"""
@@ -100,6 +1811,14 @@ class TestMainOrchestrator:
         assert NUM_RECOMMENDATIONS == 5
         assert SUBREDDIT_NAME == "music"
 
+    def test_health_cold_start_skips_sdks(self):
+        """Test /api/health answers in a fresh process without loading the SDKs"""
+        from cold_start_benchmark import measure_cold_start
+
+        result = measure_cold_start("/api/health", runs=1)
+        assert result["statuses"] == [200]
+        assert result["heavy_modules_loaded"] == []
+
     @pytest.mark.asyncio
     async def test_get_recommendations_structure(self):
         """Test get_recommendations returns proper structure"""
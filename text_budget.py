@@ -0,0 +1,87 @@
+"""
+Text Budget Module
+Keeps the Reddit text held per request small and bounded:
+- UTF-8 byte budgets applied at ingestion (cut on a character boundary,
+  on a word boundary when one is close)
+- zlib compression of the text kept for caching (the local Reddit index)
+- Size accounting, so a request's Reddit text has a known upper bound
+"""
+
+import zlib
+from typing import Any, Dict, Optional, Union
+
+# Reddit titles are at most 300 characters, 4 bytes each at worst
+MAX_TITLE_BYTES: int = 1200
+
+# Reddit usernames are at most 20 ASCII characters
+MAX_AUTHOR_BYTES: int = 20
+
+# Ingestion defaults: the prompt excerpts use the first 300/200 characters,
+# the rest is there for song extraction
+DEFAULT_MAX_BODY_BYTES: int = 2000
+DEFAULT_MAX_COMMENT_BYTES: int = 1000
+
+COMPRESSION_LEVEL: int = 6
+
+
+def truncate_utf8(text: str, max_bytes: Optional[int]) -> str:
+    """
+    Cut text to at most max_bytes of UTF-8 (None = no limit)
+
+    Never splits a character. The cut moves back to the last whitespace if
+    that loses at most a quarter of the budget, so words stay whole.
+    """
+    # 4 bytes per character at most, short text needs no encoding
+    if max_bytes is None or len(text) * 4 <= max_bytes:
+        return text
+    encoded = text.encode("utf-8")
+    if len(encoded) <= max_bytes:
+        return text
+    cut = encoded[:max_bytes].decode("utf-8", errors="ignore")
+    space = max(cut.rfind(" "), cut.rfind("\n"))
+    if space >= len(cut) * 3 // 4:
+        cut = cut[:space]
+    return cut
+
+
+def compress_text(text: str) -> Union[bytes, str]:
+    """
+    zlib-compressed UTF-8 text, or the text itself when compressing
+    wouldn't make it smaller (short comments)
+    """
+    encoded = text.encode("utf-8")
+    compressed = zlib.compress(encoded, COMPRESSION_LEVEL)
+    return compressed if len(compressed) < len(encoded) else text
+
+
+def decompress_text(value: Union[bytes, str]) -> str:
+    """Inverse of compress_text (plain text is returned as is)"""
+    if isinstance(value, str):
+        return value
+    return zlib.decompress(value).decode("utf-8")
+
+
+def text_bytes(post_data: Dict[str, Any]) -> int:
+    """UTF-8 bytes of a post's title, body and comments (bodies and authors)"""
+    return sum(
+        len(text.encode("utf-8"))
+        for text in (
+            post_data["title"],
+            post_data["body"],
+            *(comment["body"] for comment in post_data["comments"]),
+            *(comment["author"] for comment in post_data["comments"]),
+        )
+    )
+
+
+def post_bytes_bound(
+    max_comments: int,
+    max_body_bytes: int = DEFAULT_MAX_BODY_BYTES,
+    max_comment_bytes: int = DEFAULT_MAX_COMMENT_BYTES,
+) -> int:
+    """Most text_bytes a post ingested with these limits can have"""
+    return (
+        MAX_TITLE_BYTES
+        + max_body_bytes
+        + max_comments * (max_comment_bytes + MAX_AUTHOR_BYTES)
+    )
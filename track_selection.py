@@ -0,0 +1,187 @@
+"""
+Track Selection Module
+Picks the diverse track/artist seeds used for Reddit searches (Step 3):
+- Top, bottom and random tracks via partial (heap) selection
+- Artist weights (track count and mean popularity) computed in one pass
+"""
+
+import heapq
+import random
+from typing import Dict, List, Any, Callable, Optional, Sequence, Tuple
+from track_store import TrackStore
+
+
+def make_rng(seed: Optional[int] = None) -> random.Random:
+    """
+    Create the random generator used for the "random" part of the selection
+
+    Args:
+        seed: Optional seed, pass the same seed to reproduce a run
+
+    Returns:
+        Random generator object
+    """
+    return random.Random(seed)
+
+
+def _columns(
+    tracks_data: Sequence[Dict[str, Any]]
+) -> Tuple[Sequence[Sequence[str]], Sequence[int]]:
+    """Return (artists, popularity) columns, read directly from a TrackStore"""
+    if isinstance(tracks_data, TrackStore):
+        return tracks_data.artists, tracks_data.popularity
+    return (
+        [track["artists"] for track in tracks_data],
+        [track["popularity"] or 0 for track in tracks_data],
+    )
+
+
+def compute_artist_weights(
+    tracks_data: Sequence[Dict[str, Any]]
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Compute per-artist weights in a single pass over the playlist
+
+    Args:
+        tracks_data: TrackStore or list of track dictionaries from Spotify
+
+    Returns:
+        dict: Artist name -> {"track_count", "mean_popularity"}
+              (in first-seen playlist order)
+    """
+    weights: Dict[str, Dict[str, Any]] = {}
+    artists_column, popularity_column = _columns(tracks_data)
+
+    for artists, popularity in zip(artists_column, popularity_column):
+        for artist in artists:
+            entry = weights.get(artist)
+            if entry is None:
+                entry = weights[artist] = {"track_count": 0, "popularity_sum": 0}
+            entry["track_count"] += 1
+            entry["popularity_sum"] += popularity
+
+    for entry in weights.values():
+        entry["mean_popularity"] = entry.pop("popularity_sum") / entry["track_count"]
+
+    return weights
+
+
+def _split_top_bottom_random(
+    size: int,
+    key: Callable[[int], Tuple],
+    num_top: int,
+    num_bottom: int,
+    num_random: int,
+    rng: random.Random,
+) -> List[int]:
+    """
+    Pick top, bottom and random positions out of range(size)
+
+    The key must end with a unique tie-breaker so results are deterministic.
+    Only the top/bottom candidates are ordered (heap selection), the rest of
+    the list is never sorted.
+
+    Returns:
+        list: Selected positions (top, then bottom, then random)
+    """
+    positions = range(size)
+    top = heapq.nlargest(num_top, positions, key=key)
+    bottom = heapq.nsmallest(num_bottom, positions, key=key)
+    # Keep bottom in the same "most popular first" order a full sort would give
+    bottom.reverse()
+
+    taken = set(top) | set(bottom)
+    middle = [pos for pos in positions if pos not in taken]
+    if len(middle) >= num_random:
+        random_picks = rng.sample(middle, num_random)
+    else:
+        random_picks = middle
+
+    return top + bottom + random_picks
+
+
+def select_tracks(
+    tracks_data: Sequence[Dict[str, Any]],
+    num_top: int = 3,
+    num_bottom: int = 3,
+    num_random: int = 3,
+    rng: Optional[random.Random] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Select top (most popular), bottom (least popular) and random tracks
+
+    Args:
+        tracks_data: TrackStore or list of track dictionaries from Spotify
+        num_top: Number of most popular tracks to select
+        num_bottom: Number of least popular tracks to select
+        num_random: Number of random tracks to select from the rest
+        rng: Random generator (see make_rng), unseeded if not given
+
+    Returns:
+        list: Selected tracks (top + bottom + random)
+    """
+    rng = rng or make_rng()
+
+    if len(tracks_data) < num_top + num_bottom + num_random:
+        print(
+            f"   Warning: Playlist has only {len(tracks_data)} tracks, need {num_top + num_bottom + num_random} for diverse selection"
+        )
+        print(f"   Using available tracks...")
+        return list(tracks_data)
+
+    _, popularity = _columns(tracks_data)
+    positions = _split_top_bottom_random(
+        len(popularity),
+        # Earlier playlist position wins ties
+        lambda pos: (popularity[pos], -pos),
+        num_top,
+        num_bottom,
+        num_random,
+        rng,
+    )
+    return [tracks_data[pos] for pos in positions]
+
+
+def select_artists(
+    tracks_data: Sequence[Dict[str, Any]],
+    num_top: int = 2,
+    num_bottom: int = 2,
+    num_random: int = 2,
+    rng: Optional[random.Random] = None,
+    artist_weights: Optional[Dict[str, Dict[str, Any]]] = None,
+) -> List[str]:
+    """
+    Select top, bottom and random artists ranked by playlist weight
+    (track count, then mean popularity)
+
+    Args:
+        tracks_data: TrackStore or list of track dictionaries from Spotify
+        num_top: Number of top artists to select
+        num_bottom: Number of bottom artists to select
+        num_random: Number of random artists to select from the rest
+        rng: Random generator (see make_rng), unseeded if not given
+        artist_weights: Precomputed compute_artist_weights() result
+
+    Returns:
+        list: Selected artist names (top + bottom + random)
+    """
+    rng = rng or make_rng()
+    weights = artist_weights or compute_artist_weights(tracks_data)
+    artists = list(weights)
+
+    if len(artists) < num_top + num_bottom + num_random:
+        print(
+            f"   Warning: Playlist has only {len(artists)} unique artists, need {num_top + num_bottom + num_random} for diverse selection"
+        )
+        print(f"   Using available artists...")
+        return artists
+
+    # Artists are in first-seen order, so earlier artists win ties
+    keys = [
+        (weights[artist]["track_count"], weights[artist]["mean_popularity"], -pos)
+        for pos, artist in enumerate(artists)
+    ]
+    positions = _split_top_bottom_random(
+        len(keys), keys.__getitem__, num_top, num_bottom, num_random, rng
+    )
+    return [artists[pos] for pos in positions]
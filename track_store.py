@@ -0,0 +1,158 @@
+"""
+Track Store Module
+Compact columnar storage for playlist tracks (Step 2 output):
+- One column (list/array) per field instead of one dict per track
+- Artist names interned, artist tuples shared between tracks
+- Popularity kept as a numeric array for selection
+- Dict-like TrackView rows for existing callers (track["name"], ...)
+"""
+
+import sys
+from array import array
+from collections.abc import Mapping
+from typing import Dict, List, Any, Iterator, Optional, Sequence, Tuple
+
+# Keys every TrackView exposes (same keys the old per-track dicts had)
+TRACK_FIELDS: Tuple[str, ...] = (
+    "name",
+    "artists",
+    "artist_names",
+    "album",
+    "id",
+    "uri",
+    "popularity",
+    "preview_url",
+    "external_url",
+    "album_image",
+)
+
+
+class TrackView(Mapping):
+    """Read-only dict-like view of one row in a TrackStore"""
+
+    __slots__ = ("_store", "_index")
+
+    def __init__(self, store: "TrackStore", index: int):
+        self._store = store
+        self._index = index
+
+    def __getitem__(self, key: str) -> Any:
+        return self._store.get_field(self._index, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(TRACK_FIELDS)
+
+    def __len__(self) -> int:
+        return len(TRACK_FIELDS)
+
+    def __repr__(self) -> str:
+        return f"TrackView({dict(self)!r})"
+
+
+class TrackStore:
+    """
+    Columnar track list
+
+    Behaves like a read-only list of track dicts (len, indexing, iteration)
+    while storing each field as a parallel column.
+    """
+
+    __slots__ = (
+        "names",
+        "artists",
+        "albums",
+        "ids",
+        "uris",
+        "popularity",
+        "preview_urls",
+        "external_urls",
+        "album_images",
+        "_artist_tuples",
+    )
+
+    def __init__(self):
+        self.names: List[str] = []
+        self.artists: List[Tuple[str, ...]] = []
+        self.albums: List[str] = []
+        self.ids: List[Optional[str]] = []
+        self.uris: List[Optional[str]] = []
+        self.popularity = array("B")  # Spotify popularity is 0-100
+        self.preview_urls: List[Optional[str]] = []
+        self.external_urls: List[Optional[str]] = []
+        self.album_images: List[Optional[str]] = []
+        self._artist_tuples: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+
+    def append_spotify_track(self, track: Dict[str, Any]) -> int:
+        """
+        Add a track object from the Spotify API
+
+        Args:
+            track: Track object (item["track"] from playlist_tracks)
+
+        Returns:
+            int: Row index of the new track
+        """
+        artists = tuple(sys.intern(artist["name"]) for artist in track["artists"])
+        # Tracks by the same artist(s) share one tuple
+        artists = self._artist_tuples.setdefault(artists, artists)
+
+        self.names.append(track["name"])
+        self.artists.append(artists)
+        self.albums.append(sys.intern(track["album"]["name"]))
+        self.ids.append(track["id"])
+        self.uris.append(track["uri"])
+        self.popularity.append(track["popularity"] or 0)
+        self.preview_urls.append(track["preview_url"])
+        self.external_urls.append(track.get("external_urls", {}).get("spotify", None))
+        self.album_images.append(
+            track["album"]["images"][0]["url"] if track["album"]["images"] else None
+        )
+        return len(self.names) - 1
+
+    def get_field(self, index: int, key: str) -> Any:
+        """Read one field of one row (used by TrackView)"""
+        if key == "name":
+            return self.names[index]
+        if key == "artists":
+            return list(self.artists[index])
+        if key == "artist_names":
+            return ", ".join(self.artists[index])
+        if key == "album":
+            return self.albums[index]
+        if key == "id":
+            return self.ids[index]
+        if key == "uri":
+            return self.uris[index]
+        if key == "popularity":
+            return self.popularity[index]
+        if key == "preview_url":
+            return self.preview_urls[index]
+        if key == "external_url":
+            return self.external_urls[index]
+        if key == "album_image":
+            return self.album_images[index]
+        raise KeyError(key)
+
+    def take(self, indices: Sequence[int]) -> List[TrackView]:
+        """Return the rows at the given indices"""
+        return [TrackView(self, index) for index in indices]
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        """Materialize every row as a plain dict (e.g. for JSON output)"""
+        return [dict(row) for row in self]
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.take(range(*index.indices(len(self))))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("track index out of range")
+        return TrackView(self, index)
+
+    def __iter__(self) -> Iterator[TrackView]:
+        for index in range(len(self)):
+            yield TrackView(self, index)